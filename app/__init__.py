@@ -3,12 +3,12 @@ from dotenv import load_dotenv
 import os
 from zoneinfo import ZoneInfo
 from flask.cli import with_appcontext
-from .auth import load_current_teacher
 from .dirig import bp as dirig_bp
 from datetime import datetime, timedelta
-from .db import get_connection
+from .db import get_connection, get_db
 import csv
 from .utils import aware_from_hhmm
+from .timetable import bump_timetable_version, get_timetable
 
 
 def create_app():
@@ -26,6 +26,9 @@ def create_app():
     app.config["TZ"] = ZoneInfo(app.config["TIMEZONE"])
     app.config["QR_SALT"] = os.getenv("QR_SALT", "qr-signing-v1")
     app.config["QR_MAX_AGE"] = int(os.getenv("QR_MAX_AGE", "900"))  # secunde
+    app.config["QR_ROTATE_S"] = int(os.getenv("QR_ROTATE_S", "60"))  # tokenul QR se schimbă o dată pe epocă
+    # "server" = /qr.png (qrcode + Pillow); "client" = desenat în browser (static/js/qr.js)
+    app.config["QR_RENDER_MODE"] = os.getenv("QR_RENDER_MODE", "server").lower()
 
     app.config["CHECKIN_OPEN_MIN_BEFORE"] = int(os.getenv("CHECKIN_OPEN_MIN_BEFORE", "5"))
     app.config["CHECKIN_CLOSE_MIN_AFTER"] = int(os.getenv("CHECKIN_CLOSE_MIN_AFTER", "10"))
@@ -33,8 +36,88 @@ def create_app():
     app.config["CHECKOUT_GRACE_MIN_AFTER_END"] = int(os.getenv("CHECKOUT_GRACE_MIN_AFTER_END", "5"))
     app.config["SESSION_LENGTH_MIN"] = int(os.getenv("SESSION_LENGTH_MIN", "50"))
 
+    # SQLite: o conexiune per context, deschisă o singură dată și reglată
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    app.config["SQLITE_CACHE_SIZE_KB"] = int(os.getenv("SQLITE_CACHE_SIZE_KB", "8192"))
+    app.config["SQLITE_MMAP_SIZE"] = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+    app.config["SQLITE_STATEMENT_CACHE"] = int(os.getenv("SQLITE_STATEMENT_CACHE", "128"))
+
+    # Rate limit scanări: token bucket per (sesiune, dispozitiv).
+    # "memory" = per proces; "sqlite" = comun tuturor worker-ilor gunicorn.
+    app.config["RATE_LIMIT_ATTEMPTS"] = int(os.getenv("RATE_LIMIT_ATTEMPTS", "3"))
+    app.config["RATE_LIMIT_WINDOW_S"] = int(os.getenv("RATE_LIMIT_WINDOW_S", "60"))
+    app.config["RATE_LIMIT_BACKEND"] = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+
+    # Monitor prin Server-Sent Events (fallback: polling). Fiecare ecran ține un
+    # worker ocupat, deci pornește doar cu gunicorn --worker-class gthread/gevent.
+    app.config["MONITOR_STREAM_ENABLED"] = os.getenv("MONITOR_STREAM_ENABLED", "false").lower() == "true"
+    app.config["MONITOR_STREAM_POLL_S"] = float(os.getenv("MONITOR_STREAM_POLL_S", "1"))
+    app.config["MONITOR_STREAM_HEARTBEAT_S"] = float(os.getenv("MONITOR_STREAM_HEARTBEAT_S", "15"))
+    app.config["MONITOR_STREAM_MAX_S"] = float(os.getenv("MONITOR_STREAM_MAX_S", "600"))
+
+    # /api/monitor_status?since=<cursor>: peste atâtea versiuni întârziere → snapshot complet
+    app.config["MONITOR_CURSOR_MAX_LAG"] = int(os.getenv("MONITOR_CURSOR_MAX_LAG", "200"))
+
+    # attempt_log scris în fundal, în loturi ("async") sau direct în request ("sync")
+    app.config["ATTEMPT_LOG_MODE"] = os.getenv("ATTEMPT_LOG_MODE", "async").lower()
+    app.config["ATTEMPT_LOG_QUEUE_MAX"] = int(os.getenv("ATTEMPT_LOG_QUEUE_MAX", "5000"))
+    app.config["ATTEMPT_LOG_BATCH"] = int(os.getenv("ATTEMPT_LOG_BATCH", "500"))
+    app.config["ATTEMPT_LOG_FLUSH_MS"] = int(os.getenv("ATTEMPT_LOG_FLUSH_MS", "200"))
+
+    # retenție attempt_log: rândurile mai vechi de N zile → agregate zilnice + arhive lunare .sqlite.gz
+    # (0 = păstrează tot); rulează zilnic după RETENTION_HOUR din ciclul de viață, sau `flask retention`
+    app.config["ATTEMPT_RETENTION_DAYS"] = int(os.getenv("ATTEMPT_RETENTION_DAYS", "0"))
+    app.config["ATTEMPT_ARCHIVE_DIR"] = os.getenv("ATTEMPT_ARCHIVE_DIR")  # implicit instance/archive
+    app.config["RETENTION_HOUR"] = int(os.getenv("RETENTION_HOUR", "3"))
+    app.config["RETENTION_BATCH"] = int(os.getenv("RETENTION_BATCH", "2000"))
+    app.config["RETENTION_PAUSE_MS"] = int(os.getenv("RETENTION_PAUSE_MS", "50"))
+
+    # profesorul logat (doar pe /diriginti) e reîncărcat din DB cel mult o dată la N secunde
+    app.config["TEACHER_CACHE_TTL_S"] = float(os.getenv("TEACHER_CACHE_TTL_S", "60"))
+
+    # rânduri de raport păstrate în memorie pentru sesiunile încheiate (LRU, per proces)
+    app.config["REPORT_CACHE_MAX_ROWS"] = int(os.getenv("REPORT_CACHE_MAX_ROWS", "50000"))
+
+    # orarul compilat în memorie verifică meta.timetable_version cel mult o dată la N secunde
+    app.config["TIMETABLE_RECHECK_S"] = float(os.getenv("TIMETABLE_RECHECK_S", "30"))
+
     app.config.setdefault("AUTO_SESSIONS_ENABLED", os.getenv("AUTO_SESSIONS_ENABLED", "false").lower() == "true")
 
+    # /metrics (Prometheus), opt-in: cronometrează fiecare instrucțiune SQL (sqltrace).
+    # Cu mai mulți worker-i gunicorn, METRICS_DIR = director comun
+    # unde fiecare proces își scrie contoarele la METRICS_FLUSH_S secunde
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    app.config["METRICS_DIR"] = os.getenv("METRICS_DIR")
+    app.config["METRICS_FLUSH_S"] = float(os.getenv("METRICS_FLUSH_S", "5"))
+    app.config["METRICS_TOKEN"] = os.getenv("METRICS_TOKEN")  # Authorization: Bearer <token>; fără el, doar în debug
+
+    # jurnal de interogări lente (0 = oprit): log + EXPLAIN + agregat zilnic în SLOW_QUERY_DB
+    app.config["SLOW_QUERY_MS"] = float(os.getenv("SLOW_QUERY_MS", "0"))
+    app.config["SLOW_QUERY_DB"] = os.getenv("SLOW_QUERY_DB")  # implicit instance/slow_queries.db
+    app.config["SLOW_QUERY_KEEP_DAYS"] = int(os.getenv("SLOW_QUERY_KEEP_DAYS", "30"))
+
+    # profilare la cerere (X-Profile: cpu|mem): cu PROFILE_SECRET sau, opt-in, sesiune de diriginte
+    app.config["PROFILE_SECRET"] = os.getenv("PROFILE_SECRET")
+    app.config["PROFILE_ALLOW_TEACHER"] = os.getenv("PROFILE_ALLOW_TEACHER", "false").lower() == "true"
+    app.config["PROFILE_DIR"] = os.getenv("PROFILE_DIR")  # implicit instance/profiles
+    app.config["PROFILE_KEEP"] = int(os.getenv("PROFILE_KEEP", "50"))
+
+    # creare sesiuni / freeze / închidere: "thread" = în procesul web, "off" = rulezi `flask run-scheduler`
+    app.config["LIFECYCLE_SCHEDULER"] = os.getenv("LIFECYCLE_SCHEDULER", "thread").lower()
+    app.config["LIFECYCLE_TICK_S"] = float(os.getenv("LIFECYCLE_TICK_S", "30"))
+
+    from . import db as dbmod
+    dbmod.init_app(app)
+    from . import lifecycle
+    lifecycle.init_app(app)
+
+    from . import metrics
+    metrics.init_app(app)
+    from . import slowlog
+    slowlog.init_app(app)
+    from . import profiling
+    profiling.init_app(app)
+
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
 
@@ -44,7 +127,6 @@ def create_app():
 
     # ---- CLI commands ----
     import click
-    from . import db as dbmod
 
     @app.cli.command("init-db")
     @with_appcontext
@@ -128,6 +210,7 @@ def create_app():
         cur = conn.cursor()
         for no, hhmm in slots:
             cur.execute("INSERT OR REPLACE INTO period(period_no, start_hhmm) VALUES(?,?)", (no, hhmm))
+        bump_timetable_version(cur)
         conn.commit();
         conn.close()
         click.echo("OK: periods seeded")
@@ -206,14 +289,15 @@ def create_app():
                 skipped += 1
                 continue
 
+        bump_timetable_version(cur)
         conn.commit();
         conn.close()
         click.echo(f"Import schedule: ok={inserted}, skipped={skipped}")
 
-    def _gen_session_for(class_id: str, date_obj, start_hhmm: str, tz):
+    def _gen_session_for(class_id: str, date_obj, start_hhmm: str, tz, length_min: int = 60):
         """Creează sesiune (dacă lipsește) pentru clasa dată, în ziua/ora dată."""
         starts = aware_from_hhmm(date_obj, start_hhmm, tz)
-        ends = starts + timedelta(minutes=60)
+        ends = starts + timedelta(minutes=length_min)
         conn = get_connection();
         cur = conn.cursor()
         try:
@@ -245,28 +329,211 @@ def create_app():
             click.echo("Zi nelucrătoare (Sa/Du) – nimic de generat.");
             return
 
-        conn = get_connection();
-        cur = conn.cursor()
-        cur.execute("SELECT period_no, start_hhmm FROM period ORDER BY period_no")
-        periods = cur.fetchall()
-        cur.execute("SELECT weekday, period_no, class_id FROM schedule WHERE weekday=? ORDER BY period_no", (weekday,))
-        sched = {(r["period_no"]): r["class_id"] for r in cur.fetchall()}
-        conn.close()
+        slots = get_timetable(get_db()).slots_for(date_obj)
+        if not slots:
+            click.echo("Nimic programat (vacanță sau orar gol).")
 
         created = 0
-        for p in periods:
-            cls = sched.get(p["period_no"])
-            if not cls: continue
+        for slot in slots:
             if dry_run:
-                click.echo(f"would create: {date_obj} {p['start_hhmm']} class {cls}")
+                click.echo(f"would create: {date_obj} {slot.start_hhmm} class {slot.class_id}")
             else:
-                sid = _gen_session_for(cls, date_obj, p["start_hhmm"], tz)
+                sid = _gen_session_for(slot.class_id, date_obj, slot.start_hhmm, tz, slot.length_min)
                 if sid: created += 1
         click.echo(f"Done. sessions created or already present: {created}")
 
-    @app.before_request
-    def _load_teacher():
-        load_current_teacher()
+    @app.cli.command("add-holiday")
+    @with_appcontext
+    @click.option("--from", "date_from", required=True, help="YYYY-MM-DD")
+    @click.option("--to", "date_to", help="YYYY-MM-DD (inclusiv; default = --from)")
+    @click.option("--note", default=None, help="ex. 'Vacanța de iarnă'")
+    @click.option("--remove", is_flag=True, help="Șterge zilele din intervalul dat")
+    def add_holiday_cmd(date_from, date_to, note, remove):
+        """Marchează (sau demarchează) zile fără ore; monitorul nu caută sesiuni în ele."""
+        first = datetime.strptime(date_from, "%Y-%m-%d").date()
+        last = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else first
+        days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+        if not days:
+            raise click.ClickException("--to e înainte de --from")
+
+        conn = get_db()
+        cur = conn.cursor()
+        if remove:
+            cur.executemany("DELETE FROM holiday WHERE day=?", [(d,) for d in days])
+        else:
+            cur.executemany(
+                "INSERT INTO holiday(day, note) VALUES (?,?) ON CONFLICT(day) DO UPDATE SET note=excluded.note",
+                [(d, note) for d in days],
+            )
+        bump_timetable_version(cur)
+        conn.commit()
+        click.echo(f"OK: {len(days)} zi(le) {'șterse' if remove else 'marcate'} ({days[0]} .. {days[-1]})")
+
+    @app.cli.command("migrate")
+    @with_appcontext
+    @click.option("--dry-run", is_flag=True, help="Doar afișează pașii, rândurile atinse și timpul estimat")
+    @click.option("--batch-size", type=int, default=5000, show_default=True, help="Rânduri per tranzacție la copieri")
+    @click.option("--pause-ms", type=int, default=0, show_default=True, help="Pauză între loturi (lasă loc check-in-urilor)")
+    def migrate_cmd(dry_run, batch_size, pause_ms):
+        """Aplică migrările de schemă în așteptare (PRAGMA user_version)."""
+        from . import migrations
+        conn = get_db()
+        version = migrations.current_version(conn)
+        if dry_run:
+            steps = migrations.plan(conn)
+            click.echo(f"Schema la versiunea {version}, ultima: {migrations.LATEST}")
+            for p in steps:
+                click.echo(f"  [{p['version']}] {p['name']}: ~{p['rows']} rânduri, ~{p['est_s']:.2f}s")
+            if not steps:
+                click.echo("Nimic de aplicat.")
+            return
+        applied = dbmod.init_db(batch_size=batch_size, pause_s=pause_ms / 1000, echo=click.echo)
+        click.echo(f"OK: {len(applied)} migrări aplicate, schema la versiunea {migrations.LATEST}")
+
+    @app.cli.command("check-query-plans")
+    @click.option("--classes", type=int, default=24, show_default=True)
+    @click.option("--roster", type=int, default=28, show_default=True, help="Coduri per clasă")
+    @click.option("--days", type=int, default=120, show_default=True, help="Zile de istoric în baza sintetică")
+    @click.option("--keep", type=click.Path(dir_okay=False), help="Păstrează baza sintetică la calea dată")
+    @click.option("-v", "--verbose", is_flag=True, help="Afișează planul fiecărei interogări")
+    def check_query_plans_cmd(classes, roster, days, keep, verbose):
+        """EXPLAIN QUERY PLAN pe toate interogările fluxurilor; eșuează dacă vreuna citește o tabelă integral."""
+        from .queryplan import check_query_plans
+        stmts = check_query_plans(classes=classes, roster=roster, days=days, keep=keep, echo=click.echo)
+        bad = [s for s in stmts if s.scans]
+        for s in stmts:
+            if verbose or s.scans:
+                click.echo(f"{'SCAN' if s.scans else 'ok  '} {s.where}  {' '.join(s.sql.split())[:160]}")
+                for line in s.plan:
+                    click.echo(f"       {line}")
+        click.echo(f"{len(stmts)} interogări verificate, {len(bad)} cu citire completă de tabelă")
+        if bad:
+            raise SystemExit(1)
+
+    @app.cli.command("slow-queries")
+    @click.option("--days", type=int, default=7, show_default=True, help="Fereastra, în zile (inclusiv azi)")
+    @click.option("--top", type=int, default=20, show_default=True)
+    @click.option("--plan/--no-plan", "show_plan", default=True, help="Afișează ultimul EXPLAIN QUERY PLAN")
+    def slow_queries_cmd(days, top, show_plan):
+        """Top interogări lente (timp total) din agregatul SLOW_QUERY_DB."""
+        from . import slowlog
+        since = (datetime.now(app.config["TZ"]).date() - timedelta(days=days - 1)).isoformat()
+        rows = slowlog.top_queries(slowlog.slow_db_path(), since_day=since, top=top)
+        if not rows:
+            click.echo(f"Nicio interogare lentă din {since} (SLOW_QUERY_MS={app.config['SLOW_QUERY_MS']:g}).")
+            return
+        for i, q in enumerate(rows, 1):
+            click.echo(f"{i:>2}. {q.total_s * 1000:9.1f} ms total  {q.calls:>5} apeluri"
+                       f"  medie {q.total_s / q.calls * 1000:.1f} ms  max {q.max_s * 1000:.1f} ms")
+            click.echo(f"    {q.route}  {q.caller}  params={q.params}")
+            click.echo(f"    {q.sql[:300]}")
+            if show_plan:
+                for line in q.plan:
+                    click.echo(f"      {line}")
+
+    @app.cli.command("loadtest")
+    @click.option("--classes", type=int, default=4, show_default=True, help="Clase care încep ora simultan")
+    @click.option("--roster", type=int, default=28, show_default=True, help="Elevi (coduri) per clasă")
+    @click.option("--arrival", type=click.Choice(["burst", "uniform", "poisson"]), default="burst", show_default=True,
+                  help="Distribuția sosirilor: burst = majoritatea în primele secunde")
+    @click.option("--window", "window_s", type=float, default=60, show_default=True, help="Secunde în care sosesc elevii")
+    @click.option("--stay", "stay_s", type=float, default=20, show_default=True, help="Pauză max. până la check-out (s)")
+    @click.option("--no-checkout", is_flag=True, help="Doar check-in")
+    @click.option("--double-tap", type=float, default=0.05, show_default=True, help="Fracția de elevi care trimit de două ori")
+    @click.option("--monitors", type=int, help="Monitoare în polling (implicit unul per clasă)")
+    @click.option("--poll-s", type=float, default=3, show_default=True)
+    @click.option("--workers", type=int, default=2, show_default=True, help="Worker-i gunicorn")
+    @click.option("--threads", type=int, default=8, show_default=True, help="Thread-uri per worker (gthread)")
+    @click.option("--history-days", type=int, default=20, show_default=True, help="Zile de istoric în baza de lucru")
+    @click.option("--keep", type=click.Path(file_okay=False), help="Păstrează directorul de lucru (DB, log gunicorn)")
+    @click.option("--seed", type=int, default=1, show_default=True)
+    def loadtest_cmd(classes, roster, arrival, window_s, stay_s, no_checkout, double_tap, monitors, poll_s,
+                     workers, threads, history_days, keep, seed):
+        """Val de scanări /elev pe un gunicorn local și o bază de lucru; latențe, „ocupat", nepotriviri."""
+        from .loadtest import format_report, run_loadtest
+        try:
+            res = run_loadtest(app, classes=classes, roster=roster, arrival=arrival, window_s=window_s,
+                               stay_s=stay_s, checkout=not no_checkout, double_tap=double_tap, monitors=monitors,
+                               poll_s=poll_s, workers=workers, threads=threads, history_days=history_days,
+                               keep=keep, seed=seed, echo=click.echo)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        for line in format_report(res):
+            click.echo(line)
+        if res.mismatches:
+            raise SystemExit(1)
+
+    @app.cli.command("rebuild-summary")
+    @with_appcontext
+    def rebuild_summary_cmd():
+        """Recalculează session_summary din attendance + authorized_code."""
+        n = dbmod.rebuild_session_summary(get_db())
+        click.echo(f"OK: session_summary reconstruit ({n} sesiuni)")
+
+    @app.cli.command("retention")
+    @with_appcontext
+    @click.option("--days", type=int, help="Păstrează atâtea zile în attempt_log (implicit ATTEMPT_RETENTION_DAYS)")
+    @click.option("--batch", type=int, help="Rânduri șterse per tranzacție")
+    @click.option("--pause-ms", type=int, help="Pauză între loturile de ștergere")
+    def retention_cmd(days, batch, pause_ms):
+        """Arhivează attempt_log-ul vechi (agregate zilnice + arhive lunare) și îl șterge din tabela vie."""
+        from . import retention
+        cfg = app.config
+        days = days if days is not None else cfg["ATTEMPT_RETENTION_DAYS"]
+        if days <= 0:
+            raise click.ClickException("Setează --days sau ATTEMPT_RETENTION_DAYS (> 0)")
+        res = retention.run_retention(
+            get_db(), tz=cfg["TZ"], keep_days=days, directory=retention.archive_dir(),
+            batch=batch or cfg["RETENTION_BATCH"],
+            pause_s=(pause_ms if pause_ms is not None else cfg["RETENTION_PAUSE_MS"]) / 1000,
+            echo=click.echo,
+        )
+        if res is None:
+            raise click.ClickException("O altă rulare a retenției e în curs")
+        click.echo(f"OK: {res.days} zile arhivate ({res.archived} rânduri), {res.deleted} rânduri șterse")
+
+    @app.cli.command("attempt-archive")
+    @with_appcontext
+    @click.argument("month")
+    @click.option("--class", "class_id", help="Doar o clasă")
+    @click.option("--out", type=click.Path(dir_okay=False), help="Fișier CSV (implicit stdout)")
+    def attempt_archive_cmd(month, class_id, out):
+        """Citește arhiva unei luni (YYYY-MM) ca CSV."""
+        import sys
+        from . import retention
+        path = retention.archive_dir() / retention.archive_name(month)
+        if not path.exists():
+            raise click.ClickException(f"Nu există {path}")
+        fh = open(out, "w", newline="", encoding="utf-8") if out else sys.stdout
+        try:
+            w = csv.writer(fh)
+            w.writerow(retention.ARCHIVE_COLS.split(", "))
+            n = 0
+            for row in retention.read_archive(path, class_id):
+                w.writerow(tuple(row))
+                n += 1
+        finally:
+            if out:
+                fh.close()
+        if out:
+            click.echo(f"OK: {n} rânduri în {out}")
+
+    @app.cli.command("run-scheduler")
+    @click.option("--once", is_flag=True, help="Un singur pas (ex. din cron), apoi ieșire")
+    def run_scheduler_cmd(once):
+        """Ciclul de viață al sesiunilor (creare / freeze / închidere) ca proces separat."""
+        import logging
+        sched = lifecycle.LifecycleScheduler(app, tick_s=app.config["LIFECYCLE_TICK_S"])
+        if once:
+            sched.run_once()
+            click.echo("OK: lifecycle step")
+            return
+        logging.basicConfig(level=logging.INFO)
+        click.echo("Lifecycle scheduler pornit (Ctrl+C pentru oprire)")
+        try:
+            sched.run_forever()
+        except KeyboardInterrupt:
+            sched.stop()
 
     app.register_blueprint(dirig_bp)
 
@@ -0,0 +1,208 @@
+"""
+attempt_log scris în fundal (write-behind).
+
+Jurnalul scanărilor e audit, nu intră în decizia de check-in, deci nu are de
+ce să coste un COMMIT durabil pe request-ul elevului. Rândurile intră într-o
+coadă limitată (ATTEMPT_LOG_QUEUE_MAX) golită de un thread care le scrie în
+loturi (`executemany`, o tranzacție per lot): un val de 30 de scanări devine
+câteva commit-uri, nu 30.
+
+  - coada plină → rândul se scrie sincron, pe conexiunea request-ului;
+  - la oprirea procesului (atexit) coada se golește înainte de ieșire;
+  - ATTEMPT_LOG_MODE=sync păstrează scrierea directă (fără thread).
+
+Raportul poate vedea ultimele scanări cu o întârziere de ~ATTEMPT_LOG_FLUSH_MS.
+Un proces omorât brusc (SIGKILL) pierde ce era în coadă.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+from .db import get_connection
+from .metrics import count_attempt
+
+log = logging.getLogger(__name__)
+
+INSERT_SQL = (
+    "INSERT INTO attempt_log(session_id,class_id,device_id,code4_hash,success,reason,ip,user_agent,ts)"
+    " VALUES (?,?,?,?,?,?,?,?,?)"
+)
+
+_STOP = object()
+
+# get_attempt_log_writer: primele request-uri concurente nu pornesc două thread-uri
+_writer_lock = threading.Lock()
+
+
+def _write(conn, rows) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(INSERT_SQL, rows)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+class AttemptLogWriter:
+    """Coada + thread-ul care o golește. Unul per proces (vezi `get_attempt_log_writer`)."""
+
+    def __init__(self, app, max_queue: int = 5000, batch: int = 500, flush_s: float = 0.2,
+                 retry_s: float = 1.0, close_timeout_s: float = 5.0):
+        self.app = app
+        self.batch = batch
+        self.flush_s = flush_s
+        self.retry_s = retry_s
+        self.close_timeout_s = close_timeout_s
+        self.pid = os.getpid()
+        self._q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sala-attempt-log", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def submit(self, row) -> bool:
+        """Pune rândul în coadă. False dacă e plină sau writer-ul e oprit (apelantul scrie sincron)."""
+        if self._closed:
+            return False
+        try:
+            self._q.put_nowait(row)
+            return True
+        except queue.Full:
+            return False
+
+    def _take_batch(self):
+        """Primul rând blochează până la flush_s; restul lotului doar ce e deja în coadă."""
+        try:
+            first = self._q.get(timeout=self.flush_s)
+        except queue.Empty:
+            return []
+        rows = [first]
+        while len(rows) < self.batch:
+            try:
+                rows.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        conn = None
+        stopping = False
+        while not stopping:
+            rows = self._take_batch()
+            if _STOP in rows:
+                stopping = True
+                rows = [r for r in rows if r is not _STOP]
+                while True:  # tot ce a intrat înainte de oprire
+                    try:
+                        rows.append(self._q.get_nowait())
+                    except queue.Empty:
+                        break
+            while rows:
+                try:
+                    if conn is None:
+                        with self.app.app_context():
+                            conn = get_connection()
+                    _write(conn, rows)
+                    rows = []
+                except sqlite3.OperationalError as e:
+                    # DB blocată / neinițializată: păstrăm lotul și reîncercăm
+                    log.warning("attempt_log: %s (%d rânduri în așteptare)", e, len(rows))
+                    if stopping:  # ultima șansă: scriere sincronă, pe o conexiune nouă
+                        self._write_sync(rows)
+                        break
+                    time.sleep(self.retry_s)
+                except Exception:
+                    log.exception("attempt_log: lot pierdut (%d rânduri)", len(rows))
+                    rows = []
+        if conn is not None:
+            conn.close()
+
+    def _write_sync(self, rows) -> None:
+        with self.app.app_context():
+            conn = get_connection()
+            try:
+                _write(conn, rows)
+            except sqlite3.OperationalError as e:
+                log.warning("attempt_log: %d rânduri pierdute la oprire (%s)", len(rows), e)
+            finally:
+                conn.close()
+
+    def close(self) -> None:
+        """Golește coada și oprește thread-ul (atexit). Ce rămâne se scrie sincron."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._q.put(_STOP, timeout=self.close_timeout_s)
+            except queue.Full:
+                pass
+            self._thread.join(self.close_timeout_s)
+        rows = []
+        while True:
+            try:
+                row = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP:
+                rows.append(row)
+        if rows:
+            self._write_sync(rows)
+
+
+def get_attempt_log_writer():
+    """Writer-ul procesului curent (pornit la prima folosire, deci și după fork-ul gunicorn); None în modul sync."""
+    cfg = current_app.config
+    if cfg.get("ATTEMPT_LOG_MODE", "async") != "async":
+        return None
+    writer = current_app.extensions.get("sala_attempt_log")
+    if writer is None or writer.pid != os.getpid():
+        with _writer_lock:
+            writer = current_app.extensions.get("sala_attempt_log")
+            if writer is None or writer.pid != os.getpid():
+                writer = AttemptLogWriter(
+                    current_app._get_current_object(),
+                    max_queue=cfg.get("ATTEMPT_LOG_QUEUE_MAX", 5000),
+                    batch=cfg.get("ATTEMPT_LOG_BATCH", 500),
+                    flush_s=cfg.get("ATTEMPT_LOG_FLUSH_MS", 200) / 1000,
+                ).start()
+                current_app.extensions["sala_attempt_log"] = writer
+    return writer
+
+
+def log_attempt(conn, row) -> None:
+    """
+    Înregistrează o scanare. `row` are ordinea coloanelor din INSERT_SQL.
+    Se apelează după COMMIT-ul deciziei: scrierea sincronă (fallback) are tranzacția ei,
+    iar dacă eșuează, check-in-ul rămâne valid — pierdem doar rândul de audit.
+    """
+    count_attempt(row[5], row[4])
+    writer = get_attempt_log_writer()
+    if writer is not None and writer.submit(row):
+        return
+    try:
+        _write(conn, [row])
+    except sqlite3.OperationalError as e:
+        log.warning("attempt_log: rând pierdut (%s)", e)
+
+
+def flush_attempt_log(app=None) -> None:
+    """Scrie imediat tot ce e în coadă (comenzi CLI, teste de încărcare)."""
+    app = app or current_app._get_current_object()
+    writer = app.extensions.pop("sala_attempt_log", None)
+    if writer is not None:
+        writer.close()
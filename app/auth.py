@@ -1,15 +1,89 @@
+"""
+Identitatea dirigintelui, rezolvată doar pe blueprint-ul `dirig`.
+
+Rutele publice (monitor, /elev, /qr.png, static) nu ating tabela teacher.
+Pe /diriginti rândul vine dintr-un cache TTL per proces (TEACHER_CACHE_TTL_S),
+iar sesiunea semnată poartă o amprentă a (parolă, clasă) luată la login:
+după o schimbare de parolă sau de clasă, sesiunile vechi expiră cel târziu
+la următoarea reîncărcare a rândului din DB.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
 from functools import wraps
-from flask import session, redirect, url_for, g
-from .db import get_connection
+
+from flask import current_app, g, redirect, session, url_for
+
+from .db import get_db
+
+
+def teacher_stamp(row) -> str:
+    """Amprenta păstrată în sesiune; se schimbă odată cu parola sau clasa."""
+    return hashlib.sha256(f"{row['password_hash']}|{row['class_id']}".encode("utf-8")).hexdigest()[:16]
+
+
+class TeacherCache:
+    def __init__(self, ttl_s: float = 60.0, max_entries: int = 256):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._items: dict[int, tuple[float, dict | None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, teacher_id: int):
+        """(găsit, rând|None); rândul e None dacă profesorul nu mai există."""
+        with self._lock:
+            item = self._items.get(teacher_id)
+            if item is None or item[0] < time.monotonic():
+                return False, None
+            return True, item[1]
+
+    def put(self, teacher_id: int, row) -> None:
+        with self._lock:
+            if len(self._items) >= self.max_entries:
+                now = time.monotonic()
+                self._items = {k: v for k, v in self._items.items() if v[0] >= now}
+                if len(self._items) >= self.max_entries:
+                    self._items.clear()
+            self._items[teacher_id] = (time.monotonic() + self.ttl_s, row)
+
+
+def get_teacher_cache() -> TeacherCache:
+    cache = current_app.extensions.get("sala_teacher_cache")
+    if cache is None:
+        cache = TeacherCache(ttl_s=current_app.config.get("TEACHER_CACHE_TTL_S", 60))
+        current_app.extensions["sala_teacher_cache"] = cache
+    return cache
+
+
+def teacher_entry(row) -> dict:
+    """Ce ține cache-ul (și g.teacher) dintr-un rând teacher cu password_hash."""
+    return {"id": row["id"], "email": row["email"], "class_id": row["class_id"], "stamp": teacher_stamp(row)}
+
+
+def _fetch_teacher(tid: int):
+    cur = get_db().cursor()
+    cur.execute("SELECT id,email,class_id,password_hash FROM teacher WHERE id=?", (tid,))
+    row = cur.fetchone()
+    return teacher_entry(row) if row else None
+
 
 def load_current_teacher():
     tid = session.get("teacher_id")
     if not tid:
         g.teacher = None; return
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("SELECT id,email,class_id FROM teacher WHERE id=?", (tid,))
-    g.teacher = cur.fetchone()
-    conn.close()
+    cache = get_teacher_cache()
+    found, teacher = cache.get(tid)
+    if not found:
+        teacher = _fetch_teacher(tid)
+        cache.put(tid, teacher)
+    if teacher is None or teacher["stamp"] != session.get("teacher_stamp"):
+        # profesor șters sau parolă / clasă schimbate după login
+        session.pop("teacher_id", None)
+        session.pop("teacher_stamp", None)
+        teacher = None
+    g.teacher = teacher
 
 def login_required(view):
     @wraps(view)
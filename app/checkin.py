@@ -0,0 +1,107 @@
+"""
+Scrierile unei scanări (check-in / check-out), fiecare într-o singură tranzacție.
+
+`BEGIN IMMEDIATE` ia lock-ul de scriere de la început, așa că 30 de elevi care
+scanează simultan sunt serializați curat (busy_timeout) în loc să se
+împiedice între citire și scriere. Fiecare scanare face un singur COMMIT;
+rândul din attempt_log se scrie după el, în fundal (vezi attempt_log).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+
+from .attempt_log import log_attempt
+from .db import ISO_FMT
+from .ratelimit import get_rate_limiter
+
+
+@dataclass
+class Attempt:
+    session_id: int
+    class_id: str
+    code_hash: str
+    device_id: str
+    ip: Optional[str]
+    user_agent: str
+
+
+def _attempt_row(a: Attempt, success: int, reason: str, ts: str, code_hash: Optional[str]) -> tuple:
+    return (a.session_id, a.class_id, a.device_id, code_hash, success, reason, a.ip, a.user_agent, ts)
+
+
+# rev-ul pe care îl va primi sesiunea după această scriere; rândul de attendance
+# îl păstrează ca „cursor" pentru /api/monitor_status?since=
+_NEXT_REV = "(SELECT rev + 1 FROM session WHERE id=?)"
+
+
+def _bump_session_rev(cur, session_id: int) -> None:
+    """Invalidează snapshot-urile monitorului pentru sesiune (vezi monitor_cache)."""
+    cur.execute("UPDATE session SET rev = rev + 1 WHERE id=?", (session_id,))
+
+
+def _decide_checkin(cur, a: Attempt, status: str, now) -> str:
+    ts = now.strftime(ISO_FMT)
+
+    # 1) Rate limit: RATE_LIMIT_ATTEMPTS încercări / RATE_LIMIT_WINDOW_S / dispozitiv
+    if not get_rate_limiter().hit(f"{a.session_id}:{a.device_id}", now.timestamp(), cur.connection):
+        return "rate-limit"
+
+    # 2) Același dispozitiv a confirmat deja alt cod la această oră?
+    cur.execute(
+        "SELECT 1 FROM attendance WHERE session_id=? AND device_id=? AND code4_hash<>? LIMIT 1",
+        (a.session_id, a.device_id, a.code_hash),
+    )
+    if cur.fetchone():
+        return "device-used-for-other-code"
+
+    # 3) Insert sau duplicat, într-un singur pas
+    cur.execute(
+        "INSERT INTO attendance(session_id, class_id, code4_hash, status, check_in_at, device_id, rev)"
+        f" VALUES (?,?,?,?,?,?,{_NEXT_REV})"
+        " ON CONFLICT(session_id, code4_hash) DO NOTHING RETURNING id",
+        (a.session_id, a.class_id, a.code_hash, status, ts, a.device_id, a.session_id),
+    )
+    if not cur.fetchall():
+        return "duplicate-code"
+    _bump_session_rev(cur, a.session_id)
+    return "ok"
+
+
+def record_checkin(conn, a: Attempt, status: str, now) -> str:
+    """
+    Check-in complet (anti-fraud + insert) într-o tranzacție, apoi log-ul scanării.
+    Returnează motivul din attempt_log: ok / rate-limit /
+    device-used-for-other-code / duplicate-code.
+    """
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        reason = _decide_checkin(cur, a, status, now)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    log_attempt(conn, _attempt_row(a, 1 if reason == "ok" else 0, reason, now.strftime(ISO_FMT),
+                                   None if reason == "rate-limit" else a.code_hash))
+    return reason
+
+
+def record_checkout(conn, session_id: int, code_hash: str, now) -> str:
+    """Marchează plecarea. Returnează 'ok' sau 'no-checkin' (fără check-in anterior)."""
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute(
+            f"UPDATE attendance SET status='plecat', check_out_at=?, rev={_NEXT_REV}"
+            " WHERE session_id=? AND code4_hash=? RETURNING id",
+            (now.strftime(ISO_FMT), session_id, session_id, code_hash),
+        )
+        reason = "ok" if cur.fetchall() else "no-checkin"
+        if reason == "ok":
+            _bump_session_rev(cur, session_id)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return reason
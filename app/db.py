@@ -8,9 +8,11 @@ from datetime import datetime
 from pathlib import Path
 from typing import Iterable, Optional
 
-from flask import current_app
+from flask import current_app, g
 from zoneinfo import ZoneInfo
 
+from . import migrations
+
 
 ISO_FMT = "%Y-%m-%dT%H:%M:%S%z"  # ex: 2025-09-23T10:00:00+0200
 
@@ -32,7 +34,12 @@ def _db_path_from_url(db_url: str) -> str:
 
 
 
-def get_connection():
+def _resolve_db_path() -> Path:
+    """Calea fișierului SQLite, calculată o singură dată per aplicație."""
+    cached = current_app.extensions.get("sala_db_path")
+    if cached is not None:
+        return cached
+
     db_url = current_app.config.get("DATABASE_URL")
     db_path: Path
     if db_url:
@@ -45,168 +52,83 @@ def get_connection():
             db_path = Path(current_app.instance_path) / "sala.db"
 
     db_path.parent.mkdir(parents=True, exist_ok=True)
+    current_app.extensions["sala_db_path"] = db_path
+    return db_path
 
-    conn = sqlite3.connect(db_path.as_posix(), detect_types=sqlite3.PARSE_DECLTYPES)
+
+def get_connection():
+    """
+    Deschide o conexiune nouă, deja configurată (WAL, busy_timeout, cache).
+    Apelantul o închide. Pe calea de request folosește `get_db()`.
+    """
+    cfg = current_app.config
+    db_path = _resolve_db_path()
+
+    conn = sqlite3.connect(
+        db_path.as_posix(),
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=cfg.get("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000,
+        cached_statements=cfg.get("SQLITE_STATEMENT_CACHE", 128),
+        # METRICS_ENABLED / SLOW_QUERY_MS → sqltrace.TimedConnection (timp + nr. instrucțiuni)
+        factory=current_app.extensions.get("sala_db_factory", sqlite3.Connection),
+    )
     conn.row_factory = sqlite3.Row
+
+    # journal_mode=WAL e persistent în fișier: îl setăm o dată per proces.
+    if not current_app.extensions.get("sala_db_wal"):
+        conn.execute("PRAGMA journal_mode=WAL")
+        current_app.extensions["sala_db_wal"] = True
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(cfg.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+    conn.execute(f"PRAGMA cache_size=-{int(cfg.get('SQLITE_CACHE_SIZE_KB', 8192))}")
+    conn.execute(f"PRAGMA mmap_size={int(cfg.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))}")
+    # cârlige pe conexiune (ex. trace în `flask check-query-plans`)
+    for hook in current_app.extensions.get("sala_db_connect_hooks", ()):
+        hook(conn)
     return conn
 
 
+def get_db():
+    """Conexiunea contextului curent (request / CLI); închisă automat la teardown."""
+    if "db" not in g:
+        g.db = get_connection()
+    return g.db
 
-def init_db() -> None:
-    conn = get_connection()
-    cur = conn.cursor()
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS class (
-            id TEXT PRIMARY KEY
-        );
-        """
-    )
+def close_db(e=None) -> None:
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.close()
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS authorized_code (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            class_id TEXT NOT NULL REFERENCES class(id) ON DELETE CASCADE,
-            code4_hash TEXT NOT NULL,
-            UNIQUE(class_id, code4_hash)
-        );
-        """
-    )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS session (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            class_id TEXT NOT NULL REFERENCES class(id),
-            starts_at TEXT NOT NULL, -- ISO with TZ
-            ends_at   TEXT NOT NULL
-        );
-        """
-    )
+def init_app(app) -> None:
+    app.teardown_appcontext(close_db)
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS attendance (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL REFERENCES session(id) ON DELETE CASCADE,
-            class_id TEXT NOT NULL,
-            code4_hash TEXT NOT NULL,
-            status TEXT NOT NULL CHECK (status IN ('neconfirmat','prezent','întârziat')),
-            check_in_at TEXT,
-            UNIQUE(session_id, code4_hash)
-        );
-        """
-    )
-
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS attempt_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id INTEGER NOT NULL,
-            class_id TEXT NOT NULL,
-            device_id TEXT NOT NULL,
-            code4_hash TEXT,
-            success INTEGER NOT NULL,
-            reason TEXT,
-            ip TEXT,
-            user_agent TEXT,
-            ts TEXT NOT NULL
-        );
-        """
-    )
-
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS teacher (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      email TEXT NOT NULL UNIQUE,
-      password_hash TEXT NOT NULL,
-      class_id TEXT NOT NULL,
-      created_at TEXT NOT NULL
-    );
-    CREATE INDEX IF NOT EXISTS idx_teacher_class ON teacher(class_id);
-    """)
-
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS period (
-      period_no   INTEGER PRIMARY KEY,   -- 1..7
-      start_hhmm  TEXT NOT NULL          -- '08:00', '09:00', ...
-    );
-
-    CREATE TABLE IF NOT EXISTS schedule (
-      weekday    INTEGER NOT NULL,       -- 1=Luni .. 5=Vineri
-      period_no  INTEGER NOT NULL REFERENCES period(period_no),
-      class_id   TEXT NOT NULL,
-      PRIMARY KEY (weekday, period_no),
-      FOREIGN KEY (period_no) REFERENCES period(period_no)
-    );
-
-    -- Asigură unicitatea sesiunilor pe (class_id, starts_at)
-    CREATE UNIQUE INDEX IF NOT EXISTS ux_session_class_start ON session(class_id, starts_at);
-    CREATE INDEX IF NOT EXISTS idx_session_starts ON session(starts_at);
-    CREATE INDEX IF NOT EXISTS idx_schedule_class ON schedule(class_id);
-    """)
 
 
+def init_db(**kwargs) -> list:
+    """Aduce schema la zi (migrări versionate, vezi `migrations`). Idempotent."""
+    conn = get_connection()
     try:
-        cur.execute("ALTER TABLE attendance ADD COLUMN check_out_at TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    # --- freeze snapshot columns on session (idempotent) ---
-    try:
-        cur.execute("ALTER TABLE session ADD COLUMN present_frozen INTEGER")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        cur.execute("ALTER TABLE session ADD COLUMN present_frozen_at TEXT")
-    except sqlite3.OperationalError:
-        pass
-    conn.commit()
+        return migrations.migrate(conn, **kwargs)
+    finally:
+        conn.close()
 
-    def _ensure_attendance_allows_plecat(conn):
-        cur = conn.cursor()
-        row = cur.execute(
-            "SELECT sql FROM sqlite_master WHERE type='table' AND name='attendance'"
-        ).fetchone()
-        if not row:
-            return  # tabela va fi creată oricum mai sus
-        create_sql = row[0] or ""
-        if "plecat" in create_sql:
-            return  # deja e ok
-
-        # Migrare: recreăm tabela cu CHECK extins
-        cur.execute("PRAGMA foreign_keys=OFF")
-        conn.commit()
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS attendance_new (
-                id INTEGER PRIMARY KEY,
-                session_id INTEGER NOT NULL,
-                class_id TEXT NOT NULL,
-                code4_hash TEXT,
-                status TEXT NOT NULL CHECK (status IN ('neconfirmat','prezent','întârziat','plecat')),
-                check_in_at TEXT,
-                check_out_at TEXT,
-                UNIQUE(session_id, code4_hash)
-            )
-        """)
-        # Copiem toate datele existente (coloanele trebuie să existe deja; ai adăugat check_out_at mai sus)
-        cur.execute("""
-            INSERT INTO attendance_new (id, session_id, class_id, code4_hash, status, check_in_at, check_out_at)
-            SELECT id, session_id, class_id, code4_hash, status, check_in_at, check_out_at
-            FROM attendance
-        """)
-        cur.execute("DROP TABLE attendance")
-        cur.execute("ALTER TABLE attendance_new RENAME TO attendance")
-        cur.execute("PRAGMA foreign_keys=ON")
+def rebuild_session_summary(conn) -> int:
+    """Recalculează session_summary de la zero (după editări manuale în DB)."""
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        cur.execute("DELETE FROM session_summary")
+        cur.execute(f"INSERT INTO session_summary(session_id, roster, prezenti, intarziati, plecati)"
+                    f" {migrations.SUMMARY_ROWS_SQL} GROUP BY s.id")
+        n = cur.rowcount
         conn.commit()
-
-    _ensure_attendance_allows_plecat(conn)
-
-    conn.commit()
-    conn.close()
+    except Exception:
+        conn.rollback()
+        raise
+    return n
 
 
 def _hash_code(class_id: str, code4: str, salt: Optional[str] = None) -> str:
@@ -226,6 +148,7 @@ def import_codes(csv_path: Path) -> ImportResult:
     cur = conn.cursor()
     inserted = 0
     skipped = 0
+    classes = set()
 
     with open(csv_path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -252,7 +175,10 @@ def import_codes(csv_path: Path) -> ImportResult:
                 inserted += 1
             except sqlite3.IntegrityError:
                 skipped += 1
+            classes.add(class_id)
 
+    # lista s-a schimbat: monitoarele claselor trebuie să reconstruiască snapshot-ul
+    cur.executemany("UPDATE session SET rev = rev + 1 WHERE class_id=?", [(c,) for c in classes])
     conn.commit()
     conn.close()
     return ImportResult(inserted=inserted, skipped_duplicates=skipped)
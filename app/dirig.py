@@ -1,19 +1,22 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, g, current_app, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, session, g, current_app, Response, stream_with_context, jsonify
 from werkzeug.security import check_password_hash
 
 
-from .auth import login_required
-from .db import get_connection
-from .utils import parse_iso
-from .reporting import fetch_report_data
+from .auth import get_teacher_cache, load_current_teacher, login_required, teacher_entry, teacher_stamp
+from .db import get_db
+from .reporting import fetch_attempts_page, iter_attempts, iter_detail, iter_summary, DetailRow, SummaryRow, AttemptRow, REASON_RO
 from datetime import datetime, timedelta
-from io import StringIO, BytesIO
-import csv, zipfile
+from itertools import groupby
+from operator import attrgetter
+import csv, io, zipfile
 from .utils import parse_date_yyyy_mm_dd, inclusive_end_of_day
 
 
 bp = Blueprint("dirig", __name__, url_prefix="/diriginti")
 
+# profesorul se încarcă doar pe /diriginti (rutele publice nu ating tabela teacher)
+bp.before_request(load_current_teacher)
+
 def week_bounds_now(tz):
     now = datetime.now(tz)
     start = (now - timedelta(days= (now.weekday()))).replace(hour=0,minute=0,second=0,microsecond=0)
@@ -25,11 +28,14 @@ def login():
     if request.method == "POST":
         email = (request.form.get("email") or "").strip().lower()
         password = request.form.get("password") or ""
-        conn = get_connection(); cur = conn.cursor()
+        cur = get_db().cursor()
         cur.execute("SELECT id,email,password_hash,class_id FROM teacher WHERE email=?", (email,))
-        row = cur.fetchone(); conn.close()
+        row = cur.fetchone()
         if row and check_password_hash(row["password_hash"], password):
             session["teacher_id"] = row["id"]
+            session["teacher_stamp"] = teacher_stamp(row)
+            # rândul proaspăt înlocuiește o intrare veche (ex. parola tocmai schimbată)
+            get_teacher_cache().put(row["id"], teacher_entry(row))
             return redirect(url_for("dirig.raport"))
         return render_template("dirig_login.html", error="Credențiale invalide")
     return render_template("dirig_login.html")
@@ -37,6 +43,7 @@ def login():
 @bp.route("/logout")
 def logout():
     session.pop("teacher_id", None)
+    session.pop("teacher_stamp", None)
     return redirect(url_for("dirig.login"))
 
 @bp.route("/raport")
@@ -57,14 +64,54 @@ def raport():
         start, end = week_bounds_now(tz)
 
     class_id = g.teacher["class_id"]
-    detail_rows, summary_rows, attempts = fetch_report_data(class_id, start, end, tz)
+    conn = get_db()
+    detail_rows = list(iter_detail(conn, class_id, start, end))
+    summary_rows = list(iter_summary(conn, class_id, start, end))
+    # scanările se încarcă separat, paginat (api_attempts)
+    # rândurile vin ordonate pe sesiune: le grupăm o dată, nu filtrăm în template per sesiune
+    detail_by_session = {sid: list(rows) for sid, rows in groupby(detail_rows, key=attrgetter("sesiune_id"))}
 
     return render_template("dirig_raport.html",
                            class_id=class_id, start=start.date(), end=end.date(),
-                           detail=detail_rows, summary=summary_rows, attempts=attempts
+                           detail_by_session=detail_by_session, summary=summary_rows, reasons=REASON_RO
                            )
 
 
+@bp.get("/api/attempts")
+@login_required
+def api_attempts():
+    """
+    Scanările (anti-fraud) din interval, JSON paginat keyset:
+    ?from=&to=&reason=&device=&success=0|1&limit=&after=<cursor din `next`>
+    """
+    tz = current_app.config["TZ"]
+    dfrom = request.args.get("from")
+    dto = request.args.get("to")
+    if dfrom and dto:
+        try:
+            start = parse_date_yyyy_mm_dd(dfrom, tz)
+            end = inclusive_end_of_day(parse_date_yyyy_mm_dd(dto, tz))
+        except ValueError:
+            return jsonify({"error": "Format de dată invalid. Folosește YYYY-MM-DD."}), 400
+    else:
+        start, end = week_bounds_now(tz)
+
+    success = request.args.get("success", type=int)
+    limit = max(1, min(request.args.get("limit", 100, type=int), 500))
+    try:
+        items, nxt = fetch_attempts_page(
+            get_db(), g.teacher["class_id"], start, end, tz,
+            after=request.args.get("after") or None,
+            reason=request.args.get("reason") or None,
+            device=(request.args.get("device") or "").strip() or None,
+            success=success if success in (0, 1) else None,
+            limit=limit,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [r._asdict() for r in items], "next": nxt})
+
+
 @bp.route("/export")
 @login_required
 def export_zip():
@@ -82,29 +129,60 @@ def export_zip():
         start, end = week_bounds_now(tz)
 
     class_id = g.teacher["class_id"]
-    detail_rows, summary_rows, attempts = fetch_report_data(class_id, start, end, tz)
-
-    # build ZIP with 3 CSVs
-    buf = BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-        def write_csv(name, rows, header):
-            sio = StringIO(); w = csv.DictWriter(sio, fieldnames=header)
-            w.writeheader()
-            for r in rows: w.writerow(r)
-            z.writestr(name, sio.getvalue())
+    conn = get_db()
+    files = [
+        ("prezenta.csv", DetailRow._fields, iter_detail(conn, class_id, start, end)),
+        ("sumar.csv", SummaryRow._fields, iter_summary(conn, class_id, start, end)),
+        ("scanari.csv", AttemptRow._fields, iter_attempts(conn, class_id, start, end, tz)),
+    ]
 
-        write_csv("prezenta.csv", detail_rows,
-                  ["data","incepe","se_termina","clasa","sesiune_id","cod4",
-                   "status_final","check_in_at","check_out_at","status_checkin","status_checkout"])
-
-        write_csv("sumar.csv", summary_rows,
-                  ["sesiune_id","data","incepe","se_termina","prezenti","intarziati","plecati","neconfirmat","rata_conformare"])
-
-        write_csv("scanari.csv", attempts,
-                  ["ts","device_id","cod4","success","reason","ip","ua"])
-
-    buf.seek(0)
     fname = f"raport_{class_id}_{start.date()}_{end.date()}.zip"
-    return send_file(buf, as_attachment=True, download_name=fname, mimetype="application/zip")
-
-
+    return Response(stream_with_context(_stream_zip(files)), mimetype="application/zip",
+                    headers={"Content-Disposition": f'attachment; filename="{fname}"'})
+
+
+class _ZipSink(io.RawIOBase):
+    """Ieșire doar-scriere pentru ZipFile: adună octeții până îi preia generatorul."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_zip(files, flush_every: int = 500):
+    """
+    ZIP generat din mers: fiecare CSV e scris rând cu rând direct în arhivă
+    (fără seek — ZipFile folosește data descriptors), iar octeții comprimați
+    pleacă la client la fiecare `flush_every` rânduri. Memoria nu crește cu intervalul.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, header, rows in files:
+            with io.TextIOWrapper(z.open(name, "w"), encoding="utf-8", newline="") as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                for i, row in enumerate(rows, 1):
+                    w.writerow(row)
+                    if i % flush_every == 0:
+                        f.flush()
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,224 @@
+"""
+Ciclul de viață al sesiunilor, rulat în afara request-urilor.
+
+Pentru fiecare sesiune granițele de fază (`phase_windows`) sunt cunoscute dinainte,
+deci tranzițiile se pot planifica:
+  - crearea sesiunilor zilei din orar (dacă AUTO_SESSIONS_ENABLED);
+  - „freeze" la închiderea check-in-ului (T + CHECKIN_CLOSE_MIN_AFTER):
+    session.present_frozen = câți au făcut check-in;
+  - închiderea după grație (ends_at + CHECKOUT_GRACE_MIN_AFTER_END):
+    session.closed_at;
+  - o dată pe zi, după RETENTION_HOUR: retenția attempt_log (dacă
+    ATTEMPT_RETENTION_DAYS > 0; vezi retention).
+
+Rulează fie ca thread în fiecare proces web (LIFECYCLE_SCHEDULER=thread),
+fie separat: `flask run-scheduler`. Toate operațiile sunt idempotente, deci
+mai mulți worker-i care rulează același plan nu strică nimic.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from .db import ISO_FMT, get_db
+from .timetable import get_timetable
+
+log = logging.getLogger(__name__)
+
+
+def phase_windows(now_ts, starts_ts, ends_ts, cfg):
+    """
+    Returnează dict cu ferestrele (active/sleep/end) și 'mode' curent.
+    Toate momentele sunt secunde UTC (session.starts_epoch / ends_epoch).
+    Reguli:
+      - check-in: [T - open_before, T + close_after]
+      - sleep   : (T + close_after, ends_at - checkout_open_before_end)
+      - end     : [ends_at - checkout_open_before_end, ends_at + grace_after_end]
+    """
+    open_before   = cfg["CHECKIN_OPEN_MIN_BEFORE"] * 60
+    close_after   = cfg["CHECKIN_CLOSE_MIN_AFTER"] * 60
+    open_end      = cfg["CHECKOUT_OPEN_MIN_BEFORE_END"] * 60
+    grace_after   = cfg["CHECKOUT_GRACE_MIN_AFTER_END"] * 60
+
+    w_checkin_start = starts_ts - open_before
+    w_checkin_end   = starts_ts + close_after
+    w_end_start     = ends_ts - open_end
+    w_end_end       = ends_ts + grace_after
+
+    if now_ts < w_checkin_start:
+        mode = "pre"
+    elif w_checkin_start <= now_ts <= w_checkin_end:
+        mode = "active"
+    elif w_checkin_end < now_ts < w_end_start:
+        mode = "sleep"
+    elif w_end_start <= now_ts <= w_end_end:
+        mode = "end"
+    else:
+        mode = "post"
+
+    return {
+        "mode": mode,
+        "w_checkin_start": w_checkin_start,
+        "w_checkin_end":   w_checkin_end,
+        "w_end_start":     w_end_start,
+        "w_end_end":       w_end_end,
+    }
+
+
+# câți au făcut check-in (codurile autorizate ale clasei); aceeași valoare o
+# calculează monitorul cât timp freeze-ul n-a rulat încă
+FROZEN_COUNT_SQL = """
+    SELECT count(*) FROM attendance a
+    JOIN authorized_code ac ON ac.class_id = ? AND ac.code4_hash = a.code4_hash
+    WHERE a.session_id = ? AND a.check_in_at IS NOT NULL
+"""
+
+
+@dataclass(frozen=True)
+class Transition:
+    at: int            # secunde UTC
+    kind: str          # "freeze" | "close"
+    session_id: int
+    class_id: str
+
+
+def plan_transitions(conn, now_ts: int, cfg, lookback_days: int = 2) -> list[Transition]:
+    """Tranzițiile încă neaplicate ale sesiunilor recente / de azi, sortate după moment."""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, class_id, starts_epoch, ends_epoch, present_frozen, closed_at FROM session"
+        " WHERE starts_epoch >= ? AND starts_epoch < ? AND (present_frozen IS NULL OR closed_at IS NULL)",
+        (now_ts - lookback_days * 86400, now_ts + 86400),
+    )
+    out = []
+    for r in cur.fetchall():
+        wins = phase_windows(now_ts, r["starts_epoch"], r["ends_epoch"], cfg)
+        if r["present_frozen"] is None:
+            out.append(Transition(wins["w_checkin_end"], "freeze", r["id"], r["class_id"]))
+        if r["closed_at"] is None:
+            out.append(Transition(wins["w_end_end"], "close", r["id"], r["class_id"]))
+    out.sort(key=lambda t: t.at)
+    return out
+
+
+def apply_transitions(conn, transitions, tz) -> int:
+    """Aplică tranzițiile date într-o singură tranzacție scurtă."""
+    if not transitions:
+        return 0
+    cur = conn.cursor()
+    done = 0
+    cur.execute("BEGIN IMMEDIATE")
+    try:
+        for t in transitions:
+            at = datetime.fromtimestamp(t.at, tz).strftime(ISO_FMT)
+            if t.kind == "freeze":
+                cur.execute(
+                    f"UPDATE session SET present_frozen = ({FROZEN_COUNT_SQL}), present_frozen_at = ?"
+                    " WHERE id = ? AND present_frozen IS NULL",
+                    (t.class_id, t.session_id, at, t.session_id),
+                )
+            else:
+                cur.execute("UPDATE session SET closed_at = ? WHERE id = ? AND closed_at IS NULL",
+                            (at, t.session_id))
+            done += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return done
+
+
+def create_day_sessions(conn, day, tz) -> int:
+    """Inserează sesiunile zilei din orar (cele existente rămân neatinse)."""
+    rows = []
+    for slot in get_timetable(conn).slots_for(day):
+        starts, ends = slot.bounds(day, tz)
+        rows.append((slot.class_id, starts.strftime(ISO_FMT), ends.strftime(ISO_FMT)))
+    if not rows:
+        return 0
+    cur = conn.cursor()
+    before = conn.total_changes
+    cur.executemany(
+        "INSERT INTO session(class_id, starts_at, ends_at) VALUES (?,?,?)"
+        " ON CONFLICT(class_id, starts_at) DO NOTHING",
+        rows,
+    )
+    conn.commit()
+    return conn.total_changes - before
+
+
+class LifecycleScheduler:
+    """Bucla care aplică tranzițiile la timp; doarme până la următoarea (max `tick_s`)."""
+
+    def __init__(self, app, tick_s: float = 30.0):
+        self.app = app
+        self.tick_s = tick_s
+        self._stop = threading.Event()
+        self._thread = None
+        self._day_done = None   # (zi, versiune orar) pentru care s-au creat sesiunile
+        self._retention_done = None   # ziua ultimei retenții
+
+    def run_once(self, now=None) -> float:
+        """Un pas: creează / îngheață / închide ce e scadent. Întoarce secunde până la următorul pas."""
+        cfg = self.app.config
+        with self.app.app_context():
+            conn = get_db()
+            now = now or datetime.now(cfg["TZ"])
+            now_ts = int(now.timestamp())
+
+            if cfg.get("AUTO_SESSIONS_ENABLED", False):
+                stamp = (now.date(), get_timetable(conn).version)
+                if stamp != self._day_done:
+                    created = create_day_sessions(conn, now.date(), cfg["TZ"])
+                    if created:
+                        log.info("lifecycle: %d sesiuni create pentru %s", created, now.date())
+                    self._day_done = stamp
+
+            plan = plan_transitions(conn, now_ts, cfg)
+            due = [t for t in plan if t.at <= now_ts]
+            if due:
+                log.info("lifecycle: %d tranziții aplicate", apply_transitions(conn, due, cfg["TZ"]))
+
+            upcoming = [t.at for t in plan if t.at > now_ts]
+
+            if (cfg.get("ATTEMPT_RETENTION_DAYS", 0) > 0 and now.hour >= cfg.get("RETENTION_HOUR", 3)
+                    and self._retention_done != now.date()):
+                from . import retention
+                if retention.run_scheduled(self.app, conn, now) is not None:
+                    self._retention_done = now.date()
+        wait = min(upcoming) - now_ts if upcoming else self.tick_s
+        return max(0.5, min(wait, self.tick_s))
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                wait = self.run_once()
+            except sqlite3.OperationalError as e:
+                # DB încă neinițializată (init-db) sau blocată: reîncercăm la următorul tick
+                log.warning("lifecycle: %s", e)
+                wait = self.tick_s
+            except Exception:
+                log.exception("lifecycle: pas eșuat")
+                wait = self.tick_s
+            self._stop.wait(wait)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="sala-lifecycle", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def init_app(app):
+    """Pornește thread-ul în procesul web (nu și în comenzile `flask ...`)."""
+    if app.config.get("LIFECYCLE_SCHEDULER") != "thread" or os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        return
+    sched = LifecycleScheduler(app, tick_s=app.config.get("LIFECYCLE_TICK_S", 30))
+    app.extensions["sala_lifecycle"] = sched.start()
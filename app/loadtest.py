@@ -0,0 +1,402 @@
+"""
+Test de încărcare: o clasă întreagă scanează QR-ul în același timp.
+
+`run_loadtest()` (sau `flask loadtest`):
+  1. construiește o bază de lucru (`queryplan.build_synthetic_db`, cu istoric) și
+     adaugă câte o sesiune live per clasă, comprimată ca fereastra de check-in și
+     cea de check-out să fie deschise amândouă pe durata testului;
+  2. pornește gunicorn local pe ea (worker-i / thread-uri configurabile);
+  3. lansează câte un elev virtual per cod: deschide /elev cu tokenul QR (semnat
+     ca pe monitor, `issue_qr_token`), trimite cifrele cu un device_id propriu,
+     uneori „apasă de două ori", apoi după o pauză face check-out;
+     sosirile urmează distribuția aleasă (burst / uniform / poisson);
+  4. în paralel, monitoarele fac polling pe /api/monitor_status (ETag + since);
+  5. oprește serverul (coada attempt_log se golește la ieșire) și compară baza cu
+     ce au văzut clienții.
+
+Raportează p50/p95/p99 per operație, răspunsurile „Sistemul este ocupat"
+(database is locked, și contorul serverului din /metrics) și orice nepotrivire:
+mesaj neașteptat, rânduri lipsă sau în plus în attendance / attempt_log,
+session_summary diferit de recalculare.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+import secrets
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .db import ISO_FMT
+from .migrations import SUMMARY_ROWS_SQL
+from .queryplan import build_synthetic_db
+from .routes import BUSY_MESSAGE, CHECKIN_MESSAGES
+from .utils import issue_qr_token
+
+ARRIVALS = ("burst", "uniform", "poisson")
+OPERATIONS = ("pagina", "check-in", "check-out", "monitor")
+
+CHECKIN_OK = "Te-ai înregistrat cu succes"
+CHECKOUT_OK = "Check-out înregistrat"
+_OUTCOMES = [(CHECKIN_OK, "ok"), (CHECKOUT_OK, "ok"), (BUSY_MESSAGE, "busy"),
+             *((msg, reason) for reason, msg in CHECKIN_MESSAGES.items())]
+
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class LoadResult:
+    students: int = 0
+    elapsed_s: float = 0.0
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    outcomes: Counter = field(default_factory=Counter)     # (operație, rezultat) -> n
+    busy: int = 0                                          # „Sistemul este ocupat" văzut de clienți
+    server_lock_errors: int | None = None                  # din /metrics
+    mismatches: list[str] = field(default_factory=list)
+
+    def percentiles(self, op: str) -> dict[str, float]:
+        xs = sorted(self.latencies.get(op, ()))
+        if not xs:
+            return {}
+        def rank(p):
+            return xs[min(len(xs) - 1, max(0, math.ceil(p / 100 * len(xs)) - 1))]
+        return {"n": len(xs), "p50": rank(50), "p95": rank(95), "p99": rank(99), "max": xs[-1]}
+
+
+# ---------------------------------------------------------------------------
+# baza + serverul
+
+def _live_sessions(path: Path, tz, class_ids: list[str], now: datetime) -> dict[str, int]:
+    """
+    O sesiune per clasă, începută acum 30 s și lungă de 5 min 30 s: check-in-ul
+    (0–10 min de la început) și check-out-ul (±5 min față de final) sunt deschise amândouă.
+    """
+    starts = (now - timedelta(seconds=30)).replace(microsecond=0)
+    ends = starts + timedelta(minutes=5, seconds=30)
+    conn = sqlite3.connect(path.as_posix())
+    try:
+        out = {}
+        for c in class_ids:
+            cur = conn.execute("INSERT INTO session(class_id, starts_at, ends_at) VALUES (?,?,?)",
+                               (c, starts.strftime(ISO_FMT), ends.strftime(ISO_FMT)))
+            out[c] = cur.lastrowid
+        conn.commit()
+        return out
+    finally:
+        conn.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(app, db_path: Path, workdir: Path, workers: int, threads: int, metrics_token: str, echo):
+    port = _free_port()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{db_path.as_posix()}",
+               SECRET_KEY=app.config["SECRET_KEY"],
+               LIFECYCLE_SCHEDULER="off",
+               METRICS_ENABLED="true",
+               METRICS_DIR=str(workdir / "metrics"),
+               METRICS_TOKEN=metrics_token,
+               PROFILE_DIR=str(workdir / "profiles"),
+               SLOW_QUERY_DB=str(workdir / "slow_queries.db"))
+    with open(workdir / "gunicorn.log", "wb") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(threads),
+             "--bind", f"127.0.0.1:{port}", "--backlog", "2048", "--log-level", "warning", "app:create_app()"],
+            cwd=_PROJECT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            with urllib.request.urlopen(f"{base}/health", timeout=1):
+                echo(f"gunicorn pornit pe {base} ({workers} worker-i × {threads} thread-uri)")
+                return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    tail = (workdir / "gunicorn.log").read_text(errors="replace")[-2000:]
+    raise RuntimeError(f"gunicorn nu a pornit:\n{tail}")
+
+
+def _stop_server(proc) -> None:
+    """SIGTERM: worker-ii ies curat, iar atexit scrie ce a rămas în coada attempt_log."""
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ---------------------------------------------------------------------------
+# clienții
+
+def _request(url: str, data: dict | None = None, headers: dict | None = None, timeout: float = 30.0):
+    """(status, corp, headere, secunde). Erorile HTTP sunt răspunsuri, nu excepții."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    req = urllib.request.Request(url, data=body, headers=headers or {})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return r.status, r.read(), r.headers, time.perf_counter() - t0
+    except urllib.error.HTTPError as e:
+        return e.code, e.read(), e.headers, time.perf_counter() - t0
+    except OSError as e:
+        return 0, str(e).encode(), {}, time.perf_counter() - t0
+
+
+def _outcome(status: int, body: bytes) -> str:
+    if status != 200:
+        return f"http-{status}"
+    text = body.decode("utf-8", "replace")
+    for needle, outcome in _OUTCOMES:
+        if needle in text:
+            return outcome
+    return "altceva"
+
+
+def _arrivals(rnd: random.Random, n: int, kind: str, window_s: float) -> list[float]:
+    if kind == "uniform":
+        return sorted(rnd.uniform(0, window_s) for _ in range(n))
+    if kind == "poisson":
+        t, out = 0.0, []
+        for _ in range(n):
+            t += rnd.expovariate(n / window_s)
+            out.append(t)
+        return out
+    # burst: clopoțelul sună, majoritatea scanează în primele secunde
+    return sorted(min(window_s, abs(rnd.gauss(0, window_s / 6))) for _ in range(n))
+
+
+class _Run:
+    def __init__(self, base: str, result: LoadResult):
+        self.base = base
+        self.result = result
+        self.lock = threading.Lock()
+        self.expected: dict[int, Counter] = defaultdict(Counter)   # sesiune -> checkin / checkout / attempts
+
+    def record(self, op: str, outcome: str, seconds: float) -> None:
+        with self.lock:
+            self.result.latencies[op].append(seconds)
+            self.result.outcomes[(op, outcome)] += 1
+            if outcome == "busy":
+                self.result.busy += 1
+
+    def expect(self, sid: int, key: str) -> None:
+        with self.lock:
+            self.expected[sid][key] += 1
+
+    def mismatch(self, msg: str) -> None:
+        with self.lock:
+            self.result.mismatches.append(msg)
+
+    def post(self, op: str, sid: int, token: str, code: str, device: str, retries: int = 3) -> str:
+        """Un POST /elev; „ocupat" se reîncearcă după o secundă, ca un elev real."""
+        form = {"token": token, "d1": code[0], "d2": code[1], "d3": code[2], "d4": code[3], "device_id": device}
+        for _ in range(retries + 1):
+            status, body, _, dt = _request(f"{self.base}/elev", form)
+            outcome = _outcome(status, body)
+            self.record(op, outcome, dt)
+            if outcome != "busy":
+                return outcome
+            time.sleep(1.0)
+        return "busy"
+
+
+def _student(run: _Run, t0: float, at: float, sid: int, code: str, device: str, tokens: tuple[str, str],
+             double_tap: bool, stay_s: float) -> None:
+    start_tok, end_tok = tokens
+    time.sleep(max(0.0, t0 + at - time.monotonic()))
+
+    status, body, _, dt = _request(f"{run.base}/elev?token={start_tok}")
+    run.record("pagina", "ok" if status == 200 else f"http-{status}", dt)
+
+    outcome = run.post("check-in", sid, start_tok, code, device)
+    if outcome != "busy":
+        run.expect(sid, "attempts")
+    if outcome != "ok":
+        run.mismatch(f"sesiunea {sid} cod {code}: check-in → {outcome}")
+        return
+    run.expect(sid, "checkin")
+
+    if double_tap:
+        again = run.post("check-in", sid, start_tok, code, device)
+        if again != "busy":
+            run.expect(sid, "attempts")
+        if again not in ("duplicate-code", "busy"):
+            run.mismatch(f"sesiunea {sid} cod {code}: al doilea check-in → {again}")
+
+    if stay_s < 0:
+        return
+    time.sleep(stay_s)
+    outcome = run.post("check-out", sid, end_tok, code, device)
+    if outcome == "ok":
+        run.expect(sid, "checkout")
+    else:
+        run.mismatch(f"sesiunea {sid} cod {code}: check-out → {outcome}")
+
+
+def _monitor(run: _Run, sid: int, poll_s: float, stop: threading.Event) -> None:
+    etag, cursor = None, None
+    while not stop.is_set():
+        url = f"{run.base}/api/monitor_status?session_id={sid}"
+        if cursor:
+            url += f"&since={urllib.parse.quote(str(cursor))}"
+        status, body, headers, dt = _request(url, headers={"If-None-Match": etag} if etag else None)
+        run.record("monitor", "ok" if status in (200, 304) else f"http-{status}", dt)
+        if status == 200:
+            etag = headers.get("ETag")
+            try:
+                cursor = json.loads(body).get("cursor")
+            except ValueError:
+                run.mismatch(f"monitor {sid}: răspuns non-JSON")
+        stop.wait(poll_s)
+
+
+def _scrape_lock_errors(base: str, metrics_token: str):
+    status, body, _, _ = _request(f"{base}/metrics", headers={"Authorization": f"Bearer {metrics_token}"})
+    if status != 200:
+        return None
+    return int(sum(float(line.rsplit(" ", 1)[1]) for line in body.decode().splitlines()
+                   if line.startswith("sala_sqlite_lock_errors_total{")))
+
+
+def _verify(db_path: Path, sessions: dict[str, int], expected: dict[int, Counter]) -> list[str]:
+    """Ce a rămas în DB vs. ce au văzut clienții."""
+    problems = []
+    conn = sqlite3.connect(db_path.as_posix())
+    try:
+        for class_id, sid in sessions.items():
+            exp = expected.get(sid, Counter())
+            att, left = conn.execute(
+                "SELECT count(*), coalesce(sum(check_out_at IS NOT NULL), 0) FROM attendance WHERE session_id=?",
+                (sid,)).fetchone()
+            logged = conn.execute("SELECT count(*) FROM attempt_log WHERE session_id=?", (sid,)).fetchone()[0]
+            if att != exp["checkin"]:
+                problems.append(f"{class_id}: attendance {att} rânduri, clienții au primit {exp['checkin']} confirmări")
+            if left != exp["checkout"]:
+                problems.append(f"{class_id}: {left} check-out-uri în DB, {exp['checkout']} confirmate")
+            if logged != exp["attempts"]:
+                problems.append(f"{class_id}: attempt_log {logged} rânduri, {exp['attempts']} scanări procesate")
+            stored = conn.execute("SELECT session_id, roster, prezenti, intarziati, plecati FROM session_summary"
+                                  " WHERE session_id=?", (sid,)).fetchone()
+            fresh = conn.execute(f"{SUMMARY_ROWS_SQL} WHERE s.id=? GROUP BY s.id", (sid,)).fetchone()
+            if stored != fresh:
+                problems.append(f"{class_id}: session_summary {stored} ≠ recalculat {fresh}")
+    finally:
+        conn.close()
+    return problems
+
+
+# ---------------------------------------------------------------------------
+
+def run_loadtest(app, *, classes: int = 4, roster: int = 28, arrival: str = "burst", window_s: float = 60.0,
+                 stay_s: float = 20.0, checkout: bool = True, double_tap: float = 0.05, monitors: int | None = None,
+                 poll_s: float = 3.0, workers: int = 2, threads: int = 8, history_days: int = 20,
+                 keep: Path | None = None, seed: int = 1, echo=print) -> LoadResult:
+    if arrival not in ARRIVALS:
+        raise ValueError(f"arrival: una din {', '.join(ARRIVALS)}")
+    tmp = None
+    if keep is None:
+        tmp = tempfile.TemporaryDirectory(prefix="sala-load-")
+        workdir = Path(tmp.name)
+    else:
+        workdir = Path(keep)
+        workdir.mkdir(parents=True, exist_ok=True)
+    db_path = workdir / "load.db"
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+
+    try:
+        tz = app.config["TZ"]
+        now = datetime.now(tz)
+        # baza sintetică are nevoie de cel puțin 3 clase (sesiunile ei live); folosim primele `classes`
+        info = build_synthetic_db(db_path, tz, classes=max(classes, 3), roster=roster, days=history_days,
+                                  now=now, seed=seed)
+        sessions = _live_sessions(db_path, tz, list(info["codes"])[:classes], now)
+        echo(f"Bază: {info['sessions']} sesiuni de istoric, {info['attempts']} attempt_log; "
+             f"{len(sessions)} sesiuni live în {db_path}")
+
+        # /metrics nu răspunde fără token în afara modului debug
+        metrics_token = os.environ.get("METRICS_TOKEN") or secrets.token_urlsafe(16)
+        proc, base = _start_server(app, db_path, workdir, workers, threads, metrics_token, echo)
+        result = LoadResult()
+        run = _Run(base, result)
+        rnd = random.Random(seed)
+        try:
+            ts = time.time()
+            students = []
+            for class_id, sid in sessions.items():
+                tokens = (issue_qr_token(app, sid, "start", ts), issue_qr_token(app, sid, "end", ts))
+                codes = info["codes"][class_id]
+                for at, (n, code) in zip(_arrivals(rnd, len(codes), arrival, window_s), enumerate(codes)):
+                    stay = rnd.uniform(0, stay_s) if checkout else -1
+                    students.append((at, sid, code, f"load-{class_id}-{n}", tokens,
+                                     rnd.random() < double_tap, stay))
+            result.students = len(students)
+            echo(f"{len(students)} elevi, sosiri {arrival} în {window_s:g}s, "
+                 f"{monitors if monitors is not None else len(sessions)} monitoare la {poll_s:g}s")
+
+            stop = threading.Event()
+            sids = list(sessions.values())
+            mon_threads = [threading.Thread(target=_monitor, args=(run, sids[i % len(sids)], poll_s, stop), daemon=True)
+                           for i in range(monitors if monitors is not None else len(sids))]
+            t0 = time.monotonic() + 0.5
+            stud_threads = [threading.Thread(target=_student, args=(run, t0, *s), daemon=True) for s in students]
+            for t in mon_threads + stud_threads:
+                t.start()
+            for t in stud_threads:
+                t.join()
+            result.elapsed_s = time.monotonic() - t0
+            stop.set()
+            for t in mon_threads:
+                t.join()
+            result.server_lock_errors = _scrape_lock_errors(base, metrics_token)
+        finally:
+            _stop_server(proc)
+        result.mismatches.extend(_verify(db_path, sessions, run.expected))
+        return result
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+
+def format_report(result: LoadResult) -> list[str]:
+    lines = [f"{result.students} elevi în {result.elapsed_s:.1f}s", "",
+             f"{'operație':<10} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  rezultate"]
+    for op in OPERATIONS:
+        p = result.percentiles(op)
+        if not p:
+            continue
+        outs = ", ".join(f"{o}={n}" for (o2, o), n in sorted(result.outcomes.items()) if o2 == op)
+        lines.append(f"{op:<10} {p['n']:>6} {p['p50'] * 1000:>8.1f} {p['p95'] * 1000:>8.1f}"
+                     f" {p['p99'] * 1000:>8.1f} {p['max'] * 1000:>8.1f}  {outs}")
+    server = "?" if result.server_lock_errors is None else result.server_lock_errors
+    lines += ["", f"database is locked: {result.busy} răspunsuri „ocupat” la clienți, {server} erori în server (/metrics)",
+              f"nepotriviri: {len(result.mismatches)}"]
+    lines += [f"  {m}" for m in result.mismatches[:50]]
+    if len(result.mismatches) > 50:
+        lines.append(f"  ... încă {len(result.mismatches) - 50}")
+    return lines
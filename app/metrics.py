@@ -0,0 +1,261 @@
+"""
+Metrici Prometheus pe /metrics (format text, fără dependențe).
+
+Pentru fiecare request pe blueprint-urile `main` și `dirig`:
+  - durata (histogramă per endpoint + metodă) și numărul de răspunsuri per status;
+  - timpul petrecut în SQLite și numărul de instrucțiuni (histograme per request),
+    măsurate de `sqltrace.TimedConnection` (fabrica de conexiuni din `get_connection()`);
+  - erorile „database is locked / busy" întâlnite.
+Plus scanările elevilor pe motivul din attempt_log (`count_attempt`).
+
+Fiecare proces ține un registru în memorie. Cu METRICS_DIR setat, registrul se
+scrie periodic (METRICS_FLUSH_S) în `METRICS_DIR/metrics-<pid>.json`, iar /metrics
+adună toate fișierele — orice worker gunicorn răspunde cu totalul. Fără METRICS_DIR
+se vede doar procesul care răspunde (ok pentru un singur worker). Fișierele
+worker-ilor opriți rămân (contoarele nu scad); golește directorul la deploy.
+
+Acces doar cu `Authorization: Bearer <METRICS_TOKEN>` (nu prin query string:
+ar ajunge în log-urile de acces și ale proxy-urilor). Fără METRICS_TOKEN,
+/metrics răspunde doar în modul debug.
+"""
+from __future__ import annotations
+
+import atexit
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from flask import Response, abort, current_app, g, request
+
+from .sqltrace import TimedConnection
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+SQL_STATEMENTS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+# nume -> (tip, help, bucket-uri); ordinea de aici e ordinea din /metrics
+METRICS = {
+    "sala_http_requests_total": ("counter", "Răspunsuri HTTP pe endpoint, metodă și status.", None),
+    "sala_http_request_duration_seconds": ("histogram", "Durata request-ului (până la ultimul octet pentru stream-uri).", LATENCY_BUCKETS),
+    "sala_sqlite_seconds": ("histogram", "Timp petrecut în SQLite per request.", SQL_SECONDS_BUCKETS),
+    "sala_sqlite_statements": ("histogram", "Instrucțiuni SQL executate per request.", SQL_STATEMENTS_BUCKETS),
+    "sala_sqlite_lock_errors_total": ("counter", "Erori database is locked / busy pe endpoint.", None),
+    "sala_checkin_attempts_total": ("counter", "Scanări de check-in pe motivul din attempt_log.", None),
+}
+
+BLUEPRINTS = ("main", "dirig")
+
+
+# ---------------------------------------------------------------------------
+# registrul per proces
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.counters: dict[tuple, float] = {}
+        # (nume, etichete) -> [numărători per bucket (+Inf la final), sumă]
+        self.histograms: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+
+    def inc(self, name: str, labels: dict, value: float = 1) -> None:
+        k = (name, _key(labels))
+        with self._lock:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float) -> None:
+        buckets = METRICS[name][2]
+        k = (name, _key(labels))
+        i = next((i for i, b in enumerate(buckets) if value <= b), len(buckets))
+        with self._lock:
+            h = self.histograms.get(k)
+            if h is None:
+                h = self.histograms[k] = [[0] * (len(buckets) + 1), 0.0]
+            h[0][i] += 1
+            h[1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [[n, list(map(list, lb)), v] for (n, lb), v in self.counters.items()],
+                "histograms": [[n, list(map(list, lb)), list(h[0]), h[1]] for (n, lb), h in self.histograms.items()],
+            }
+
+    def flush(self, directory: Path) -> None:
+        """Scrie snapshot-ul în metrics-<pid>.json (atomic, os.replace)."""
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".metrics-", suffix=".json", dir=directory)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, directory / f"metrics-{self.pid}.json")
+        self._flushed_at = time.monotonic()
+
+    def maybe_flush(self, directory: Path, every_s: float) -> None:
+        if time.monotonic() - self._flushed_at >= every_s:
+            try:
+                self.flush(directory)
+            except OSError as e:
+                log.warning("metrics: nu pot scrie în %s (%s)", directory, e)
+
+
+def _metrics_dir():
+    d = current_app.config.get("METRICS_DIR")
+    return Path(d) if d else None
+
+
+def get_registry() -> Registry:
+    """Registrul procesului curent (refăcut după fork, ca writer-ul attempt_log)."""
+    reg = current_app.extensions.get("sala_metrics")
+    if reg is None or reg.pid != os.getpid():
+        reg = Registry()
+        current_app.extensions["sala_metrics"] = reg
+        directory = _metrics_dir()
+        if directory is not None:
+            atexit.register(reg.maybe_flush, directory, 0)
+    return reg
+
+
+def count_attempt(reason: str, success: int) -> None:
+    """O scanare de check-in, cu motivul și succesul din rândul attempt_log."""
+    if current_app.config.get("METRICS_ENABLED"):
+        get_registry().inc("sala_checkin_attempts_total", {"reason": reason or "", "success": str(success)})
+
+
+# ---------------------------------------------------------------------------
+# agregare + format text
+
+def _merge(snapshots) -> tuple[dict, dict]:
+    counters: dict[tuple, float] = {}
+    histograms: dict[tuple, list] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", ()):
+            k = (name, tuple(map(tuple, labels)))
+            counters[k] = counters.get(k, 0) + value
+        for name, labels, counts, total in snap.get("histograms", ()):
+            k = (name, tuple(map(tuple, labels)))
+            h = histograms.get(k)
+            if h is None or len(h[0]) != len(counts):
+                histograms[k] = [list(counts), total]
+            else:
+                h[0] = [a + b for a, b in zip(h[0], counts)]
+                h[1] += total
+    return counters, histograms
+
+
+def _collect(reg: Registry) -> tuple[dict, dict]:
+    directory = _metrics_dir()
+    if directory is None:
+        return _merge([reg.snapshot()])
+    reg.flush(directory)
+    snaps = []
+    for path in sorted(directory.glob("metrics-*.json")):
+        try:
+            snaps.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue  # fișier pe cale de a fi înlocuit / al unui proces oprit în mijlocul scrierii
+    return _merge(snaps)
+
+
+def _esc(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render(counters: dict, histograms: dict) -> str:
+    out = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    out.append(f"{name}{_labels(labels)} {_num(v)}")
+            continue
+        for (n, labels), (counts, total) in sorted(histograms.items()):
+            if n != name:
+                continue
+            acc = 0
+            for le, c in zip([*map(str, buckets), "+Inf"], counts):
+                acc += c
+                out.append(f"{name}_bucket{_labels((*labels, ('le', le)))} {acc}")
+            out.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+            out.append(f"{name}_count{_labels(labels)} {acc}")
+    return "\n".join(out) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# hook-urile de request
+
+def _start():
+    if request.blueprint in BLUEPRINTS:
+        g.metrics_t0 = time.perf_counter()
+
+
+def _status(response):
+    if "metrics_t0" in g:
+        g.metrics_status = response.status_code
+    return response
+
+
+def _finish(exc=None):
+    """teardown_request: pentru stream-uri rulează după ultimul octet, cu g.db încă deschisă."""
+    t0 = g.pop("metrics_t0", None)
+    if t0 is None:
+        return
+    cfg = current_app.config
+    reg = get_registry()
+    labels = {"endpoint": request.endpoint, "method": request.method}
+    status = 500 if exc is not None else g.pop("metrics_status", 500)
+    reg.inc("sala_http_requests_total", {**labels, "status": str(status)})
+    reg.observe("sala_http_request_duration_seconds", labels, time.perf_counter() - t0)
+    conn = g.get("db")  # None dacă request-ul n-a deschis DB-ul: 0 s, 0 instrucțiuni
+    reg.observe("sala_sqlite_seconds", labels, getattr(conn, "sql_seconds", 0.0))
+    reg.observe("sala_sqlite_statements", labels, getattr(conn, "sql_statements", 0))
+    lock_errors = getattr(conn, "sql_lock_errors", 0)
+    if lock_errors:
+        reg.inc("sala_sqlite_lock_errors_total", {"endpoint": request.endpoint}, lock_errors)
+    directory = _metrics_dir()
+    if directory is not None:
+        reg.maybe_flush(directory, cfg.get("METRICS_FLUSH_S", 5))
+
+
+def metrics_view():
+    token = current_app.config.get("METRICS_TOKEN")
+    if not token:
+        if not current_app.debug:
+            abort(404)
+    else:
+        auth = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(auth.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            abort(403)
+    body = render(*_collect(get_registry()))
+    return Response(body, mimetype="text/plain; version=0.0.4; charset=utf-8",
+                    headers={"Cache-Control": "no-store"})
+
+
+def init_app(app) -> None:
+    if not app.config.get("METRICS_ENABLED"):
+        return
+    app.extensions["sala_db_factory"] = TimedConnection
+    app.before_request(_start)
+    app.after_request(_status)
+    app.teardown_request(_finish)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
@@ -0,0 +1,599 @@
+"""
+Migrări de schemă versionate, pe `PRAGMA user_version`.
+
+Fiecare pas are un număr; `migrate()` aplică în ordine doar pașii cu număr
+mai mare decât versiunea din fișier și scrie versiunea după fiecare pas
+reușit. Pașii sunt idempotenți (IF NOT EXISTS, coloane verificate în
+`table_xinfo`), așa că o bază creată de vechiul `init_db` (user_version = 0)
+trece prin toți fără erori și ajunge la aceeași schemă ca una nouă.
+
+Reconstruirile de tabele mari copiază în loturi (`batch_size` rânduri, câte o
+tranzacție scurtă per lot), cu progres afișat; scrierile concurente din timpul
+copierii sunt oglindite de triggere temporare, iar schimbul de tabele e o
+singură tranzacție scurtă. `dry_run=True` nu modifică nimic: raportează
+pașii în așteptare, câte rânduri ating și un timp estimat.
+
+Modulul nu importă `db` (db.init_db îl folosește), deci primește conexiunea.
+"""
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Estimare pentru dry-run când nu avem ce măsura (rânduri / secundă)
+DEFAULT_ROWS_PER_S = 50_000
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable                      # (conn, ctx) -> None
+    estimate: Optional[Callable] = None  # (conn) -> rânduri atinse; None = doar DDL
+    table: str = ""                      # tabela copiată / scanată (rata pentru dry-run)
+
+
+@dataclass
+class _Ctx:
+    batch_size: int
+    pause_s: float
+    echo: Callable[[str], None]
+
+
+# ---------------------------------------------------------------------------
+# utilitare
+
+def _table_sql(conn, table: str) -> Optional[str]:
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+    return row[0] if row else None
+
+
+def _columns(conn, table: str) -> set[str]:
+    # table_xinfo include și coloanele generate (table_info nu)
+    return {r[1] for r in conn.execute(f"PRAGMA table_xinfo({table})")}
+
+
+def _add_column(conn, table: str, column: str, decl: str) -> None:
+    if column not in _columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _count(conn, table: str) -> int:
+    if _table_sql(conn, table) is None:
+        return 0
+    return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def _copy_in_batches(conn, src: str, dst: str, cols: str, ctx: _Ctx) -> int:
+    """
+    Copiază src → dst în ordinea id-ului, câte `batch_size` rânduri per
+    tranzacție (BEGIN IMMEDIATE scurt: check-in-urile nu așteaptă după toată copierea).
+    """
+    total = _count(conn, src)
+    done, last_id = 0, 0
+    started = time.monotonic()
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT id FROM {src} WHERE id > ? ORDER BY id LIMIT ?", (last_id, ctx.batch_size)
+            ).fetchall()
+            if rows:
+                hi = rows[-1][0]
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {dst} ({cols}) SELECT {cols} FROM {src} WHERE id > ? AND id <= ?",
+                    (last_id, hi),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        done += len(rows)
+        ctx.echo(f"  {src}: {done}/{total} rânduri ({time.monotonic() - started:.1f}s)")
+        if ctx.pause_s:
+            time.sleep(ctx.pause_s)
+    return done
+
+
+def _rebuild_table(conn, table: str, create_new_sql: str, cols: str, ctx: _Ctx) -> None:
+    """
+    Reconstruiește `table` după `create_new_sql` (care creează `{table}_new`):
+      1. triggere care oglindesc în `_new` scrierile concurente pe `table`;
+      2. copiere în loturi;
+      3. schimb (drop + rename) într-o singură tranzacție scurtă.
+    Triggerele și indexurile vechii tabele dispar la DROP; pașii următori le recreează.
+    """
+    new = f"{table}_new"
+    conn.commit()
+    conn.execute(f"DROP TABLE IF EXISTS {new}")
+    conn.execute(create_new_sql)
+    conn.executescript(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_mig_{table}_ins AFTER INSERT ON {table}
+    BEGIN
+      INSERT OR REPLACE INTO {new} ({cols}) SELECT {cols} FROM {table} WHERE id = NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_mig_{table}_upd AFTER UPDATE ON {table}
+    BEGIN
+      INSERT OR REPLACE INTO {new} ({cols}) SELECT {cols} FROM {table} WHERE id = NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_mig_{table}_del AFTER DELETE ON {table}
+    BEGIN
+      DELETE FROM {new} WHERE id = OLD.id;
+    END;
+    """)
+
+    _copy_in_batches(conn, table, new, cols, ctx)
+
+    # foreign_keys nu se poate schimba în tranzacție; DROP cu FK activ ar șterge în cascadă
+    conn.execute("PRAGMA foreign_keys=OFF")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for op in ("ins", "upd", "del"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_mig_{table}_{op}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {new} RENAME TO {table}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA foreign_keys=ON")
+
+
+def _measure_rows_per_s(conn, table: str, sample: int = 2000) -> float:
+    """Cât de repede copiem rânduri din `table` pe discul ăsta (copie de probă în TEMP, anulată)."""
+    if _table_sql(conn, table) is None:
+        return DEFAULT_ROWS_PER_S
+    conn.commit()
+    t0 = time.perf_counter()
+    conn.execute("BEGIN")
+    try:
+        conn.execute(f"CREATE TEMP TABLE _mig_probe AS SELECT * FROM {table} LIMIT ?", (sample,))
+        n = conn.execute("SELECT count(*) FROM _mig_probe").fetchone()[0]
+    finally:
+        conn.rollback()
+    elapsed = time.perf_counter() - t0
+    if n < 100 or elapsed <= 0:
+        return DEFAULT_ROWS_PER_S
+    return n / elapsed
+
+
+# ---------------------------------------------------------------------------
+# pașii (nu se renumerotează; un pas nou primește numărul următor)
+
+def _m001_base_tables(conn, ctx):
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS class (
+        id TEXT PRIMARY KEY
+    );
+
+    CREATE TABLE IF NOT EXISTS authorized_code (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id TEXT NOT NULL REFERENCES class(id) ON DELETE CASCADE,
+        code4_hash TEXT NOT NULL,
+        UNIQUE(class_id, code4_hash)
+    );
+
+    CREATE TABLE IF NOT EXISTS session (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id TEXT NOT NULL REFERENCES class(id),
+        starts_at TEXT NOT NULL, -- ISO with TZ
+        ends_at   TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL REFERENCES session(id) ON DELETE CASCADE,
+        class_id TEXT NOT NULL,
+        code4_hash TEXT NOT NULL,
+        status TEXT NOT NULL CHECK (status IN ('neconfirmat','prezent','întârziat')),
+        check_in_at TEXT,
+        UNIQUE(session_id, code4_hash)
+    );
+
+    CREATE TABLE IF NOT EXISTS attempt_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL,
+        class_id TEXT NOT NULL,
+        device_id TEXT NOT NULL,
+        code4_hash TEXT,
+        success INTEGER NOT NULL,
+        reason TEXT,
+        ip TEXT,
+        user_agent TEXT,
+        ts TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS teacher (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      email TEXT NOT NULL UNIQUE,
+      password_hash TEXT NOT NULL,
+      class_id TEXT NOT NULL,
+      created_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_teacher_class ON teacher(class_id);
+
+    CREATE TABLE IF NOT EXISTS period (
+      period_no   INTEGER PRIMARY KEY,   -- 1..7
+      start_hhmm  TEXT NOT NULL          -- '08:00', '09:00', ...
+    );
+
+    CREATE TABLE IF NOT EXISTS schedule (
+      weekday    INTEGER NOT NULL,       -- 1=Luni .. 5=Vineri
+      period_no  INTEGER NOT NULL REFERENCES period(period_no),
+      class_id   TEXT NOT NULL,
+      PRIMARY KEY (weekday, period_no),
+      FOREIGN KEY (period_no) REFERENCES period(period_no)
+    );
+
+    -- Asigură unicitatea sesiunilor pe (class_id, starts_at)
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_session_class_start ON session(class_id, starts_at);
+    CREATE INDEX IF NOT EXISTS idx_session_starts ON session(starts_at);
+    CREATE INDEX IF NOT EXISTS idx_schedule_class ON schedule(class_id);
+    """)
+
+
+def _m002_added_columns(conn, ctx):
+    _add_column(conn, "attendance", "check_out_at", "TEXT")
+    # dispozitivul care a făcut check-in (anti-fraud: un device = un cod / oră)
+    _add_column(conn, "attendance", "device_id", "TEXT")
+    # session.rev la ultima schimbare a rândului (cursor pentru delte pe monitor)
+    _add_column(conn, "attendance", "rev", "INTEGER")
+    # codul în clar, afișat pe monitor și în raport
+    _add_column(conn, "authorized_code", "code4_plain", "TEXT")
+    # durata fiecărui slot (NULL = 60 min)
+    _add_column(conn, "period", "length_min", "INTEGER")
+    # versiunea sesiunii: crește la fiecare check-in / check-out (cache monitor)
+    _add_column(conn, "session", "rev", "INTEGER NOT NULL DEFAULT 0")
+    # freeze la închiderea check-in-ului; closed_at după fereastra de check-out (lifecycle)
+    _add_column(conn, "session", "present_frozen", "INTEGER")
+    _add_column(conn, "session", "present_frozen_at", "TEXT")
+    _add_column(conn, "session", "closed_at", "TEXT")
+
+
+def _m003_state_tables(conn, ctx):
+    conn.executescript("""
+    -- Zile fără ore (vacanțe, sărbători legale)
+    CREATE TABLE IF NOT EXISTS holiday (
+      day   TEXT PRIMARY KEY,            -- 'YYYY-MM-DD'
+      note  TEXT
+    ) WITHOUT ROWID;
+
+    -- Chei mici de stare (ex. timetable_version: crește la orice schimbare de orar)
+    CREATE TABLE IF NOT EXISTS meta (
+      key    TEXT PRIMARY KEY,
+      value  INTEGER NOT NULL
+    ) WITHOUT ROWID;
+
+    -- Rate limit partajat între worker-i (RATE_LIMIT_BACKEND=sqlite)
+    CREATE TABLE IF NOT EXISTS rate_limit_bucket (
+      key        TEXT PRIMARY KEY,       -- 'session_id:device_id'
+      tokens     REAL NOT NULL,
+      updated_at REAL NOT NULL           -- epoch secunde
+    ) WITHOUT ROWID;
+    """)
+
+
+_ATTENDANCE_COLS = "id, session_id, class_id, code4_hash, status, check_in_at, check_out_at, device_id, rev"
+
+
+def _attendance_needs_rebuild(conn) -> bool:
+    return "plecat" not in (_table_sql(conn, "attendance") or "plecat")
+
+
+def _m004_attendance_plecat(conn, ctx):
+    """CHECK-ul vechi nu acceptă status='plecat': tabela se reconstruiește (o singură dată)."""
+    if not _attendance_needs_rebuild(conn):
+        return
+    _rebuild_table(conn, "attendance", """
+        CREATE TABLE attendance_new (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER NOT NULL,
+            class_id TEXT NOT NULL,
+            code4_hash TEXT,
+            status TEXT NOT NULL CHECK (status IN ('neconfirmat','prezent','întârziat','plecat')),
+            check_in_at TEXT,
+            check_out_at TEXT,
+            device_id TEXT,
+            rev INTEGER,
+            UNIQUE(session_id, code4_hash)
+        )
+    """, _ATTENDANCE_COLS, ctx)
+
+
+def _m004_estimate(conn) -> int:
+    return _count(conn, "attendance") if _attendance_needs_rebuild(conn) else 0
+
+
+def _epoch_sql(col: str) -> str:
+    """
+    ISO_FMT ('2025-09-23T10:00:00+0200', acceptă și '+02:00') → secunde UTC, în SQL.
+    strftime('%s') citește ora locală ca UTC; scădem offset-ul din string.
+    """
+    return (f"(CAST(strftime('%s', substr({col}, 1, 19)) AS INTEGER)"
+            f" - (CASE substr({col}, 20, 1) WHEN '+' THEN 1 WHEN '-' THEN -1 ELSE 0 END)"
+            f" * (substr({col}, 21, 2) * 3600 + substr({col}, -2, 2) * 60))")
+
+
+_EPOCH_COLUMNS = (
+    ("session", "starts_epoch", "starts_at"),
+    ("session", "ends_epoch", "ends_at"),
+    ("attendance", "check_in_epoch", "check_in_at"),
+    ("attendance", "check_out_epoch", "check_out_at"),
+    ("attempt_log", "ts_epoch", "ts"),
+)
+
+
+def _m005_epoch_columns(conn, ctx):
+    """
+    Coloane INTEGER (secunde UTC) lângă fiecare timestamp ISO. Sunt coloane
+    generate (VIRTUAL): se calculează din textul ISO la fiecare scriere, deci
+    nu cer backfill și nu pot rămâne în urmă pe niciun drum de scriere; indexurile
+    le stochează. Intervalele pe ele sunt corecte și peste schimbarea de oră
+    (+0300 → +0200), unde ordinea string-urilor nu mai e cronologică.
+    """
+    for table, col, source in _EPOCH_COLUMNS:
+        _add_column(conn, table, col, f"INTEGER GENERATED ALWAYS AS ({_epoch_sql(source)}) VIRTUAL")
+    conn.executescript("""
+    CREATE INDEX IF NOT EXISTS idx_session_class_starts_epoch ON session(class_id, starts_epoch);
+    CREATE INDEX IF NOT EXISTS idx_session_starts_epoch ON session(starts_epoch);
+
+    -- scanări în raport: interval pe clasă, paginat keyset (ts_epoch, id); filtru pe dispozitiv
+    DROP INDEX IF EXISTS idx_attempt_class_ts;
+    DROP INDEX IF EXISTS idx_attempt_class_device_ts;
+    CREATE INDEX IF NOT EXISTS idx_attempt_class_ts_epoch ON attempt_log(class_id, ts_epoch, id);
+    CREATE INDEX IF NOT EXISTS idx_attempt_class_device_ts_epoch ON attempt_log(class_id, device_id, ts_epoch, id);
+    """)
+
+
+def _m005_estimate(conn) -> int:
+    # indexurile noi citesc sesiunile și tot attempt_log-ul
+    return _count(conn, "session") + _count(conn, "attempt_log")
+
+
+# statusul final al unui rând din attendance (la fel ca în raport)
+_FINAL = "(CASE WHEN {r}.check_out_at IS NOT NULL THEN 'plecat' ELSE {r}.status END)"
+
+
+def _in_roster(r: str) -> str:
+    return (f"EXISTS (SELECT 1 FROM authorized_code ac"
+            f" WHERE ac.class_id = {r}.class_id AND ac.code4_hash = {r}.code4_hash)")
+
+
+def _counts_delta(r: str, sign: str) -> str:
+    f = _FINAL.format(r=r)
+    return (f"prezenti = prezenti {sign} ({f} = 'prezent'),"
+            f" intarziati = intarziati {sign} ({f} = 'întârziat'),"
+            f" plecati = plecati {sign} ({f} = 'plecat')")
+
+
+def _roster_delta(sign: str) -> str:
+    """Un cod adăugat / scos din lista clasei: roster ±1 și rândurile lui din attendance."""
+    counts = ", ".join(
+        f"{col} = {col} {sign} (SELECT count(*) FROM attendance a WHERE a.session_id = session_summary.session_id"
+        f" AND a.code4_hash = {{r}}.code4_hash AND {_FINAL.format(r='a')} = '{st}')"
+        for col, st in (("prezenti", "prezent"), ("intarziati", "întârziat"), ("plecati", "plecat"))
+    )
+    return f"roster = roster {sign} 1, {counts}"
+
+
+SUMMARY_ROWS_SQL = f"""
+    SELECT s.id, count(ac.id),
+           coalesce(sum({_FINAL.format(r='a')} = 'prezent'), 0),
+           coalesce(sum({_FINAL.format(r='a')} = 'întârziat'), 0),
+           coalesce(sum({_FINAL.format(r='a')} = 'plecat'), 0)
+    FROM session s
+    LEFT JOIN authorized_code ac ON ac.class_id = s.class_id
+    LEFT JOIN attendance a ON a.session_id = s.id AND a.code4_hash = ac.code4_hash
+"""
+
+
+def _m006_session_summary(conn, ctx):
+    """
+    session_summary: contoarele raportului per sesiune, ținute la zi de
+    triggere în aceeași tranzacție cu check-in / check-out / importul de coduri.
+    neconfirmat = roster - prezenti - intarziati - plecati.
+    """
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS session_summary (
+      session_id  INTEGER PRIMARY KEY REFERENCES session(id) ON DELETE CASCADE,
+      roster      INTEGER NOT NULL DEFAULT 0,   -- coduri autorizate ale clasei
+      prezenti    INTEGER NOT NULL DEFAULT 0,
+      intarziati  INTEGER NOT NULL DEFAULT 0,
+      plecati     INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_session_ins AFTER INSERT ON session
+    BEGIN
+      INSERT OR IGNORE INTO session_summary(session_id, roster)
+      VALUES (NEW.id, (SELECT count(*) FROM authorized_code WHERE class_id = NEW.class_id));
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_session_del AFTER DELETE ON session
+    BEGIN
+      DELETE FROM session_summary WHERE session_id = OLD.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_att_ins AFTER INSERT ON attendance
+    WHEN {_in_roster('NEW')}
+    BEGIN
+      UPDATE session_summary SET {_counts_delta('NEW', '+')} WHERE session_id = NEW.session_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_att_upd AFTER UPDATE OF status, check_out_at ON attendance
+    WHEN {_in_roster('NEW')}
+    BEGIN
+      UPDATE session_summary SET {_counts_delta('OLD', '-')} WHERE session_id = OLD.session_id;
+      UPDATE session_summary SET {_counts_delta('NEW', '+')} WHERE session_id = NEW.session_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_att_del AFTER DELETE ON attendance
+    WHEN {_in_roster('OLD')}
+    BEGIN
+      UPDATE session_summary SET {_counts_delta('OLD', '-')} WHERE session_id = OLD.session_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_code_ins AFTER INSERT ON authorized_code
+    BEGIN
+      UPDATE session_summary SET {_roster_delta('+').format(r='NEW')}
+      WHERE session_id IN (SELECT id FROM session WHERE class_id = NEW.class_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_summary_code_del AFTER DELETE ON authorized_code
+    BEGIN
+      UPDATE session_summary SET {_roster_delta('-').format(r='OLD')}
+      WHERE session_id IN (SELECT id FROM session WHERE class_id = OLD.class_id);
+    END;
+    """)
+    # sesiuni create înainte de tabelă (upgrade): le completăm în loturi de sesiuni
+    total = _m006_estimate(conn)
+    done, last_id = 0, 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            hi = conn.execute(
+                "SELECT max(id) FROM (SELECT id FROM session WHERE id > ? ORDER BY id LIMIT ?)",
+                (last_id, ctx.batch_size),
+            ).fetchone()[0]
+            if hi is not None:
+                cur = conn.execute(f"""
+                    INSERT INTO session_summary(session_id, roster, prezenti, intarziati, plecati)
+                    {SUMMARY_ROWS_SQL}
+                    WHERE s.id > ? AND s.id <= ? AND s.id NOT IN (SELECT session_id FROM session_summary)
+                    GROUP BY s.id
+                """, (last_id, hi))
+                done += cur.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if hi is None:
+            break
+        last_id = hi
+        if total:
+            ctx.echo(f"  session_summary: {done}/{total} sesiuni")
+        if ctx.pause_s:
+            time.sleep(ctx.pause_s)
+
+
+def _m006_estimate(conn) -> int:
+    if _table_sql(conn, "session_summary") is None:
+        return _count(conn, "session")
+    return conn.execute(
+        "SELECT count(*) FROM session WHERE id NOT IN (SELECT session_id FROM session_summary)"
+    ).fetchone()[0]
+
+
+def _m007_hot_indexes(conn, ctx):
+    """
+    Indexuri pentru interogările de pe calea fierbinte (verificate de `flask check-query-plans`).
+    attendance(session_id) și authorized_code(class_id, code4_hash) sunt deja acoperite de UNIQUE.
+    """
+    conn.executescript("""
+    -- anti-fraud la check-in: același dispozitiv pe alt cod în sesiune
+    CREATE INDEX IF NOT EXISTS idx_attendance_session_device ON attendance(session_id, device_id);
+    -- delta monitorului: rândurile schimbate după cursorul (session.rev) clientului
+    CREATE INDEX IF NOT EXISTS idx_attendance_session_rev ON attendance(session_id, rev);
+    -- lista codurilor clasei în ordinea importului (ORDER BY id fără sortare)
+    CREATE INDEX IF NOT EXISTS idx_code_class ON authorized_code(class_id);
+    """)
+
+
+def _m007_estimate(conn) -> int:
+    return _count(conn, "attendance") + _count(conn, "authorized_code")
+
+
+def _m008_attempt_retention(conn, ctx):
+    """Agregatele zilnice ale scanărilor și evidența zilelor arhivate (vezi retention)."""
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS attempt_daily (
+      day       TEXT NOT NULL,               -- 'YYYY-MM-DD' (ora locală)
+      class_id  TEXT NOT NULL,
+      reason    TEXT NOT NULL,
+      success   INTEGER NOT NULL,
+      attempts  INTEGER NOT NULL,
+      devices   INTEGER NOT NULL,            -- dispozitive distincte în ziua respectivă
+      PRIMARY KEY (day, class_id, reason, success)
+    ) WITHOUT ROWID;
+
+    -- o zi din attempt_log mutată în arhiva lunii ei; rândurile cu id <= max_id se pot șterge
+    CREATE TABLE IF NOT EXISTS attempt_log_archive (
+      day          TEXT PRIMARY KEY,
+      archive      TEXT NOT NULL,            -- numele fișierului (attempt_log-YYYY-MM.sqlite.gz)
+      rows         INTEGER NOT NULL,
+      max_id       INTEGER NOT NULL,
+      archived_at  TEXT NOT NULL
+    ) WITHOUT ROWID;
+
+    -- retenția caută rândurile vechi după timp, indiferent de clasă
+    CREATE INDEX IF NOT EXISTS idx_attempt_ts_epoch ON attempt_log(ts_epoch);
+    """)
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "tabele de bază", _m001_base_tables),
+    Migration(2, "coloane adăugate ulterior", _m002_added_columns),
+    Migration(3, "holiday, meta, rate_limit_bucket", _m003_state_tables),
+    Migration(4, "attendance acceptă status 'plecat'", _m004_attendance_plecat, _m004_estimate, "attendance"),
+    Migration(5, "coloane epoch (secunde UTC) + indexuri", _m005_epoch_columns, _m005_estimate, "attempt_log"),
+    Migration(6, "session_summary + triggere", _m006_session_summary, _m006_estimate, "session"),
+    Migration(7, "indexuri pentru interogările fierbinți", _m007_hot_indexes, _m007_estimate, "attendance"),
+    Migration(8, "retenție attempt_log (agregate zilnice, arhive)", _m008_attempt_retention,
+              lambda conn: _count(conn, "attempt_log"), "attempt_log"),
+)
+
+LATEST = MIGRATIONS[-1].version
+
+
+# ---------------------------------------------------------------------------
+# motorul
+
+def current_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending(conn) -> list[Migration]:
+    v = current_version(conn)
+    return [m for m in MIGRATIONS if m.version > v]
+
+
+def plan(conn) -> list[dict]:
+    """Dry-run: pașii în așteptare, cu rândurile atinse și timpul estimat. Nu scrie nimic."""
+    rates: dict[str, float] = {}
+    out = []
+    for m in pending(conn):
+        rows = m.estimate(conn) if m.estimate else 0
+        if rows:
+            if m.table not in rates:
+                rates[m.table] = _measure_rows_per_s(conn, m.table)
+            est_s = rows / rates[m.table]
+        else:
+            est_s = 0.0
+        out.append({"version": m.version, "name": m.name, "rows": rows, "est_s": est_s})
+    return out
+
+
+def migrate(conn, *, batch_size: int = 5000, pause_s: float = 0.0,
+            echo: Optional[Callable[[str], None]] = None) -> list[Migration]:
+    """
+    Aduce schema la LATEST. Întoarce pașii aplicați (listă goală dacă era la zi).
+    Versiunea se scrie după fiecare pas; o întrerupere reia de la pasul neterminat.
+    """
+    echo = echo or (lambda msg: None)
+    ctx = _Ctx(batch_size=max(1, batch_size), pause_s=pause_s, echo=echo)
+    applied = []
+    for m in pending(conn):
+        echo(f"[{m.version}] {m.name}")
+        t0 = time.monotonic()
+        m.apply(conn, ctx)
+        conn.commit()
+        # PRAGMA nu acceptă parametri; versiunea e un int din MIGRATIONS
+        conn.execute(f"PRAGMA user_version = {int(m.version)}")
+        conn.commit()
+        echo(f"[{m.version}] gata în {time.monotonic() - t0:.2f}s")
+        applied.append(m)
+    return applied
@@ -0,0 +1,53 @@
+"""
+Cache în proces pentru răspunsurile /api/monitor_status.
+
+Un snapshot e valid cât timp cheia lui nu se schimbă: versiunea sesiunii
+(`session.rev`, incrementată de check-in / check-out / import coduri),
+snapshot-ul înghețat, faza ferestrei și minutul afișat pe ceas. Din aceeași
+cheie se calculează ETag-ul, deci un 304 nu construiește deloc payload-ul.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class SnapshotCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._items: OrderedDict[int, tuple[tuple, dict, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag_for(session_id: int, key: tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        return f"{session_id}-{digest}"
+
+    def get(self, session_id: int, key: tuple):
+        """(payload, etag) dacă snapshot-ul e încă valid pentru `key`, altfel None."""
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or item[0] != key:
+                return None
+            self._items.move_to_end(session_id)
+            return item[1], item[2]
+
+    def put(self, session_id: int, key: tuple, payload: dict) -> str:
+        etag = self.etag_for(session_id, key)
+        with self._lock:
+            self._items[session_id] = (key, payload, etag)
+            self._items.move_to_end(session_id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return etag
+
+
+def get_snapshot_cache() -> SnapshotCache:
+    cache = current_app.extensions.get("sala_monitor_cache")
+    if cache is None:
+        cache = SnapshotCache()
+        current_app.extensions["sala_monitor_cache"] = cache
+    return cache
@@ -0,0 +1,185 @@
+"""
+Profilarea la cerere a unui singur request, în producție, fără redeploy.
+
+Orice rută se poate rula sub cProfile și/sau tracemalloc cu header-ul
+`X-Profile: cpu` (sau `mem`, `cpu,mem`) ori `?_profile=cpu`. Acces:
+  - `X-Profile-Key: <PROFILE_SECRET>` (secretul din .env; doar header: query
+    string-ul ajunge în log-urile de acces și ale proxy-urilor), sau
+  - o sesiune de diriginte validă (opt-in: PROFILE_ALLOW_TEACHER=true).
+Fără acces, request-ul rulează normal, neprofilat.
+
+Rezultatul ajunge în PROFILE_DIR (implicit instance/profiles):
+`<timp>-<endpoint>-<pid>.prof` (pstats, pentru snakeviz / `python -m pstats`)
+plus un `.txt` cu primele funcții după timpul cumulat și alocările top.
+Rezumatul e în header-ul `X-Profile-Result` și în log. Pentru răspunsurile
+stream (export ZIP, SSE) profilul se închide după ultimul octet, deci doar în log.
+
+Un singur request profilat odată per proces (tracemalloc e global);
+se păstrează ultimele PROFILE_KEEP fișiere.
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app, g, request
+
+log = logging.getLogger(__name__)
+
+MODES = {"cpu", "mem"}
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+_busy = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, modes: set[str]):
+        self.modes = modes
+        self.profiler = cProfile.Profile() if "cpu" in modes else None
+        self.started = time.perf_counter()
+        self.own_tracemalloc = False
+
+    def start(self) -> None:
+        if "mem" in self.modes:
+            if not tracemalloc.is_tracing():  # ex. PYTHONTRACEMALLOC: nu-l oprim noi
+                tracemalloc.start(10)
+                self.own_tracemalloc = True
+            tracemalloc.reset_peak()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self, directory: Path, name: str) -> str:
+        """Oprește, scrie fișierele și întoarce rezumatul de o linie."""
+        if self.profiler is not None:
+            self.profiler.disable()
+        wall_ms = (time.perf_counter() - self.started) * 1000
+        snapshot, peak = None, 0
+        if "mem" in self.modes:
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self.own_tracemalloc:
+                tracemalloc.stop()
+
+        directory.mkdir(parents=True, exist_ok=True)
+        base = directory / name
+        parts = [f"wall={wall_ms:.1f}ms"]
+        report = io.StringIO()
+        report.write(f"{request.method} {request.path}\n\n")
+        if self.profiler is not None:
+            self.profiler.dump_stats(f"{base}.prof")
+            stats = pstats.Stats(self.profiler, stream=report)
+            parts.append(f"cpu={stats.total_tt * 1000:.1f}ms calls={stats.total_calls}")
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        if snapshot is not None:
+            parts.append(f"mem_peak={peak / 1024 / 1024:.1f}MB")
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ))
+            report.write(f"tracemalloc: vârf {peak / 1024:.0f} KiB\n")
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                report.write(f"  {stat}\n")
+        Path(f"{base}.txt").write_text(report.getvalue(), encoding="utf-8")
+        parts.append(f"file={name}")
+        return " ".join(parts)
+
+
+def profile_dir() -> Path:
+    cfg_dir = current_app.config.get("PROFILE_DIR")
+    return Path(cfg_dir) if cfg_dir else Path(current_app.instance_path) / "profiles"
+
+
+def _requested_modes() -> set[str]:
+    raw = (request.headers.get("X-Profile") or request.args.get("_profile") or "").strip().lower()
+    if raw in {"1", "true"}:
+        return {"cpu"}
+    if raw == "all":
+        return set(MODES)
+    return {m.strip() for m in raw.split(",")} & MODES
+
+
+def _authorized() -> bool:
+    cfg = current_app.config
+    secret = cfg.get("PROFILE_SECRET")
+    given = request.headers.get("X-Profile-Key")
+    if secret and given and hmac.compare_digest(secret.encode("utf-8"), given.encode("utf-8")):
+        return True
+    if cfg.get("PROFILE_ALLOW_TEACHER"):
+        if "teacher" not in g:
+            from .auth import load_current_teacher
+            load_current_teacher()
+        return bool(g.teacher)
+    return False
+
+
+def _prune(directory: Path, keep: int) -> None:
+    files = sorted(directory.glob("*.prof")) + sorted(directory.glob("*.txt"))
+    stems = sorted({f.stem for f in files})
+    for stem in stems[:-keep] if keep > 0 else ():
+        for suffix in (".prof", ".txt"):
+            try:
+                (directory / f"{stem}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _start():
+    modes = _requested_modes()
+    if not modes or not _authorized():
+        return
+    if not _busy.acquire(blocking=False):
+        g.profile_busy = True
+        return
+    prof = RequestProfile(modes)
+    g.request_profile = prof
+    prof.start()
+
+
+def _finish() -> str | None:
+    prof = g.pop("request_profile", None)
+    if prof is None:
+        return None
+    try:
+        endpoint = re.sub(r"[^\w.-]", "_", request.endpoint or "404")
+        now = datetime.now()
+        name = f"{now:%Y%m%d-%H%M%S}-{now.microsecond // 1000:03d}-{endpoint}-{os.getpid()}"
+        summary = prof.stop(profile_dir(), name)
+        _prune(profile_dir(), current_app.config.get("PROFILE_KEEP", 50))
+    except Exception:
+        log.exception("profil eșuat")
+        return None
+    finally:
+        _busy.release()
+    log.warning("profile %s %s: %s", request.method, request.path, summary)
+    return summary
+
+
+def _after(response):
+    if g.pop("profile_busy", False):
+        response.headers["X-Profile-Result"] = "busy"
+    elif "request_profile" in g and not response.is_streamed:
+        summary = _finish()
+        if summary:
+            response.headers["X-Profile-Result"] = summary
+    return response
+
+
+def _teardown(exc=None):
+    _finish()  # răspunsuri stream / excepții
+
+
+def init_app(app) -> None:
+    app.before_request(_start)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
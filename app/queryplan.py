@@ -0,0 +1,218 @@
+"""
+Verificarea planurilor de execuție pentru interogările aplicației.
+
+`check_query_plans()` construiește o bază sintetică de mărime realistă (un
+semestru de ore pentru câteva zeci de clase), rulează pe ea fluxurile reale
+(monitor, check-in / check-out, raportul dirigintelui, ciclul de viață) cu un
+trace pe conexiune și apoi face `EXPLAIN QUERY PLAN` pe fiecare interogare
+distinctă văzută. Orice `SCAN` pe o tabelă (citire completă, cu sau fără
+index) e raportat ca regresie, cu fișierul:linia care a emis interogarea.
+
+Interogările se colectează din cod, nu dintr-o listă ținută de mână: o
+interogare nouă sau modificată intră automat în verificare.
+Rulare: `flask check-query-plans` (cod de ieșire 1 la regresie).
+"""
+from __future__ import annotations
+
+import random
+import sqlite3
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from werkzeug.security import generate_password_hash
+
+from . import migrations
+from .db import ISO_FMT, _hash_code
+from .sqltrace import SKIP_PREFIXES, app_caller, explain, normalize_sql
+
+_TEACHER_PASSWORD = "plan-check"
+
+
+@dataclass
+class Statement:
+    sql: str                 # prima instanță, cu valorile expandate
+    where: str               # fișier:linie din app/ care a emis-o
+    plan: list[str] = field(default_factory=list)
+    scans: list[str] = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# baza sintetică
+
+def build_synthetic_db(path: Path, tz, *, classes: int = 24, roster: int = 28, days: int = 120,
+                       now: datetime | None = None, seed: int = 1) -> dict:
+    """
+    Schema curentă (migrări) + date: `classes` clase × `roster` coduri, câte o oră pe zi
+    lucrătoare per clasă pe ultimele `days` zile, attendance și attempt_log pe fiecare.
+    Plus trei sesiuni azi, în jurul lui `now`: check-in activ, check-out activ și una
+    după T+10 încă neînghețată. Întoarce id-urile utile fluxurilor.
+    """
+    rnd = random.Random(seed)
+    now = now or datetime.now(tz)
+    conn = sqlite3.connect(path.as_posix())
+    conn.execute("PRAGMA journal_mode=WAL")
+    migrations.migrate(conn)
+
+    class_ids = [f"C{i:02d}" for i in range(1, classes + 1)]
+    codes = {c: [f"{rnd.randrange(10000):04d}" for _ in range(roster)] for c in class_ids}
+    for c in class_ids:
+        codes[c] = list(dict.fromkeys(codes[c]))
+    conn.executemany("INSERT INTO class(id) VALUES (?)", [(c,) for c in class_ids])
+    conn.executemany(
+        "INSERT INTO authorized_code(class_id, code4_hash, code4_plain) VALUES (?,?,?)",
+        [(c, _hash_code(c, code), code) for c in class_ids for code in codes[c]],
+    )
+    conn.executemany("INSERT INTO period(period_no, start_hhmm, length_min) VALUES (?,?,?)",
+                     [(p, f"{7 + p:02d}:00", 50) for p in range(1, 8)])
+    conn.executemany("INSERT INTO schedule(weekday, period_no, class_id) VALUES (?,?,?)",
+                     [(wd, p, class_ids[(wd * 7 + p) % classes]) for wd in range(1, 6) for p in range(1, 8)])
+
+    sessions = []
+    start_day = (now - timedelta(days=days)).date()
+    for d in range(days):
+        day = start_day + timedelta(days=d)
+        if day.weekday() >= 5:
+            continue
+        for i, c in enumerate(class_ids):
+            starts = datetime(day.year, day.month, day.day, 8 + i % 7, 0, tzinfo=tz)
+            sessions.append((c, starts.strftime(ISO_FMT), (starts + timedelta(minutes=50)).strftime(ISO_FMT)))
+    conn.executemany("INSERT INTO session(class_id, starts_at, ends_at) VALUES (?,?,?)", sessions)
+    conn.execute("UPDATE session SET present_frozen = 0, present_frozen_at = starts_at, closed_at = ends_at")
+
+    att, log = [], []
+    for sid, c, starts_at in conn.execute("SELECT id, class_id, starts_at FROM session").fetchall():
+        base = datetime.strptime(starts_at, ISO_FMT)
+        for n, code in enumerate(codes[c]):
+            h = _hash_code(c, code)
+            ts = (base + timedelta(seconds=rnd.randrange(-300, 600))).strftime(ISO_FMT)
+            if rnd.random() < 0.9:
+                out = (base + timedelta(minutes=49)).strftime(ISO_FMT) if rnd.random() < 0.7 else None
+                att.append((sid, c, h, "prezent" if ts <= starts_at else "întârziat", ts, out, f"dev-{c}-{n}", n + 1))
+            log.append((sid, c, f"dev-{c}-{n}", h, 1, "ok", "10.0.0.1", "Mozilla/5.0", ts))
+            if rnd.random() < 0.1:
+                log.append((sid, c, f"dev-{c}-{n}", h, 0, "duplicate-code", "10.0.0.1", "Mozilla/5.0", ts))
+    conn.executemany(
+        "INSERT INTO attendance(session_id, class_id, code4_hash, status, check_in_at, check_out_at, device_id, rev)"
+        " VALUES (?,?,?,?,?,?,?,?)", att)
+    conn.executemany(
+        "INSERT INTO attempt_log(session_id, class_id, device_id, code4_hash, success, reason, ip, user_agent, ts)"
+        " VALUES (?,?,?,?,?,?,?,?,?)", log)
+
+    live = {}
+    for name, c, offset in (("active", class_ids[0], -1), ("end", class_ids[1], -48), ("unfrozen", class_ids[2], -20)):
+        starts = (now + timedelta(minutes=offset)).replace(microsecond=0)
+        cur = conn.execute("INSERT INTO session(class_id, starts_at, ends_at) VALUES (?,?,?)",
+                           (c, starts.strftime(ISO_FMT), (starts + timedelta(minutes=50)).strftime(ISO_FMT)))
+        live[name] = (cur.lastrowid, c)
+    conn.execute("INSERT INTO teacher(email, password_hash, class_id, created_at) VALUES (?,?,?,?)",
+                 ("plan@check", generate_password_hash(_TEACHER_PASSWORD), class_ids[0], now.strftime(ISO_FMT)))
+    conn.commit()
+    conn.close()
+    return {"live": live, "codes": codes, "from": start_day.isoformat(), "to": now.date().isoformat(),
+            "sessions": len(sessions), "attendance": len(att), "attempts": len(log)}
+
+
+# ---------------------------------------------------------------------------
+# fluxurile
+
+def _run_workload(app, info):
+    from .attempt_log import flush_attempt_log
+    from .lifecycle import LifecycleScheduler
+    from .utils import get_qr_serializer
+
+    c = app.test_client()
+    qr = get_qr_serializer(app)
+    (active, a_cls), (end, e_cls), (unfrozen, _) = info["live"]["active"], info["live"]["end"], info["live"]["unfrozen"]
+
+    def post(token, code, device):
+        c.post("/elev", data={"token": token, "d1": code[0], "d2": code[1], "d3": code[2], "d4": code[3],
+                              "device_id": device})
+
+    # monitor: snapshot complet, delta după cursor, fallback fără freeze, sesiunea curentă din orar
+    c.get(f"/monitor?session_id={active}")
+    c.get("/monitor")
+    j = c.get(f"/api/monitor_status?session_id={active}").get_json()
+    c.get(f"/api/monitor_status?session_id={unfrozen}")
+
+    start_tok = qr.dumps({"session_id": active, "phase": "start"})
+    c.get(f"/elev?token={start_tok}")
+    first, second = info["codes"][a_cls][:2]
+    post(start_tok, first, "dev-a")
+    post(start_tok, first, "dev-a")         # cod deja folosit
+    post(start_tok, second, "dev-a")        # același dispozitiv, alt cod
+    post(start_tok, "0000", "dev-x")        # cod necunoscut
+    if j and j.get("cursor"):
+        c.get(f"/api/monitor_status?session_id={active}&since={j['cursor']}")
+
+    end_tok = qr.dumps({"session_id": end, "phase": "end"})
+    post(qr.dumps({"session_id": end, "phase": "start"}), info["codes"][e_cls][0], "dev-e")
+    post(end_tok, info["codes"][e_cls][0], "dev-e")
+    post(end_tok, info["codes"][e_cls][1], "dev-f")   # check-out fără check-in
+
+    flush_attempt_log(app)
+
+    # raportul dirigintelui pe tot intervalul
+    c.post("/diriginti/login", data={"email": "plan@check", "password": _TEACHER_PASSWORD})
+    rng = f"from={info['from']}&to={info['to']}"
+    c.get(f"/diriginti/raport?{rng}")
+    page = c.get(f"/diriginti/api/attempts?{rng}&limit=50").get_json() or {}
+    if page.get("next"):
+        c.get(f"/diriginti/api/attempts?{rng}&limit=50&after={page['next']}")
+    c.get(f"/diriginti/api/attempts?{rng}&reason=duplicate-code")
+    c.get(f"/diriginti/api/attempts?{rng}&device=dev-{a_cls}-1")
+    c.get(f"/diriginti/api/attempts?{rng}&success=0")
+    c.get(f"/diriginti/export?{rng}").get_data()
+
+    # ciclul de viață: crearea sesiunilor zilei + freeze / închidere
+    app.config["AUTO_SESSIONS_ENABLED"] = True
+    LifecycleScheduler(app).run_once()
+
+
+def check_query_plans(*, classes: int = 24, roster: int = 28, days: int = 120,
+                      keep: Path | None = None, echo=print) -> list[Statement]:
+    """Construiește baza, rulează fluxurile și întoarce interogările distincte cu planurile lor."""
+    from . import create_app
+
+    tmp = None
+    if keep is None:
+        tmp = tempfile.TemporaryDirectory(prefix="sala-plans-")
+        path = Path(tmp.name) / "plans.db"
+    else:
+        path = Path(keep)
+        if path.exists():
+            path.unlink()
+
+    try:
+        app = create_app()
+        app.config.update(TESTING=True, DATABASE_URL=f"sqlite:///{path.as_posix()}",
+                          RATE_LIMIT_BACKEND="sqlite", AUTO_SESSIONS_ENABLED=False)
+        app.config.setdefault("ASSET_VER", "plan")
+        info = build_synthetic_db(path, app.config["TZ"], classes=classes, roster=roster, days=days)
+        echo(f"Bază sintetică: {info['sessions']} sesiuni, {info['attendance']} attendance, "
+             f"{info['attempts']} attempt_log")
+
+        seen: dict[str, Statement] = {}
+
+        def trace(sql):
+            if sql.lstrip().upper().startswith(SKIP_PREFIXES):
+                return
+            key = normalize_sql(sql)
+            if key not in seen:
+                seen[key] = Statement(sql=sql, where=app_caller())
+
+        app.extensions["sala_db_connect_hooks"] = [lambda conn: conn.set_trace_callback(trace)]
+        _run_workload(app, info)
+        app.extensions["sala_db_connect_hooks"] = []
+
+        conn = sqlite3.connect(path.as_posix())
+        try:
+            for st in seen.values():
+                st.plan, st.scans = explain(conn, st.sql)
+        finally:
+            conn.close()
+        return list(seen.values())
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
@@ -0,0 +1,86 @@
+"""
+Rate limit pentru scanări: token bucket per cheie (session_id, device_id).
+
+Verificarea costă O(1) indiferent cât de mare e attempt_log:
+  - backend "memory": dict ordonat în proces, cu evacuare TTL;
+  - backend "sqlite": tabela mică `rate_limit_bucket`, comună tuturor
+    worker-ilor gunicorn (se actualizează în tranzacția check-in-ului).
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class RateLimiter:
+    def __init__(self, capacity: int, window_s: float, backend: str = "memory", max_keys: int = 50_000):
+        if backend not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown rate limit backend: {backend!r}")
+        self.capacity = float(capacity)
+        self.rate = capacity / float(window_s)       # tokeni / secundă
+        self.window_s = float(window_s)
+        self.backend = backend
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def _take(self, tokens: float, updated_at: float, now_ts: float) -> tuple[bool, float]:
+        tokens = min(self.capacity, tokens + (now_ts - updated_at) * self.rate)
+        if tokens >= 1:
+            return True, tokens - 1
+        return False, tokens
+
+    def hit(self, key: str, now_ts: float, conn=None) -> bool:
+        """Consumă un token pentru `key`. False = limită depășită."""
+        if self.backend == "sqlite":
+            return self._hit_sqlite(conn, key, now_ts)
+        return self._hit_memory(key, now_ts)
+
+    # --- memory ---
+    def _hit_memory(self, key: str, now_ts: float) -> bool:
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (self.capacity, now_ts))
+            allowed, tokens = self._take(tokens, updated_at, now_ts)
+            self._buckets[key] = (tokens, now_ts)
+
+            # TTL: după `window_s` fără încercări găleata e oricum plină
+            while self._buckets:
+                oldest_key, (_, oldest_ts) = next(iter(self._buckets.items()))
+                if len(self._buckets) <= self.max_keys and now_ts - oldest_ts < self.window_s:
+                    break
+                del self._buckets[oldest_key]
+        return allowed
+
+    # --- sqlite (shared) ---
+    def _hit_sqlite(self, conn, key: str, now_ts: float) -> bool:
+        cur = conn.cursor()
+        cur.execute("SELECT tokens, updated_at FROM rate_limit_bucket WHERE key=?", (key,))
+        row = cur.fetchone()
+        tokens, updated_at = (row[0], row[1]) if row else (self.capacity, now_ts)
+        allowed, tokens = self._take(tokens, updated_at, now_ts)
+        cur.execute(
+            "INSERT INTO rate_limit_bucket(key, tokens, updated_at) VALUES (?,?,?)"
+            " ON CONFLICT(key) DO UPDATE SET tokens=excluded.tokens, updated_at=excluded.updated_at",
+            (key, tokens, now_ts),
+        )
+
+        self._hits += 1
+        if self._hits % 500 == 0:
+            cur.execute("DELETE FROM rate_limit_bucket WHERE updated_at < ?", (now_ts - self.window_s,))
+        return allowed
+
+
+def get_rate_limiter() -> RateLimiter:
+    limiter = current_app.extensions.get("sala_rate_limiter")
+    if limiter is None:
+        cfg = current_app.config
+        limiter = RateLimiter(
+            capacity=cfg.get("RATE_LIMIT_ATTEMPTS", 3),
+            window_s=cfg.get("RATE_LIMIT_WINDOW_S", 60),
+            backend=cfg.get("RATE_LIMIT_BACKEND", "memory"),
+        )
+        current_app.extensions["sala_rate_limiter"] = limiter
+    return limiter
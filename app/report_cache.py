@@ -0,0 +1,52 @@
+"""
+Cache în proces pentru rândurile de detaliu ale raportului, per sesiune încheiată.
+
+După fereastra de check-out attendance-ul unei sesiuni nu se mai schimbă, deci
+rândurile ei se pot refolosi între /diriginti/raport și /diriginti/export.
+Cheia de validare e (session.rev, roster): importul de coduri incrementează
+rev-ul sesiunilor clasei, iar ștergerile de coduri schimbă roster-ul din
+session_summary. Sesiunile încă deschise nu intră în cache.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class SessionReportCache:
+    def __init__(self, max_rows: int = 50_000):
+        self.max_rows = max_rows
+        self._items: OrderedDict[int, tuple[tuple, tuple]] = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id: int, stamp: tuple):
+        """Rândurile sesiunii dacă au fost calculate pentru același `stamp`, altfel None."""
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or item[0] != stamp:
+                return None
+            self._items.move_to_end(session_id)
+            return item[1]
+
+    def put(self, session_id: int, stamp: tuple, rows: tuple) -> None:
+        with self._lock:
+            old = self._items.pop(session_id, None)
+            if old is not None:
+                self._rows -= len(old[1])
+            self._items[session_id] = (stamp, rows)
+            self._rows += len(rows)
+            # LRU limitat după numărul total de rânduri, nu de sesiuni
+            while self._rows > self.max_rows and len(self._items) > 1:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._rows -= len(evicted)
+
+
+def get_report_cache() -> SessionReportCache:
+    cache = current_app.extensions.get("sala_report_cache")
+    if cache is None:
+        cache = SessionReportCache(max_rows=current_app.config.get("REPORT_CACHE_MAX_ROWS", 50_000))
+        current_app.extensions["sala_report_cache"] = cache
+    return cache
@@ -1,113 +1,227 @@
+"""
+Raportul dirigintelui calculat set-based: sesiuni × coduri autorizate
+LEFT JOIN attendance, cu statusul final calculat în SQL; sumarul vine din
+`session_summary`.
+
+Numărul de query-uri e constant (detaliu, sumar, scanări), indiferent câte
+sesiuni are intervalul. Rândurile sunt NamedTuple-uri (acces `r.camp` în
+Jinja, scriere directă cu csv.writer); generatoarele `iter_*` permit
+consumarea lor fără să țină tot raportul în memorie.
+"""
+import base64
+import json
 from datetime import datetime
-from .db import get_connection
-from .utils import parse_iso, _hms, format_ts_local
+from typing import Iterator, NamedTuple
+
+from flask import current_app
+
+from .db import get_db
+from .report_cache import get_report_cache
+
+REASON_RO = {
+    "rate-limit": "prea multe încercări într-un minut",
+    "device-used-for-other-code": "același dispozitiv folosit pentru alt cod în această oră",
+    "duplicate-code": "cod deja folosit în această oră",
+    "ok": "înregistrare reușită",
+}
+
+
+class DetailRow(NamedTuple):
+    data: str
+    incepe: str
+    se_termina: str
+    clasa: str
+    sesiune_id: int
+    cod4: str
+    status_final: str
+    check_in_at: str
+    check_out_at: str
+    status_checkin: str
+    status_checkout: str
+
+
+class SummaryRow(NamedTuple):
+    sesiune_id: int
+    data: str
+    incepe: str
+    se_termina: str
+    prezenti: int
+    intarziati: int
+    plecati: int
+    neconfirmat: int
+    rata_conformare: str
+
+
+class AttemptRow(NamedTuple):
+    ts: str
+    device_id: str
+    cod4: str
+    success: int
+    reason: str
+    ip: str
+    ua: str
+
+
+# ISO_FMT are poziții fixe: [1..10] data, [12..16] HH:MM, [12..19] HH:MM:SS (ora locală stocată)
+_FINAL_STATUS = """
+    CASE WHEN a.check_out_at IS NOT NULL THEN 'plecat'
+         WHEN a.id IS NULL THEN 'neconfirmat'
+         ELSE a.status END
+"""
+
+_DETAIL_SQL = f"""
+    SELECT substr(s.starts_at, 1, 10), substr(s.starts_at, 12, 5), substr(s.ends_at, 12, 5),
+           s.class_id, s.id, ac.code4_plain,
+           {_FINAL_STATUS},
+           COALESCE(substr(a.check_in_at, 12, 8), ''),
+           COALESCE(substr(a.check_out_at, 12, 8), ''),
+           CASE WHEN a.status IN ('prezent', 'întârziat') THEN a.status ELSE '-' END,
+           CASE WHEN a.check_out_at IS NOT NULL THEN 'plecat' ELSE '-' END
+    FROM session s
+    JOIN authorized_code ac ON ac.class_id = s.class_id
+    LEFT JOIN attendance a ON a.session_id = s.id AND a.code4_hash = ac.code4_hash
+    WHERE s.class_id = ? AND s.starts_epoch BETWEEN ? AND ?
+      AND s.id IN (SELECT value FROM json_each(?))
+    ORDER BY s.starts_epoch, s.id, ac.id
+"""
+
+_SESSIONS_SQL = """
+    SELECT s.id, s.rev, s.ends_epoch, s.closed_at, ss.roster
+    FROM session s
+    LEFT JOIN session_summary ss ON ss.session_id = s.id
+    WHERE s.class_id = ? AND s.starts_epoch BETWEEN ? AND ?
+    ORDER BY s.starts_epoch, s.id
+"""
+
+# contoarele vin din session_summary (ținută la zi de triggere): O(sesiuni), nu O(sesiuni × coduri)
+_SUMMARY_SQL = """
+    SELECT s.id, substr(s.starts_at, 1, 10), substr(s.starts_at, 12, 5), substr(s.ends_at, 12, 5),
+           ss.prezenti, ss.intarziati, ss.plecati, ss.roster
+    FROM session s
+    JOIN session_summary ss ON ss.session_id = s.id
+    WHERE s.class_id = ? AND s.starts_epoch BETWEEN ? AND ?
+    ORDER BY s.starts_epoch, s.id
+"""
+
+_ATTEMPTS_SQL = """
+    SELECT l.ts_epoch, l.device_id, COALESCE(ac.code4_plain, ''), l.success, l.reason, l.ip,
+           substr(COALESCE(l.user_agent, ''), 1, 80)
+    FROM attempt_log l
+    LEFT JOIN authorized_code ac ON ac.class_id = l.class_id AND ac.code4_hash = l.code4_hash
+    WHERE l.class_id = ? AND l.ts_epoch BETWEEN ? AND ?
+    ORDER BY l.ts_epoch, l.id
+"""
+
+
+def _bounds(class_id, start_dt, end_dt):
+    return class_id, int(start_dt.timestamp()), int(end_dt.timestamp())
+
+
+def _local_ts(epoch: int, tz) -> str:
+    return datetime.fromtimestamp(epoch, tz).strftime("%Y-%m-%d %H:%M:%S") if epoch is not None else ""
+
+
+def iter_detail(conn, class_id: str, start_dt, end_dt) -> Iterator[DetailRow]:
+    """
+    Un rând per (sesiune, cod autorizat), în ordinea sesiunilor.
+    Sesiunile încheiate vin din cache; restul dintr-un singur query.
+    """
+    cfg = current_app.config
+    cache = get_report_cache()
+    bounds = _bounds(class_id, start_dt, end_dt)
+    closed_before = datetime.now(cfg["TZ"]).timestamp() - cfg["CHECKOUT_GRACE_MIN_AFTER_END"] * 60
+
+    sessions, missing = [], []
+    for sid, rev, ends_epoch, closed_at, roster in conn.execute(_SESSIONS_SQL, bounds).fetchall():
+        closed = closed_at is not None or ends_epoch < closed_before
+        stamp = (rev, roster) if closed else None
+        rows = cache.get(sid, stamp) if closed else None
+        if rows is None:
+            missing.append(sid)
+        sessions.append((sid, stamp, rows))
+
+    fetched = conn.execute(_DETAIL_SQL, (*bounds, json.dumps(missing))) if missing else iter(())
+    pending = next(fetched, None)
+    for sid, stamp, rows in sessions:
+        if rows is None:
+            out = []
+            while pending is not None and pending[4] == sid:
+                out.append(DetailRow._make(pending))
+                pending = next(fetched, None)
+            rows = tuple(out)
+            if stamp is not None:
+                cache.put(sid, stamp, rows)
+        yield from rows
+
+
+def iter_summary(conn, class_id: str, start_dt, end_dt) -> Iterator[SummaryRow]:
+    for sid, data, incepe, se_termina, prez, intr, plec, roster in conn.execute(
+            _SUMMARY_SQL, _bounds(class_id, start_dt, end_dt)):
+        rata = (prez + intr) / (roster or 1)
+        yield SummaryRow(sid, data, incepe, se_termina,
+                         prez, intr, plec, roster - prez - intr - plec, f"{rata:.0%}")
+
+
+def iter_attempts(conn, class_id: str, start_dt, end_dt, tz) -> Iterator[AttemptRow]:
+    for ts, device_id, cod4, success, reason, ip, ua in conn.execute(
+            _ATTEMPTS_SQL, _bounds(class_id, start_dt, end_dt)):
+        yield AttemptRow(_local_ts(ts, tz), device_id, cod4, success,
+                         REASON_RO.get(reason, reason), ip, ua)
+
+
+def _encode_cursor(ts: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([ts, row_id]).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[int, int]:
+    ts, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return int(ts), int(row_id)
+
+
+def fetch_attempts_page(conn, class_id: str, start_dt, end_dt, tz, *, after: str | None = None,
+                        reason: str | None = None, device: str | None = None,
+                        success: int | None = None, limit: int = 100):
+    """
+    O pagină din attempt_log, paginată keyset pe (ts_epoch, id) — fără OFFSET, deci
+    pagina 50 costă cât pagina 1. Întoarce (rânduri, cursor_următor|None).
+    `after` e cursorul opac primit la pagina anterioară (ValueError dacă e invalid).
+    """
+    sql = ["SELECT l.ts_epoch, l.device_id, COALESCE(ac.code4_plain, ''), l.success, l.reason, l.ip,"
+           " substr(COALESCE(l.user_agent, ''), 1, 80), l.id",
+           "FROM attempt_log l",
+           "LEFT JOIN authorized_code ac ON ac.class_id = l.class_id AND ac.code4_hash = l.code4_hash",
+           "WHERE l.class_id = ? AND l.ts_epoch BETWEEN ? AND ?"]
+    params: list = list(_bounds(class_id, start_dt, end_dt))
+    if after:
+        try:
+            params += _decode_cursor(after)
+        except Exception:
+            raise ValueError("cursor invalid")
+        sql.append("AND (l.ts_epoch, l.id) > (?, ?)")
+    if reason:
+        sql.append("AND l.reason = ?"); params.append(reason)
+    if device:
+        sql.append("AND l.device_id = ?"); params.append(device)
+    if success is not None:
+        sql.append("AND l.success = ?"); params.append(success)
+    sql.append("ORDER BY l.ts_epoch, l.id LIMIT ?")
+    params.append(limit + 1)
+
+    rows = conn.execute(" ".join(sql), params).fetchall()
+    nxt = _encode_cursor(rows[limit - 1][0], rows[limit - 1][7]) if len(rows) > limit else None
+    items = [AttemptRow(_local_ts(ts, tz), device_id, cod4, ok, REASON_RO.get(rsn, rsn), ip, ua)
+             for ts, device_id, cod4, ok, rsn, ip, ua, _ in rows[:limit]]
+    return items, nxt
+
 
 def fetch_report_data(class_id: str, start_dt, end_dt, tz):
     """
     Returnează trei liste: (detail_rows, summary_rows, attempts_rows)
     - start_dt, end_dt: datetime AWARE (TZ Europe/Bucharest), capete incluse
     """
-    conn = get_connection(); cur = conn.cursor()
-
-    # sesiuni ale clasei în interval [start..end]
-    cur.execute("""SELECT id, class_id, starts_at, ends_at
-                   FROM session
-                   WHERE class_id=? AND starts_at BETWEEN ? AND ?
-                   ORDER BY starts_at ASC""",
-                (class_id,
-                 start_dt.strftime("%Y-%m-%dT%H:%M:%S%z"),
-                 end_dt.strftime("%Y-%m-%dT%H:%M:%S%z")))
-    sessions = cur.fetchall()
-
-    # coduri autorizate (hash + plaintext)
-    cur.execute("SELECT code4_hash, code4_plain FROM authorized_code WHERE class_id=? ORDER BY id", (class_id,))
-    auth_rows = cur.fetchall()
-    code_map = {r["code4_hash"]: r["code4_plain"] for r in auth_rows}
-    authorized_hashes = list(code_map.keys())
-
-    detail_rows = []
-    summary_rows = []
-
-    for s in sessions:
-        sid = s["id"]
-        starts = parse_iso(s["starts_at"]); ends = parse_iso(s["ends_at"])
-
-        # status curente
-        cur.execute("""SELECT code4_hash, status, check_in_at, check_out_at
-                       FROM attendance WHERE session_id=?""", (sid,))
-        rows = cur.fetchall()
-        att = {r["code4_hash"]: r for r in rows}
-
-        prez=intr=plec=neconf=0
-        for h in authorized_hashes:
-            a = att.get(h)
-            code4 = code_map.get(h, "????")
-            if a:
-                status = a["status"]
-                ci = a["check_in_at"]; co = a["check_out_at"]
-                final = "plecat" if co else status
-                if final == "plecat": plec+=1
-                elif final == "întârziat": intr+=1
-                elif final == "prezent": prez+=1
-                else: neconf+=1
-                detail_rows.append({
-                    "data": starts.strftime("%Y-%m-%d"),
-                    "incepe": starts.strftime("%H:%M"),
-                    "se_termina": ends.strftime("%H:%M"),
-                    "clasa": class_id,
-                    "sesiune_id": sid,
-                    "cod4": code4,
-                    "status_final": final,
-                    "check_in_at": _hms(ci),
-                    "check_out_at": _hms(co),
-                    "status_checkin": status if status in ("prezent","întârziat") else "-",
-                    "status_checkout": "plecat" if co else "-",
-                })
-            else:
-                neconf += 1
-                detail_rows.append({
-                    "data": starts.strftime("%Y-%m-%d"),
-                    "incepe": starts.strftime("%H:%M"),
-                    "se_termina": ends.strftime("%H:%M"),
-                    "clasa": class_id,
-                    "sesiune_id": sid,
-                    "cod4": code_map.get(h,"????"),
-                    "status_final": "neconfirmat",
-                    "check_in_at": "", "check_out_at": "",
-                    "status_checkin": "-", "status_checkout": "-",
-                })
-
-        total = len(authorized_hashes) or 1
-        rata = (prez + intr) / total
-        summary_rows.append({
-            "sesiune_id": sid, "data": starts.strftime("%Y-%m-%d"),
-            "incepe": starts.strftime("%H:%M"), "se_termina": ends.strftime("%H:%M"),
-            "prezenti": prez, "intarziati": intr, "plecati": plec, "neconfirmat": neconf,
-            "rata_conformare": f"{rata:.0%}",
-        })
-
-    # attempts (antifraud) în interval
-    cur.execute("""SELECT ts, device_id, code4_hash, success, reason, ip, user_agent
-                   FROM attempt_log
-                   WHERE class_id=? AND ts BETWEEN ? AND ?
-                   ORDER BY ts ASC""",
-                (class_id,
-                 start_dt.strftime("%Y-%m-%dT%H:%M:%S%z"),
-                 end_dt.strftime("%Y-%m-%dT%H:%M:%S%z")))
-    attempts = []
-    REASON_RO = {
-        "rate-limit": "prea multe încercări într-un minut",
-        "device-used-for-other-code": "același dispozitiv folosit pentru alt cod în această oră",
-        "duplicate-code": "cod deja folosit în această oră",
-        "ok": "înregistrare reușită",
-    }
-    for r in cur.fetchall():
-        attempts.append({
-            "ts": format_ts_local(r["ts"], tz), "device_id": r["device_id"],
-            "cod4": code_map.get(r["code4_hash"], "") if r["code4_hash"] else "",
-            "success": r["success"], "reason": REASON_RO.get(r["reason"], r["reason"]),
-            "ip": r["ip"], "ua": (r["user_agent"] or "")[:80]
-        })
-
-    conn.close()
-    return detail_rows, summary_rows, attempts
+    conn = get_db()
+    return (
+        list(iter_detail(conn, class_id, start_dt, end_dt)),
+        list(iter_summary(conn, class_id, start_dt, end_dt)),
+        list(iter_attempts(conn, class_id, start_dt, end_dt, tz)),
+    )
@@ -0,0 +1,308 @@
+"""
+Retenția attempt_log: agregate zilnice + arhive lunare comprimate.
+
+Rândurile mai vechi de ATTEMPT_RETENTION_DAYS zile sunt, pe zile:
+  1. copiate în arhiva lunii lor, `attempt_log-YYYY-MM.sqlite.gz` din
+     ATTEMPT_ARCHIVE_DIR (o bază SQLite cu aceeași tabelă, comprimată gzip);
+  2. rezumate în `attempt_daily` (încercări și dispozitive distincte per
+     zi / clasă / motiv / succes) și marcate în `attempt_log_archive`;
+  3. șterse din tabela vie în loturi mici, câte o tranzacție scurtă per lot.
+
+Ordinea contează: arhiva e publicată (os.replace) înainte de marcaj, iar
+ștergerea atinge doar zile marcate și doar id-uri <= max_id-ul arhivat, deci o
+întrerupere oriunde nu pierde rânduri; rularea următoare continuă de unde a rămas.
+O zi deja arhivată care primește rânduri noi (id > max_id, ex. scrise târziu)
+se re-arhivează: rândurile noi intră în aceeași arhivă, iar agregatul și
+marcajul zilei se recalculează din arhivă.
+Istoricul se citește cu `read_archive()` / `flask attempt-archive YYYY-MM`.
+
+Rulează din `flask retention` sau zilnic din ciclul de viață (RETENTION_HOUR);
+un „lease" în `meta` împiedică doi worker-i să lucreze simultan.
+"""
+from __future__ import annotations
+
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from pathlib import Path
+from typing import Iterator, Optional
+
+from flask import current_app
+
+from .db import ISO_FMT
+from .migrations import _epoch_sql
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_COLS = "id, session_id, class_id, device_id, code4_hash, success, reason, ip, user_agent, ts"
+
+_ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {db}attempt_log (
+        id INTEGER PRIMARY KEY,
+        session_id INTEGER,
+        class_id TEXT,
+        device_id TEXT,
+        code4_hash TEXT,
+        success INTEGER,
+        reason TEXT,
+        ip TEXT,
+        user_agent TEXT,
+        ts TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {db}idx_archive_class_ts ON attempt_log(class_id, ts);
+"""
+
+_LEASE_KEY = "retention_lease"
+
+
+@dataclass
+class RetentionResult:
+    days: int = 0
+    archived: int = 0
+    deleted: int = 0
+    archives: list[str] = field(default_factory=list)
+
+
+def archive_dir() -> Path:
+    cfg_dir = current_app.config.get("ATTEMPT_ARCHIVE_DIR")
+    path = Path(cfg_dir) if cfg_dir else Path(current_app.instance_path) / "archive"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def archive_name(month: str) -> str:
+    return f"attempt_log-{month}.sqlite.gz"
+
+
+def _day_bounds(day: date, tz) -> tuple[int, int]:
+    start = datetime(day.year, day.month, day.day, tzinfo=tz)
+    end = start + timedelta(days=1)
+    # ziua de la schimbarea orei are 23 / 25 h: capetele vin din ora locală, nu din +86400
+    return int(start.timestamp()), int(datetime(end.year, end.month, end.day, tzinfo=tz).timestamp())
+
+
+def _pending_days(conn, cutoff_ts: int, tz) -> list[date]:
+    """
+    Zilele cu rânduri mai vechi de cutoff, încă nearhivate sau cu rânduri
+    apărute după arhivare (id > max_id); câte un salt pe index per zi.
+    """
+    done = dict(conn.execute("SELECT day, max_id FROM attempt_log_archive").fetchall())
+    days = []
+    ts = conn.execute("SELECT min(ts_epoch) FROM attempt_log WHERE ts_epoch < ?", (cutoff_ts,)).fetchone()[0]
+    while ts is not None:
+        day = datetime.fromtimestamp(ts, tz).date()
+        lo, hi = _day_bounds(day, tz)
+        max_id = done.get(day.isoformat())
+        if max_id is None or conn.execute(
+                "SELECT 1 FROM attempt_log WHERE ts_epoch >= ? AND ts_epoch < ? AND id > ? LIMIT 1",
+                (lo, hi, max_id)).fetchone():
+            days.append(day)
+        ts = conn.execute("SELECT min(ts_epoch) FROM attempt_log WHERE ts_epoch >= ? AND ts_epoch < ?",
+                          (hi, cutoff_ts)).fetchone()[0]
+    return days
+
+
+# ---------------------------------------------------------------------------
+# fișierele de arhivă
+
+def _unpack(gz_path: Path) -> str:
+    """Decomprimă arhiva (dacă există) într-un fișier temporar lângă ea; întoarce calea."""
+    fd, tmp = tempfile.mkstemp(prefix=".attempt_log-", suffix=".sqlite", dir=gz_path.parent)
+    with os.fdopen(fd, "wb") as out:
+        if gz_path.exists():
+            with gzip.open(gz_path, "rb") as src:
+                shutil.copyfileobj(src, out)
+    return tmp
+
+
+def _publish(tmp: str, gz_path: Path) -> None:
+    """Comprimă și înlocuiește atomic arhiva (os.replace)."""
+    part = f"{gz_path}.part"
+    with open(tmp, "rb") as src, gzip.open(part, "wb", compresslevel=9) as out:
+        shutil.copyfileobj(src, out)
+    os.replace(part, gz_path)
+
+
+def read_archive(gz_path: Path, class_id: Optional[str] = None) -> Iterator[sqlite3.Row]:
+    """Rândurile unei arhive lunare (opțional doar o clasă), în ordinea timpului."""
+    tmp = _unpack(Path(gz_path))
+    try:
+        conn = sqlite3.connect(tmp)
+        conn.row_factory = sqlite3.Row
+        try:
+            sql = f"SELECT {ARCHIVE_COLS} FROM attempt_log"
+            params: tuple = ()
+            if class_id:
+                sql += " WHERE class_id = ?"
+                params = (class_id,)
+            yield from conn.execute(sql + " ORDER BY ts, id", params)
+        finally:
+            conn.close()
+    finally:
+        os.unlink(tmp)
+
+
+# ---------------------------------------------------------------------------
+# lease: o singură rulare odată, între procese
+
+def _acquire_lease(conn, ttl_s: int) -> bool:
+    now = int(time.time())
+    cur = conn.execute(
+        "INSERT INTO meta(key, value) VALUES (?, ?)"
+        " ON CONFLICT(key) DO UPDATE SET value = excluded.value WHERE meta.value < ?",
+        (_LEASE_KEY, now + ttl_s, now),
+    )
+    conn.commit()
+    return cur.rowcount == 1
+
+
+def _release_lease(conn) -> None:
+    conn.execute("DELETE FROM meta WHERE key = ?", (_LEASE_KEY,))
+    conn.commit()
+
+
+# ---------------------------------------------------------------------------
+# pașii
+
+def _archive_month(conn, month: str, days: list[date], tz, directory: Path) -> list[tuple]:
+    """
+    Copiază zilele în arhiva lunii și o publică. Întoarce, pentru marcaj,
+    (zi, rânduri copiate acum, rânduri în arhivă, max_id, agregatul zilei).
+    Agregatul se face din arhivă: la o re-arhivare, rândurile vechi ale zilei
+    pot fi deja șterse din tabela vie.
+    """
+    gz_path = directory / archive_name(month)
+    tmp = _unpack(gz_path)
+    marks = []
+    try:
+        conn.execute("ATTACH DATABASE ? AS arch", (tmp,))
+        try:
+            conn.executescript(_ARCHIVE_SCHEMA.format(db="arch."))
+            for day in days:
+                lo, hi = _day_bounds(day, tz)
+                rows, max_id = conn.execute(
+                    "SELECT count(*), max(id) FROM attempt_log WHERE ts_epoch >= ? AND ts_epoch < ?", (lo, hi)
+                ).fetchone()
+                if not rows:
+                    continue
+                copied = conn.execute(
+                    f"INSERT OR IGNORE INTO arch.attempt_log ({ARCHIVE_COLS})"
+                    f" SELECT {ARCHIVE_COLS} FROM main.attempt_log"
+                    " WHERE ts_epoch >= ? AND ts_epoch < ? AND id <= ?",
+                    (lo, hi, max_id),
+                ).rowcount
+                daily = conn.execute(
+                    "SELECT class_id, COALESCE(reason, ''), success, count(*), count(DISTINCT device_id)"
+                    f" FROM arch.attempt_log WHERE {_epoch_sql('ts')} >= ? AND {_epoch_sql('ts')} < ?"
+                    " GROUP BY class_id, reason, success",
+                    (lo, hi),
+                ).fetchall()
+                marks.append((day, copied, sum(r[3] for r in daily), max_id, daily))
+            conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE arch")
+        _publish(tmp, gz_path)
+    finally:
+        os.unlink(tmp)
+    return marks
+
+
+def _mark_day(conn, day: date, rows: int, max_id: int, daily: list[tuple], archive: str, tz) -> None:
+    """Agregatul zilei + marcajul „arhivat", în aceeași tranzacție (înlocuite la re-arhivare)."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM attempt_daily WHERE day = ?", (day.isoformat(),))
+        conn.executemany(
+            "INSERT INTO attempt_daily(day, class_id, reason, success, attempts, devices) VALUES (?,?,?,?,?,?)",
+            [(day.isoformat(), *r) for r in daily],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO attempt_log_archive(day, archive, rows, max_id, archived_at) VALUES (?,?,?,?,?)",
+            (day.isoformat(), archive, rows, max_id, datetime.now(tz).strftime(ISO_FMT)),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _delete_archived(conn, tz, batch: int, pause_s: float, echo) -> int:
+    """Șterge din tabela vie rândurile zilelor deja arhivate, câte `batch` per tranzacție."""
+    first = conn.execute("SELECT min(ts_epoch) FROM attempt_log").fetchone()[0]
+    if first is None:
+        return 0
+    since = datetime.fromtimestamp(first, tz).date().isoformat()
+    deleted = 0
+    for day_iso, max_id in conn.execute(
+            "SELECT day, max_id FROM attempt_log_archive WHERE day >= ? ORDER BY day", (since,)).fetchall():
+        lo, hi = _day_bounds(date.fromisoformat(day_iso), tz)
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                n = conn.execute(
+                    "DELETE FROM attempt_log WHERE id IN (SELECT id FROM attempt_log"
+                    " WHERE ts_epoch >= ? AND ts_epoch < ? AND id <= ? LIMIT ?)",
+                    (lo, hi, max_id, batch),
+                ).rowcount
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            deleted += n
+            if n < batch:
+                break
+            if pause_s:
+                time.sleep(pause_s)
+        echo(f"  {day_iso}: șters din attempt_log ({deleted} rânduri până acum)")
+    return deleted
+
+
+def run_retention(conn, *, tz, keep_days: int, directory: Path, batch: int = 2000, pause_s: float = 0.0,
+                  now: Optional[datetime] = None, lease_s: int = 3600, echo=None) -> Optional[RetentionResult]:
+    """
+    Arhivează + agregă + șterge rândurile mai vechi de `keep_days` zile.
+    None dacă altă rulare ține lease-ul.
+    """
+    echo = echo or (lambda msg: None)
+    now = now or datetime.now(tz)
+    cutoff_day = now.date() - timedelta(days=keep_days)
+    cutoff_ts, _ = _day_bounds(cutoff_day, tz)
+
+    if not _acquire_lease(conn, lease_s):
+        return None
+    try:
+        res = RetentionResult()
+        days = _pending_days(conn, cutoff_ts, tz)
+        for month, mdays in groupby(days, key=lambda d: d.strftime("%Y-%m")):
+            marks = _archive_month(conn, month, list(mdays), tz, directory)
+            for day, copied, rows, max_id, daily in marks:
+                _mark_day(conn, day, rows, max_id, daily, archive_name(month), tz)
+                res.days += 1
+                res.archived += copied
+            if marks:
+                res.archives.append(archive_name(month))
+                echo(f"  {archive_name(month)}: {len(marks)} zile, {sum(m[1] for m in marks)} rânduri")
+        res.deleted = _delete_archived(conn, tz, batch, pause_s, echo)
+        return res
+    finally:
+        _release_lease(conn)
+
+
+def run_scheduled(app, conn, now: datetime) -> Optional[RetentionResult]:
+    """Pasul zilnic din ciclul de viață (ATTEMPT_RETENTION_DAYS > 0)."""
+    cfg = app.config
+    res = run_retention(
+        conn, tz=cfg["TZ"], keep_days=cfg["ATTEMPT_RETENTION_DAYS"], directory=archive_dir(),
+        batch=cfg.get("RETENTION_BATCH", 2000), pause_s=cfg.get("RETENTION_PAUSE_MS", 50) / 1000, now=now,
+    )
+    if res is not None and (res.archived or res.deleted):
+        log.info("retention: %d zile arhivate (%d rânduri), %d rânduri șterse",
+                 res.days, res.archived, res.deleted)
+    return res
@@ -1,62 +1,31 @@
 from __future__ import annotations
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, render_template, request, redirect, url_for, stream_with_context
 from datetime import datetime, timezone, timedelta
 
-from .utils import get_qr_serializer, parse_iso
-from .db import get_connection, _hash_code
+from .utils import get_qr_serializer, issue_qr_token, qr_epoch_start
+from .db import get_db, _hash_code
+from .checkin import Attempt, record_checkin, record_checkout
+from .monitor_cache import get_snapshot_cache
+from .timetable import get_timetable
+from .lifecycle import FROZEN_COUNT_SQL, phase_windows
 from flask import current_app
 from flask import jsonify
 from flask import send_file, current_app
+from functools import lru_cache
 from io import BytesIO
-import qrcode
+import hashlib
+import json
+import sqlite3
+import time
 from itsdangerous import BadSignature, SignatureExpired
 from datetime import datetime, timedelta
-from .utils import aware_from_hhmm
 
-def _windows(now, starts_at, ends_at, cfg):
-    """
-    Returnează dict cu ferestrele (active/sleep/end) și 'mode' curent.
-    Reguli:
-      - check-in: [T - open_before, T + close_after]
-      - sleep   : (T + close_after, ends_at - checkout_open_before_end)
-      - end     : [ends_at - checkout_open_before_end, ends_at + grace_after_end]
-    """
-    open_before   = timedelta(minutes=cfg["CHECKIN_OPEN_MIN_BEFORE"])
-    close_after   = timedelta(minutes=cfg["CHECKIN_CLOSE_MIN_AFTER"])
-    open_end      = timedelta(minutes=cfg["CHECKOUT_OPEN_MIN_BEFORE_END"])
-    grace_after   = timedelta(minutes=cfg["CHECKOUT_GRACE_MIN_AFTER_END"])
-
-    w_checkin_start = starts_at - open_before
-    w_checkin_end   = starts_at + close_after
-    w_end_start     = ends_at - open_end
-    w_end_end       = ends_at + grace_after
-
-    if now < w_checkin_start:
-        mode = "pre"
-    elif w_checkin_start <= now <= w_checkin_end:
-        mode = "active"
-    elif w_checkin_end < now < w_end_start:
-        mode = "sleep"
-    elif w_end_start <= now <= w_end_end:
-        mode = "end"
-    else:
-        mode = "post"
-
-    return {
-        "mode": mode,
-        "w_checkin_start": w_checkin_start,
-        "w_checkin_end":   w_checkin_end,
-        "w_end_start":     w_end_start,
-        "w_end_end":       w_end_end,
-    }
-
-def _window_label(now, starts_at, cfg):
-    """Pentru textul tău existent 'Fereastră check-in: ...' """
-    open_before = timedelta(minutes=cfg["CHECKIN_OPEN_MIN_BEFORE"])
-    close_after = timedelta(minutes=cfg["CHECKIN_CLOSE_MIN_AFTER"])
-    if now < starts_at - open_before:
+def _window_label(now_ts, starts_ts, cfg):
+    """Pentru textul tău existent 'Fereastră check-in: ...' (secunde UTC)"""
+    open_before = cfg["CHECKIN_OPEN_MIN_BEFORE"] * 60
+    if now_ts < starts_ts - open_before:
         return "nu a început"
-    delta = int((now - starts_at).total_seconds())
+    delta = int(now_ts - starts_ts)
     if delta < 5*60:
         return "verde (0–5 min)"
     if delta < 10*60:
@@ -82,8 +51,16 @@ def _status_for(delta_seconds: int) -> str | None:
     return None  # expirat
 
 
-def _checkout_allowed(now, ends_at):
-    delta = (now - ends_at).total_seconds()
+CHECKIN_MESSAGES = {
+    "rate-limit": "Prea multe încercări. Încearcă din nou peste un minut.",
+    "device-used-for-other-code": "Acest dispozitiv a fost folosit deja pentru alt cod la această oră.",
+    "duplicate-code": "Acest cod a fost deja folosit pentru această oră.",
+}
+BUSY_MESSAGE = "Sistemul este ocupat. Încearcă din nou în câteva secunde."
+
+
+def _checkout_allowed(now_ts, ends_ts):
+    delta = now_ts - ends_ts
     if delta < -300: return "early"   # cu >5 min înainte de final
     if delta >  300: return "late"    # la >5 min după final
     return "ok"
@@ -99,10 +76,10 @@ def monitor():
     if not session_id:
         return "Lipsește ?session_id=...", 400
 
-    conn = get_connection()
+    conn = get_db()
     cur = conn.cursor()
 
-    cur.execute("SELECT id, class_id, starts_at, ends_at FROM session WHERE id=?", (session_id,))
+    cur.execute("SELECT id, class_id, starts_epoch, ends_epoch FROM session WHERE id=?", (session_id,))
     sess = cur.fetchone()
     if not sess:
         return "Sesiune inexistentă", 404
@@ -110,13 +87,14 @@ def monitor():
     class_id = sess["class_id"]
 
 
-    starts_at = _parse_iso(sess["starts_at"])  # aware
-    ends_at = _parse_iso(sess["ends_at"])
+    starts_ts = sess["starts_epoch"]  # secunde UTC
+    ends_ts = sess["ends_epoch"]
 
     now = datetime.now(tz=current_app.config["TZ"])
-    delta = int((now - starts_at).total_seconds())
+    now_ts = now.timestamp()
+    delta = int(now_ts - starts_ts)
 
-    phase = "start" if now < (ends_at - timedelta(minutes=5)) else "end"
+    phase = "start" if now_ts < ends_ts - 5 * 60 else "end"
 
     # coduri autorizate pentru clasă
     cur.execute("SELECT code4_hash FROM authorized_code WHERE class_id=? ORDER BY id", (class_id,))
@@ -124,7 +102,7 @@ def monitor():
 
     # attendance curent pentru sesiune
     cur.execute(
-        "SELECT code4_hash, code4_plain FROM authorized_code WHERE class_id=? ORDER BY id",
+        "SELECT id, code4_hash, code4_plain FROM authorized_code WHERE class_id=? ORDER BY id",
         (class_id,),
     )
     rows = cur.fetchall()
@@ -134,11 +112,11 @@ def monitor():
 
     codes_ui = []
     for r in rows:
-        h = r[0]
-        code4 = (r[1] or "").strip() or "????"  # fallback dacă nu e populat încă
+        h = r[1]
+        code4 = (r[2] or "").strip() or "????"  # fallback dacă nu e populat încă
         last2 = (code4 or "")[-2:]
         st = status_map.get(h, "neconfirmat")
-        codes_ui.append({"last2": last2, "status": st})
+        codes_ui.append({"id": r[0], "last2": last2, "status": st})
 
 
     present_count = sum(1 for c in codes_ui if c["status"] in ("prezent","întârziat"))
@@ -157,11 +135,10 @@ def monitor():
     # ora curentă pentru header (server-side)
     ora_curenta = now.strftime("%H:%M")
     data_curenta = now.strftime("%d %b %Y")
-    phase = "start" if now < (ends_at - timedelta(minutes=5)) else "end"
+    phase = "start" if now_ts < ends_ts - 5 * 60 else "end"
 
 
-    s = get_qr_serializer(current_app)
-    qr_token = s.dumps({"session_id": session_id, "phase": phase})
+    qr_token = issue_qr_token(current_app, session_id, phase, now_ts)
     qr_title = "Cod de început de oră" if phase == "start" else "Cod de final de oră"
 
     return render_template(
@@ -227,138 +204,63 @@ def elev():
     if len(code4) != 4 or not code4.isdigit():
         return render_template("elev.html", session_id=session_id, message="Cod invalid — introdu exact 4 cifre", status_final=None)
 
-    conn = get_connection()
+    conn = get_db()
     cur = conn.cursor()
     
-    cur.execute("SELECT id, class_id, starts_at, ends_at FROM session WHERE id=?", (session_id,))
+    cur.execute("SELECT id, class_id, starts_epoch, ends_epoch FROM session WHERE id=?", (session_id,))
     sess = cur.fetchone()
     if not sess:
-        conn.close()
         return render_template("elev.html", session_id=session_id, message="Sesiune inexistentă", status_final=None)
 
     class_id = sess["class_id"]
 
-    starts_at = parse_iso(sess["starts_at"])
-    ends_at   = parse_iso(sess["ends_at"])
-
     now = datetime.now(tz=current_app.config["TZ"])
-    delta = int((now - starts_at).total_seconds())
+    delta = int(now.timestamp() - sess["starts_epoch"])
 
     # cod autorizat?
     code_hash = _hash_code(class_id, code4)
     cur.execute("SELECT 1 FROM authorized_code WHERE class_id=? AND code4_hash=?", (class_id, code_hash))
     if not cur.fetchone():
-        conn.close()
         return render_template("elev.html", session_id=session_id, message="Cod neautorizat pentru această clasă", status_final=None)
 
     # ===== CHECK-OUT (phase=end) =====
     if token_phase == "end":
         # fereastră de check-out: [-5m, +5m] față de ends_at
-        win = _checkout_allowed(now, ends_at)
+        win = _checkout_allowed(now.timestamp(), sess["ends_epoch"])
         if win == "early":
-            conn.close()
             return render_template("elev.html", session_id=session_id, message="Check-out disponibil cu 5 minute înainte de final.", status_final=None)
         if win == "late":
-            conn.close()
             return render_template("elev.html", session_id=session_id, message="Fereastra de check-out a expirat.", status_final=None)
 
-        # trebuie să existe check-in anterior
-        cur.execute("SELECT 1 FROM attendance WHERE session_id=? AND code4_hash=?", (session_id, code_hash))
-        if not cur.fetchone():
-            conn.close()
+        try:
+            reason = record_checkout(conn, session_id, code_hash, now)
+        except sqlite3.OperationalError:
+            return render_template("elev.html", session_id=session_id, message=BUSY_MESSAGE, status_final=None)
+        if reason != "ok":
             return render_template("elev.html", session_id=session_id, message="Nu poți face check-out fără check-in pentru această oră.", status_final=None)
-
-        cur.execute(
-            "UPDATE attendance SET status=?, check_out_at=? WHERE session_id=? AND code4_hash=?",
-            ("plecat", now.strftime("%Y-%m-%dT%H:%M:%S%z"), session_id, code_hash),
-        )
-        conn.commit()
-        conn.close()
         return render_template("elev.html", session_id=session_id, message="Check-out înregistrat. O oră bună!", status_final="plecat")
 
     # ===== CHECK-IN (phase=start sau fără token) =====
     st = _status_for(delta)  # None dacă în afara ferestrei 0-10 min
     if st is None:
-        conn.close()
 
         return render_template("elev.html", session_id=session_id, message="Ora a început de mai mult de zece minute. Nu mai este permis check-in-ul.", status_final=None)
 
     # Anti-fraud (device_id + rate-limit + device folosit pt. alt cod + duplicat)
     device_id = (request.form.get("device_id") or "").strip()
     if not device_id:
-        conn.close()
         return render_template("elev.html", session_id=session_id, message="Lipsește identificatorul dispozitivului", status_final=None)
 
-    # 1) Rate limit
-    cur.execute(
-        "SELECT COUNT(*) FROM attempt_log WHERE session_id=? AND device_id=? AND ts >= ?",
-        (session_id, device_id, (now - timedelta(seconds=60)).strftime("%Y-%m-%dT%H:%M:%S%z")),
-    )
-    if cur.fetchone()[0] >= 3:
-        cur.execute(
-            "INSERT INTO attempt_log(session_id,class_id,device_id,code4_hash,success,reason,ip,user_agent,ts)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (session_id, class_id, device_id, None, 0, "rate-limit", request.remote_addr,
-             request.headers.get("User-Agent",""), now.strftime("%Y-%m-%dT%H:%M:%S%z")),
-        )
-        conn.commit()
-        conn.close()
-        return render_template("elev.html", session_id=session_id, message="Prea multe încercări. Încearcă din nou peste un minut.", status_final=None)
-
-    # 2) Același device folosit pentru alt cod?
-    cur.execute(
-        "SELECT DISTINCT code4_hash FROM attendance WHERE session_id=? AND class_id=? AND code4_hash IS NOT NULL",
-        (session_id, class_id),
-    )
-    used_hashes = {row[0] for row in cur.fetchall()}
-    if used_hashes and (code_hash not in used_hashes):
-        cur.execute(
-            "INSERT INTO attempt_log(session_id,class_id,device_id,code4_hash,success,reason,ip,user_agent,ts)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (session_id, class_id, device_id, code_hash, 0, "device-used-for-other-code",
-             request.remote_addr, request.headers.get("User-Agent",""), now.strftime("%Y-%m-%dT%H:%M:%S%z")),
-        )
-        conn.commit()
-        conn.close()
-        return render_template("elev.html", session_id=session_id, message="Acest dispozitiv a fost folosit deja pentru alt cod la această oră.", status_final=None)
-
-    # 3) Duplicat: același cod deja a făcut check-in
-    cur.execute("SELECT 1 FROM attendance WHERE session_id=? AND code4_hash=?", (session_id, code_hash))
-    if cur.fetchone():
-        cur.execute(
-            "INSERT INTO attempt_log(session_id,class_id,device_id,code4_hash,success,reason,ip,user_agent,ts)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (session_id, class_id, device_id, code_hash, 0, "duplicate-code",
-             request.remote_addr, request.headers.get("User-Agent",""), now.strftime("%Y-%m-%dT%H:%M:%S%z")),
-        )
-        conn.commit()
-        conn.close()
-        return render_template("elev.html", session_id=session_id, message="Acest cod a fost deja folosit pentru această oră.", status_final=None)
-
-    # Insert check-in
+    attempt = Attempt(session_id=session_id, class_id=class_id, code_hash=code_hash, device_id=device_id,
+                      ip=request.remote_addr, user_agent=request.headers.get("User-Agent", ""))
     try:
-        cur.execute(
-            "INSERT INTO attendance(session_id, class_id, code4_hash, status, check_in_at)"
-            " VALUES (?,?,?,?,?)",
-            (session_id, class_id, code_hash, st, now.strftime("%Y-%m-%dT%H:%M:%S%z")),
-        )
-        conn.commit()
-        # log succes
-        cur.execute(
-            "INSERT INTO attempt_log(session_id,class_id,device_id,code4_hash,success,reason,ip,user_agent,ts)"
-            " VALUES (?,?,?,?,?,?,?,?,?)",
-            (session_id, class_id, device_id, code_hash, 1, "ok",
-             request.remote_addr, request.headers.get("User-Agent",""), now.strftime("%Y-%m-%dT%H:%M:%S%z")),
-        )
-        conn.commit()
-        status_final = st
-        message = "Te-ai înregistrat cu succes"
-    except Exception:
-        message = "Ai fost deja înregistrat pentru această oră"
-    finally:
-        conn.close()
-
-    return render_template("elev.html", session_id=session_id, message=message, status_final=status_final)
+        reason = record_checkin(conn, attempt, st, now)
+    except sqlite3.OperationalError:
+        return render_template("elev.html", session_id=session_id, message=BUSY_MESSAGE, status_final=None)
+
+    if reason != "ok":
+        return render_template("elev.html", session_id=session_id, message=CHECKIN_MESSAGES[reason], status_final=None)
+    return render_template("elev.html", session_id=session_id, message="Te-ai înregistrat cu succes", status_final=st)
 
 
 
@@ -366,49 +268,187 @@ def elev():
 def api_monitor_status():
     session_id = request.args.get("session_id", type=int)
     if not session_id:
-        sid = _find_or_create_current_session(current_app.config["TZ"])
+        sid = _find_current_session(current_app.config["TZ"])
         if not sid:
             return jsonify({"mode": "off"}), 200
         session_id = sid
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute("SELECT id, class_id, starts_at, ends_at FROM session WHERE id=?", (session_id,))
-    sess = cur.fetchone()
+    cur = get_db().cursor()
+    sess = _load_monitor_session(cur, session_id)
     if not sess:
-        conn.close()
         return jsonify({"error": "session not found"}), 404
 
+    now = datetime.now(tz=current_app.config["TZ"])
+    payload, etag = _monitor_snapshot(cur, sess, now, skip_etag=request.if_none_match)
+    if payload is None:
+        resp = current_app.response_class(status=304)
+    else:
+        resp = jsonify(_with_cursor(cur, sess, payload, request.args.get("since")))
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@bp.get("/api/monitor_stream")
+def api_monitor_stream():
+    """
+    Server-Sent Events pentru monitor: `snapshot` complet la conectare, apoi
+    `delta` doar cu câmpurile / codurile schimbate, plus heartbeat.
+    Ține un worker ocupat cât e deschis: necesită gunicorn gthread/gevent.
+    """
+    cfg = current_app.config
+    if not cfg.get("MONITOR_STREAM_ENABLED"):
+        return jsonify({"error": "stream disabled"}), 404
+    session_id = request.args.get("session_id", type=int)
+    if not session_id:
+        return jsonify({"error": "missing session_id"}), 400
+
+    cur = get_db().cursor()
+    if not _load_monitor_session(cur, session_id):
+        return jsonify({"error": "session not found"}), 404
+
+    poll_s = cfg["MONITOR_STREAM_POLL_S"]
+    heartbeat_s = cfg["MONITOR_STREAM_HEARTBEAT_S"]
+    max_s = cfg["MONITOR_STREAM_MAX_S"]
+
+    def events():
+        yield "retry: 3000\n\n"
+        last_payload, last_etag = None, None
+        started = last_sent = time.monotonic()
+        while time.monotonic() - started < max_s:
+            sess = _load_monitor_session(cur, session_id)
+            if not sess:
+                yield "event: gone\ndata: {}\n\n"
+                return
+            now = datetime.now(tz=cfg["TZ"])
+            payload, etag = _monitor_snapshot(cur, sess, now, skip_etag=(last_etag,))
+            if payload is not None:
+                if last_payload is None:
+                    yield _sse("snapshot", payload, etag)
+                else:
+                    yield _sse("delta", _monitor_delta(last_payload, payload), etag)
+                last_payload, last_etag = payload, etag
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= heartbeat_s:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_s)
+        # închidem periodic; EventSource se reconectează singur și eliberează worker-ul
+        yield "event: bye\ndata: {}\n\n"
+
+    resp = current_app.response_class(stream_with_context(events()), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def _sse(event, data, event_id=None):
+    head = f"event: {event}\n" + (f"id: {event_id}\n" if event_id else "")
+    return head + "data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n\n"
+
+
+def _monitor_delta(prev, cur):
+    """Câmpurile de top-level schimbate + codurile al căror status s-a schimbat."""
+    changed = {k: v for k, v in cur.items() if k != "codes" and prev.get(k) != v}
+    old_codes = {c["id"]: c["status"] for c in prev.get("codes") or []}
+    codes = [c for c in cur.get("codes") or [] if old_codes.get(c["id"]) != c["status"]]
+    return {"changed": changed, "codes": codes}
+
+
+def _with_cursor(cur, sess, payload, since):
+    """
+    Adaugă `cursor` la payload. Cu `since=<cursor>` valid, `codes` conține doar
+    codurile schimbate după cursor (`full: false`); altfel snapshot complet.
+    Cursor: 'session_id:rev:total' (total = nr. coduri, prinde schimbări de listă).
+    """
+    rev = sess["rev"]
+    total = payload.get("total", 0)
+    out = dict(payload, cursor=f"{sess['id']}:{rev}:{total}", full=True)
+    try:
+        c_sid, c_rev, c_total = (int(x) for x in (since or "").split(":"))
+    except ValueError:
+        return out
+    lag = rev - c_rev
+    if c_sid != sess["id"] or c_total != total or not (0 <= lag <= current_app.config["MONITOR_CURSOR_MAX_LAG"]):
+        return out  # cursor străin / prea vechi → snapshot complet
+
+    cur.execute(
+        "SELECT ac.id, ac.code4_plain, a.status FROM attendance a"
+        " JOIN authorized_code ac ON ac.class_id=a.class_id AND ac.code4_hash=a.code4_hash"
+        " WHERE a.session_id=? AND a.rev > ? AND a.rev <= ?",
+        (sess["id"], c_rev, rev),
+    )
+    out["codes"] = [{"id": cid, "last2": (code4 or "")[-2:], "status": st} for cid, code4, st in cur.fetchall()]
+    out["full"] = False
+    return out
+
+
+def _load_monitor_session(cur, session_id):
+    cur.execute("SELECT id, class_id, starts_epoch, ends_epoch, rev, present_frozen FROM session WHERE id=?",
+                (session_id,))
+    return cur.fetchone()
+
+
+def _monitor_snapshot(cur, sess, now, skip_etag=()):
+    """
+    (payload, etag) pentru sesiune, din cache dacă cheia nu s-a schimbat.
+    Dacă etag-ul e în `skip_etag` (clientul îl are deja) întoarce (None, etag)
+    fără să construiască payload-ul.
+    """
+    session_id = sess["id"]
+    key = _monitor_snapshot_key(sess, now)
+    cache = get_snapshot_cache()
+    etag = cache.etag_for(session_id, key)
+    if etag in skip_etag:
+        return None, etag
+    hit = cache.get(session_id, key)
+    if hit:
+        return hit
+    payload = _monitor_status_payload(cur, sess, now)
+    return payload, cache.put(session_id, key, payload)
+
+
+def _monitor_snapshot_key(sess, now):
+    """Tot ce schimbă payload-ul monitorului; vezi monitor_cache.SnapshotCache."""
+    cfg = current_app.config
+    now_ts, starts_ts = now.timestamp(), sess["starts_epoch"]
+    return (
+        sess["rev"], sess["present_frozen"],
+        phase_windows(now_ts, starts_ts, sess["ends_epoch"], cfg)["mode"],
+        _window_label(now_ts, starts_ts, cfg),
+        now_ts >= starts_ts + 10 * 60,
+        now.strftime("%Y-%m-%d %H:%M"),
+        qr_epoch_start(current_app, now_ts),
+    )
+
+
+def _monitor_status_payload(cur, sess, now):
+    session_id = sess["id"]
     class_id = sess["class_id"]
 
-    starts_at = parse_iso(sess["starts_at"])  # aware
-    ends_at = parse_iso(sess["ends_at"])
-    now = datetime.now(tz=current_app.config["TZ"])
-    wins = _windows(now, starts_at, ends_at, current_app.config)
+    tz = current_app.config["TZ"]
+    now_ts = now.timestamp()
+    starts_ts = sess["starts_epoch"]  # secunde UTC
+    ends_ts = sess["ends_epoch"]
+    wins = phase_windows(now_ts, starts_ts, ends_ts, current_app.config)
     mode_internal = wins["mode"]
-    delta = int((now - starts_at).total_seconds())
-    phase = "start" if now < (ends_at - timedelta(minutes=5)) else "end"
-
-    # coduri autorizate pentru clasă
-    cur.execute("SELECT code4_hash FROM authorized_code WHERE class_id=? ORDER BY id", (class_id,))
-    authorized = [r[0] for r in cur.fetchall()]
+    delta = int(now_ts - starts_ts)
+    phase = "start" if now_ts < ends_ts - 5 * 60 else "end"
 
     # statusuri curente pentru sesiune
     cur.execute("SELECT code4_hash, status FROM attendance WHERE session_id=?", (session_id,))
     status_map = {row[0]: row[1] for row in cur.fetchall()}
 
-    cur.execute("SELECT code4_hash, code4_plain FROM authorized_code WHERE class_id=? ORDER BY id", (class_id,))
+    cur.execute("SELECT id, code4_hash, code4_plain FROM authorized_code WHERE class_id=? ORDER BY id", (class_id,))
     rows = cur.fetchall()
     codes = []
-    for h, code4 in rows:
+    for cid, h, code4 in rows:
         st = status_map.get(h, "neconfirmat")
         last2 = (code4 or "")[-2:]
-        codes.append({"last2": last2, "status": st})
-    conn.close()
+        codes.append({"id": cid, "last2": last2, "status": st})
 
 
-    before_end_5m = ends_at - timedelta(minutes=5)
+    before_end_5m = ends_ts - 5 * 60
 
     if delta < 0:
         mode = "pre"
@@ -419,14 +459,14 @@ def api_monitor_status():
     elif delta < 10*60:
         mode = "active"
         window_label = "galben (5–10 min)"
-    elif now < before_end_5m:
+    elif now_ts < before_end_5m:
         mode = "sleep"
         window_label = "ora"
     else:
         mode = "end"
         window_label = "expirat (>10 min)"
 
-    sleep_until = before_end_5m.strftime("%Y-%m-%dT%H:%M:%S%z")
+    sleep_until = datetime.fromtimestamp(before_end_5m, tz).strftime("%Y-%m-%dT%H:%M:%S%z")
 
     # Publicăm "off" pentru pre/post (ecran unificat)
     if mode_internal in ("pre", "post"):
@@ -439,42 +479,30 @@ def api_monitor_status():
     # Token doar în active/end
     qr_token = None
     if mode in ("active", "end"):
-        s = get_qr_serializer(current_app)
         phase = "start" if mode == "active" else "end"
-        qr_token = s.dumps({"session_id": session_id, "phase": phase})
+        qr_token = issue_qr_token(current_app, session_id, phase, now_ts)
 
 
     # Dacă suntem "pre", anunțăm când se deschide fereastra (T-5)
     next_window_at = None
     next_window_hhmm = None
     if mode_internal == "pre":
-        nxt = wins["w_checkin_start"]  # datetime aware
+        nxt = datetime.fromtimestamp(wins["w_checkin_start"], tz)
         next_window_at = nxt.strftime("%Y-%m-%dT%H:%M:%S%z")
         next_window_hhmm = nxt.strftime("%H:%M")
 
 
-    # prezent acum (doar pentru calcul intern)
-    present_now = sum(1 for h in authorized if status_map.get(h) in ("prezent", "întârziat"))
-    total = len(authorized)
+    # contoarele sesiunii (session_summary, ținută la zi de triggere)
+    cur.execute("SELECT roster, prezenti, intarziati, plecati FROM session_summary WHERE session_id=?", (session_id,))
+    total, prez, intr, left_count = cur.fetchone() or (0, 0, 0, 0)
+    present_now = prez + intr  # prezent acum (doar pentru calcul intern)
 
-    # citește snapshot-ul (dacă există)
-    cur2 = get_connection().cursor()
-    cur2.execute("SELECT present_frozen, present_frozen_at FROM session WHERE id=?", (session_id,))
-    snap = cur2.fetchone()
-    present_frozen = snap["present_frozen"] if snap else None
-    present_frozen_at = snap["present_frozen_at"] if snap else None
-
-    # dacă am depășit +10 min și nu avem snapshot, îl setăm ACUM (o singură dată)
-    delta = int((now - starts_at).total_seconds())
+    # snapshot-ul îl scrie ciclul de viață (lifecycle) la T+10; până rulează,
+    # aceeași valoare se calculează aici, fără să scriem dintr-un GET
+    present_frozen = sess["present_frozen"]
     if delta >= 10 * 60 and present_frozen is None:
-        cur2.execute(
-            "UPDATE session SET present_frozen=?, present_frozen_at=? WHERE id=?",
-            (present_now, now.strftime("%Y-%m-%dT%H:%M:%S%z"), session_id),
-        )
-        cur2.connection.commit()
-        present_frozen = present_now
-        present_frozen_at = now.strftime("%Y-%m-%dT%H:%M:%S%z")
-    cur2.connection.close()
+        cur.execute(FROZEN_COUNT_SQL, (class_id, session_id))
+        present_frozen = cur.fetchone()[0]
 
     # ce raportăm UI-ului?
     if delta >= 10 * 60 and present_frozen is not None:
@@ -482,14 +510,12 @@ def api_monitor_status():
     else:
         present_count = present_now
 
-    left_count = sum(1 for st in status_map.values() if st == "plecat")
-
     data_curenta = now.strftime("%d %b %Y")  # ex: 23 Sep 2025
 
 
-    window_label = _window_label(now, starts_at, current_app.config)
+    window_label = _window_label(now_ts, starts_ts, current_app.config)
 
-    return jsonify({
+    return {
         "class_id": class_id,
         "session_id": session_id,
         "ora_curenta": now.strftime("%H:%M"),
@@ -508,7 +534,7 @@ def api_monitor_status():
         "next_window_hhmm": next_window_hhmm,  # "HH:MM" sau None
         "codes": codes
 
-    })
+    }
 
 
 @bp.get("/qr.png")
@@ -519,62 +545,49 @@ def qr_png():
     # URL pe care îl va deschide QR-ul pe telefon
     # (folosim token, nu session_id, ca să nu poată fi modificat)
     url = url_for("main.elev", token=token, _external=True)
+    resp = current_app.response_class(_qr_png_bytes(url), mimetype="image/png")
+    # imaginea depinde doar de token: clientul o poate păstra cât e valid tokenul
+    resp.set_etag(hashlib.sha1(url.encode("utf-8")).hexdigest())
+    resp.cache_control.public = True
+    resp.cache_control.max_age = current_app.config["QR_MAX_AGE"]
+    return resp.make_conditional(request)
+
+
+@lru_cache(maxsize=256)
+def _qr_png_bytes(url: str) -> bytes:
+    """PNG-ul codat pentru URL; un token e randat o singură dată per proces."""
+    import qrcode  # doar în QR_RENDER_MODE=server; în modul client nu se încarcă deloc
     img = qrcode.make(url)
     buf = BytesIO()
     img.save(buf, format="PNG")
-    buf.seek(0)
-    return send_file(buf, mimetype="image/png", max_age=0)
+    return buf.getvalue()
 
 
-def _find_or_create_current_session(tz):
+def _find_current_session(tz):
     now = datetime.now(tz)
-    weekday = now.isoweekday()  # 1..7
-    if weekday > 5:
-        return None  # weekend
-
-    # află ce period ar fi în fereastra noastră (start-5 .. end+10)
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("SELECT period_no, start_hhmm FROM period ORDER BY period_no")
-    periods = cur.fetchall()
-
-    candidate = None
-    for p in periods:
-        start_today = aware_from_hhmm(now.date(), p["start_hhmm"], tz)
-        end_today = start_today + timedelta(minutes=60)
-        if (start_today - timedelta(minutes=5)) <= now <= (end_today + timedelta(minutes=10)):
-            candidate = (p["period_no"], start_today, end_today)
-            break
-    if not candidate:
-        conn.close()
-        return None
-
-    period_no, starts, ends = candidate
-    # caută în schedule clasa programată
-    cur.execute("SELECT class_id FROM schedule WHERE weekday=? AND period_no=?", (weekday, period_no))
-    row = cur.fetchone()
-    if not row:
-        conn.close(); return None
-    class_id = row["class_id"]
-
-    # cauți sesiunea existentă sau creezi dacă flagul e ON
+    conn = get_db(); cur = conn.cursor()
+
+    # orarul compilat: slotul din fereastra noastră (start-5 .. end+10), fără SQL
+    timetable = get_timetable(conn)
+    slot = timetable.slot_at(now)
+    if not slot or not slot.class_id:
+        return None  # pauză, weekend, vacanță sau oră neprogramată
+    class_id = slot.class_id
+    starts, _ = slot.bounds(now.date(), tz)
+
+    # sesiunea o creează ciclul de viață; aici doar o căutăm
+    # (id-urile găsite rămân în cache până la schimbarea orarului)
     starts_iso = starts.strftime("%Y-%m-%dT%H:%M:%S%z")
+    sid = timetable.session_ids.get((class_id, starts_iso))
+    if sid:
+        return sid
     cur.execute("SELECT id FROM session WHERE class_id=? AND starts_at=?", (class_id, starts_iso))
     srow = cur.fetchone()
     if srow:
-        sid = srow["id"]; conn.close(); return sid
-
-    # creează doar dacă e activat
-    if not current_app.config.get("AUTO_SESSIONS_ENABLED", False):
-        conn.close(); return None
-
-    try:
-        cur.execute("INSERT INTO session(class_id, starts_at, ends_at) VALUES (?,?,?)",
-                    (class_id, starts_iso, ends.strftime("%Y-%m-%dT%H:%M:%S%z")))
-        conn.commit()
-        sid = cur.lastrowid
-    finally:
-        conn.close()
-    return sid
+        sid = srow["id"]
+        timetable.session_ids[(class_id, starts_iso)] = sid
+        return sid
+    return None
 
 
 @bp.get("/monitor")
@@ -584,7 +597,7 @@ def monitor_auto():
     if sid:
         return monitor()  # ruta ta existentă care randă monitor pentru un id
 
-    sid = _find_or_create_current_session(current_app.config["TZ"])
+    sid = _find_current_session(current_app.config["TZ"])
     if sid:
         return redirect(url_for("main.monitor", session_id=sid), code=302)
     # nici o sesiune validă: arată monitor “off” (poți avea un template minimal)
@@ -0,0 +1,201 @@
+"""
+Jurnalul interogărilor lente (opt-in: SLOW_QUERY_MS > 0).
+
+Orice instrucțiune peste prag (timp măsurat de `sqltrace.TimedConnection`,
+inclusiv citirea rândurilor) e scrisă în log-ul aplicației cu:
+SQL-ul normalizat, forma parametrilor (tipuri, nu valori — fără coduri sau
+device-uri în log), ruta și fișier:linia din app/ care a emis-o și
+`EXPLAIN QUERY PLAN`.
+
+Pe request-uri, raportarea se face la teardown, cu timpul final; în afara lor
+(ciclul de viață, writer-ul attempt_log) imediat ce pragul e depășit.
+
+Agregatul pe zi și interogare (apeluri, timp total / maxim, ultimul plan) se
+ține într-o bază separată (SLOW_QUERY_DB, implicit instance/slow_queries.db),
+ca scrierea lui să nu concureze cu DB-ul principal; zilele mai vechi de
+SLOW_QUERY_KEEP_DAYS se șterg. Top-ul: `flask slow-queries --days 7 --top 20`.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from flask import current_app, g, has_request_context, request
+
+from .sqltrace import SKIP_PREFIXES, TimedConnection, app_caller, explain, normalize_sql
+
+log = logging.getLogger(__name__)
+
+# câte instrucțiuni lente reținem per request (un raport care o ia razna nu umple memoria)
+MAX_PER_REQUEST = 20
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS slow_query (
+        day TEXT NOT NULL,
+        sql TEXT NOT NULL,
+        calls INTEGER NOT NULL,
+        total_s REAL NOT NULL,
+        max_s REAL NOT NULL,
+        route TEXT,
+        caller TEXT,
+        params TEXT,
+        plan TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (day, sql)
+    ) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class SlowQuery:
+    sql: str
+    calls: int
+    total_s: float
+    max_s: float
+    route: str
+    caller: str
+    params: str
+    plan: list[str]
+
+
+def params_shape(params) -> str:
+    """Tipurile parametrilor, fără valori: (int, str, NoneType) / {id: int} / executemany."""
+    if isinstance(params, str):
+        return params  # "executemany" / "script"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return type(params).__name__
+
+
+def slow_db_path() -> Path:
+    cfg_path = current_app.config.get("SLOW_QUERY_DB")
+    path = Path(cfg_path) if cfg_path else Path(current_app.instance_path) / "slow_queries.db"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _connect_store(path: Path):
+    conn = sqlite3.connect(path.as_posix(), timeout=1.0)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _plan(conn, stmt) -> list[str]:
+    if isinstance(stmt.params, str) or stmt.sql.lstrip().upper().startswith(SKIP_PREFIXES):
+        return []  # executemany / executescript / BEGIN, COMMIT...
+    slow_s, conn.slow_s = conn.slow_s, None  # EXPLAIN-ul însuși nu se raportează
+    try:
+        return explain(conn, stmt.sql, stmt.params)[0]
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.slow_s = slow_s
+
+
+def _report(conn, stmt, route: str, caller: str) -> dict:
+    sql = normalize_sql(stmt.sql)
+    entry = {"sql": sql, "seconds": stmt.seconds, "route": route, "caller": caller,
+             "params": params_shape(stmt.params), "plan": _plan(conn, stmt)}
+    log.warning("slow query %.1f ms [%s %s] %s params=%s plan=%s",
+                stmt.seconds * 1000, route, caller, sql, entry["params"], " | ".join(entry["plan"]))
+    return entry
+
+
+def _store(app, entries: list[dict]) -> None:
+    """Adaugă instrucțiunile lente în agregatul zilei; eșecul doar se loghează."""
+    now = datetime.now(app.config["TZ"])
+    day = now.date().isoformat()
+    try:
+        conn = _connect_store(slow_db_path())
+    except sqlite3.Error as e:
+        log.warning("slow query: nu pot deschide agregatul (%s)", e)
+        return
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO slow_query(day, sql, calls, total_s, max_s, route, caller, params, plan, last_seen)"
+                " VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(day, sql) DO UPDATE SET calls = calls + 1, total_s = total_s + excluded.total_s,"
+                " max_s = max(max_s, excluded.max_s), route = excluded.route, caller = excluded.caller,"
+                " params = excluded.params, plan = excluded.plan, last_seen = excluded.last_seen",
+                [(day, e["sql"], e["seconds"], e["seconds"], e["route"], e["caller"], e["params"],
+                  json.dumps(e["plan"], ensure_ascii=False), now.isoformat(timespec="seconds")) for e in entries],
+            )
+            keep = app.config.get("SLOW_QUERY_KEEP_DAYS", 30)
+            conn.execute("DELETE FROM slow_query WHERE day < ?", ((now.date() - timedelta(days=keep)).isoformat(),))
+    except sqlite3.Error as e:
+        log.warning("slow query: agregat nescris (%s)", e)
+    finally:
+        conn.close()
+
+
+def _on_slow(conn, stmt) -> None:
+    """Apelat de TimedConnection când o instrucțiune trece de prag."""
+    try:
+        if has_request_context():
+            pending = g.setdefault("slow_statements", [])
+            if len(pending) < MAX_PER_REQUEST:
+                pending.append((stmt, app_caller()))
+            return
+        entry = _report(conn, stmt, threading.current_thread().name, app_caller())
+        _store(current_app._get_current_object(), [entry])
+    except Exception:
+        log.exception("slow query: raportare eșuată")
+
+
+def _connect_hook(conn) -> None:
+    if isinstance(conn, TimedConnection):
+        conn.slow_s = current_app.config["SLOW_QUERY_MS"] / 1000
+        conn.on_slow = _on_slow
+
+
+def _flush_request(exc=None) -> None:
+    """teardown_request: g.db e încă deschisă (pentru EXPLAIN), timpii sunt finali."""
+    pending = g.pop("slow_statements", None)
+    conn = g.get("db")
+    if not pending or conn is None:
+        return
+    route = f"{request.method} {request.endpoint or request.path}"
+    try:
+        entries = [_report(conn, stmt, route, caller) for stmt, caller in pending]
+    except sqlite3.Error as e:
+        log.warning("slow query: EXPLAIN eșuat (%s)", e)
+        return
+    _store(current_app._get_current_object(), entries)
+
+
+def top_queries(path: Path, *, since_day: str, top: int = 20) -> list[SlowQuery]:
+    """Cele mai costisitoare interogări (timp total) din zilele >= since_day."""
+    if not path.exists():
+        return []
+    conn = _connect_store(path)
+    try:
+        rows = conn.execute(
+            # ruta / planul vin din ultima zi în care a apărut interogarea
+            "SELECT a.sql, a.calls, a.total_s, a.max_s, s.route, s.caller, s.params, s.plan"
+            " FROM (SELECT sql, sum(calls) AS calls, sum(total_s) AS total_s, max(max_s) AS max_s,"
+            "              max(day) AS last_day"
+            "       FROM slow_query WHERE day >= ? GROUP BY sql) a"
+            " JOIN slow_query s ON s.day = a.last_day AND s.sql = a.sql"
+            " ORDER BY a.total_s DESC LIMIT ?",
+            (since_day, top),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [SlowQuery(sql, calls, total_s, max_s, route, caller, params, json.loads(plan or "[]"))
+            for sql, calls, total_s, max_s, route, caller, params, plan in rows]
+
+
+def init_app(app) -> None:
+    if app.config.get("SLOW_QUERY_MS", 0) <= 0:
+        return
+    app.extensions["sala_db_factory"] = TimedConnection
+    app.extensions.setdefault("sala_db_connect_hooks", []).append(_connect_hook)
+    app.teardown_request(_flush_request)
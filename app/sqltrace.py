@@ -0,0 +1,164 @@
+"""
+Conexiunea SQLite cronometrată (fabrica din `get_connection()`).
+
+`TimedConnection` adună, per conexiune (= per request pe `get_db()`), timpul
+petrecut în SQLite, numărul instrucțiunilor și erorile „database is locked".
+Timpul unei instrucțiuni = execute + citirea rândurilor pe același cursor
+(pașii sqlite3_step rulează și la fetch / iterare).
+
+Cu `slow_s` setat, fiecare instrucțiune care depășește pragul e semnalată o
+singură dată prin `on_slow(conn, stmt)`; `stmt.seconds` continuă să crească
+cât timp se mai citesc rânduri. O folosesc `metrics` și `slowlog`.
+
+Tot aici, ajutoarele comune pentru `slowlog` (pe request) și `queryplan` (CLI):
+SQL normalizat, fișier:linia apelantului din app/, `EXPLAIN QUERY PLAN`.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+@dataclass
+class TracedStatement:
+    sql: str
+    params: Any
+    seconds: float = 0.0
+    reported: bool = False
+
+
+class TimedCursor(sqlite3.Cursor):
+    _stmt: Optional[TracedStatement] = None
+
+    def execute(self, sql, params=()):
+        return self.connection._timed(super().execute, sql, params, cursor=self, start=(sql, params))
+
+    def executemany(self, sql, seq):
+        return self.connection._timed(super().executemany, sql, seq, cursor=self, start=(sql, "executemany"))
+
+    def executescript(self, script):
+        return self.connection._timed(super().executescript, script, cursor=self, start=(script, "script"))
+
+    def fetchone(self):
+        return self.connection._timed(super().fetchone, cursor=self, count=False)
+
+    def fetchmany(self, *args):
+        return self.connection._timed(super().fetchmany, *args, cursor=self, count=False)
+
+    def fetchall(self):
+        return self.connection._timed(super().fetchall, cursor=self, count=False)
+
+    def __next__(self):
+        return self.connection._timed(super().__next__, cursor=self, count=False)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection care adună timpul și numărul instrucțiunilor."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sql_seconds = 0.0
+        self.sql_statements = 0
+        self.sql_lock_errors = 0
+        self.slow_s: Optional[float] = None
+        self.on_slow: Optional[Callable] = None
+
+    def _timed(self, fn, *args, cursor=None, start=None, count=True):
+        if start is not None:
+            cursor._stmt = TracedStatement(*start) if self.slow_s is not None else None
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            msg = str(e)
+            if "locked" in msg or "busy" in msg:
+                self.sql_lock_errors += 1
+            raise
+        finally:
+            dt = time.perf_counter() - t0
+            self.sql_seconds += dt
+            if count:
+                self.sql_statements += 1
+            stmt = cursor._stmt if cursor is not None else None
+            if stmt is not None:
+                stmt.seconds += dt
+                if not stmt.reported and stmt.seconds >= self.slow_s:
+                    stmt.reported = True
+                    self.on_slow(self, stmt)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or TimedCursor)
+
+    # Connection.execute* din C nu trec prin cursor() suprascris
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def commit(self):
+        return self._timed(super().commit)
+
+    def rollback(self):
+        return self._timed(super().rollback)
+
+
+# ---------------------------------------------------------------------------
+# ajutoare comune: slowlog + queryplan
+
+# pentru `explain`: tabele mici citite integral intenționat (orarul e compilat în memorie din ele)
+ALLOWED_SCANS = {"period", "schedule", "holiday"}
+
+SKIP_PREFIXES = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "CREATE", "DROP", "ALTER", "EXPLAIN", "--", "SAVEPOINT", "RELEASE")
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def normalize_sql(sql: str) -> str:
+    """Valorile literale → ?, spațiile comprimate (cheia de deduplicare)."""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\?(?:\s*,\s*\?)+", "?", sql)
+    return " ".join(sql.split())
+
+
+def app_caller() -> str:
+    """fișier:linie din app/ care a emis instrucțiunea (sare peste stratul de DB / trace)."""
+    f = sys._getframe(2)
+    while f is not None:
+        fn = f.f_code.co_filename
+        if fn.startswith(_APP_DIR) and not fn.endswith(("db.py", "queryplan.py", "sqltrace.py", "slowlog.py")):
+            return f"{os.path.relpath(fn, os.path.dirname(_APP_DIR))}:{f.f_lineno}"
+        f = f.f_back
+    return "?"
+
+
+def _aliases(sql: str) -> dict[str, str]:
+    """alias → tabelă, din clauzele FROM / JOIN / UPDATE / INTO."""
+    out = {}
+    for table, alias in re.findall(r"(?i)\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql):
+        out[table] = table
+        if alias and alias.upper() not in {"WHERE", "ON", "SET", "JOIN", "LEFT", "INNER", "GROUP",
+                                           "ORDER", "LIMIT", "VALUES", "SELECT", "USING", "AS"}:
+            out[alias] = table
+    return out
+
+
+def explain(conn, sql: str, params=()) -> tuple[list[str], list[str]]:
+    """(planul, liniile care citesc integral o tabelă). `params` dacă sql-ul are `?`."""
+    aliases = _aliases(sql)
+    plan, scans = [], []
+    for _, _, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+        plan.append(detail)
+        m = re.match(r"SCAN (\w+)", detail)
+        if not m or "VIRTUAL TABLE" in detail or m.group(1) == "CONSTANT":
+            continue
+        if aliases.get(m.group(1), m.group(1)) not in ALLOWED_SCANS:
+            scans.append(detail)
+    return plan, scans
@@ -0,0 +1,141 @@
+"""
+Orarul (period + schedule + holiday) compilat în memorie.
+
+Pentru fiecare zi a săptămânii intervalele de căutare ale perioadelor
+([start - 5 min, sfârșit + 10 min]) sunt transformate în segmente care nu se
+suprapun, fiecare cu răspunsul gata calculat (prima perioadă care acoperă
+momentul, ca înainte). „Ce oră e acum?" devine o căutare binară.
+
+Indexul se reconstruiește doar când se schimbă `meta.timetable_version`
+(incrementat de seed-periods / import-schedule / add-holiday); versiunea e
+verificată cel mult o dată la TIMETABLE_RECHECK_S secunde.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from flask import current_app
+
+from .utils import aware_from_hhmm
+
+DEFAULT_LENGTH_MIN = 60     # durata unui slot dacă period.length_min e NULL
+LOOKUP_BEFORE_MIN = 5       # monitorul „vede" ora cu 5 min înainte de start
+LOOKUP_AFTER_END_MIN = 10   # ... și până la 10 min după final
+
+
+@dataclass(frozen=True)
+class Slot:
+    period_no: int
+    start_hhmm: str
+    length_min: int
+    class_id: Optional[str]
+
+    def bounds(self, day: date, tz) -> tuple[datetime, datetime]:
+        starts = aware_from_hhmm(day, self.start_hhmm, tz)
+        return starts, starts + timedelta(minutes=self.length_min)
+
+
+def _seconds(hhmm: str) -> int:
+    h, m = hhmm.split(":")
+    return int(h) * 3600 + int(m) * 60
+
+
+class TimetableIndex:
+    def __init__(self, periods, schedule: dict, holidays: set, version: int):
+        """
+        periods:  [(period_no, start_hhmm, length_min|None)]
+        schedule: {(weekday, period_no): class_id}, weekday 1=Luni
+        holidays: {'YYYY-MM-DD', ...}
+        """
+        self.version = version
+        self.holidays = frozenset(holidays)
+        self.session_ids: dict[tuple[str, str], int] = {}
+        periods = sorted(periods, key=lambda p: _seconds(p[1]))
+
+        self._by_weekday: dict[int, list[Slot]] = {}
+        self._segments: dict[int, tuple[list[float], list[Optional[Slot]]]] = {}
+        for wd in range(1, 8):
+            slots = [Slot(no, hhmm, length or DEFAULT_LENGTH_MIN, schedule.get((wd, no)))
+                     for no, hhmm, length in periods]
+            self._by_weekday[wd] = slots
+            self._segments[wd] = self._compile(slots)
+
+    @staticmethod
+    def _compile(slots):
+        windows = []
+        for s in slots:
+            start = _seconds(s.start_hhmm)
+            lo = start - LOOKUP_BEFORE_MIN * 60
+            hi = start + (s.length_min + LOOKUP_AFTER_END_MIN) * 60
+            windows.append((lo, hi, s))
+
+        # capete închise [lo, hi]: segmentele sunt [a, b) cu b = hi + ε
+        points = sorted({lo for lo, _, _ in windows} | {hi + 1e-6 for _, hi, _ in windows})
+        starts: list[float] = [float("-inf")]
+        answers: list[Optional[Slot]] = [None]
+        for p in points:
+            answer = next((s for lo, hi, s in windows if lo <= p <= hi), None)
+            if answer is not answers[-1]:
+                starts.append(p)
+                answers.append(answer)
+        return starts, answers
+
+    def slot_at(self, now: datetime) -> Optional[Slot]:
+        """Slotul „curent" (prima perioadă a cărei fereastră conține `now`)."""
+        if now.strftime("%Y-%m-%d") in self.holidays:
+            return None
+        starts, answers = self._segments[now.isoweekday()]
+        sod = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+        return answers[bisect_right(starts, sod) - 1]
+
+    def slots_for(self, day: date) -> list[Slot]:
+        """Sloturile programate (cu clasă) într-o zi; goală în vacanțe."""
+        if day.strftime("%Y-%m-%d") in self.holidays:
+            return []
+        return [s for s in self._by_weekday[day.isoweekday()] if s.class_id]
+
+    @classmethod
+    def load(cls, conn, version: int) -> "TimetableIndex":
+        cur = conn.cursor()
+        cur.execute("SELECT period_no, start_hhmm, length_min FROM period ORDER BY period_no")
+        periods = [(r[0], r[1], r[2]) for r in cur.fetchall()]
+        cur.execute("SELECT weekday, period_no, class_id FROM schedule")
+        schedule = {(r[0], r[1]): r[2] for r in cur.fetchall()}
+        cur.execute("SELECT day FROM holiday")
+        holidays = {r[0] for r in cur.fetchall()}
+        return cls(periods, schedule, holidays, version)
+
+
+def _read_version(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key='timetable_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def bump_timetable_version(cur) -> None:
+    """De apelat în aceeași tranzacție cu orice modificare de period/schedule/holiday."""
+    cur.execute(
+        "INSERT INTO meta(key, value) VALUES ('timetable_version', 1)"
+        " ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+
+_lock = threading.Lock()
+
+
+def get_timetable(conn) -> TimetableIndex:
+    ext = current_app.extensions
+    state = ext.get("sala_timetable")
+    now = time.monotonic()
+    if state and now - state[1] < current_app.config.get("TIMETABLE_RECHECK_S", 30):
+        return state[0]
+
+    with _lock:
+        version = _read_version(conn)
+        index = state[0] if state and state[0].version == version else TimetableIndex.load(conn, version)
+        ext["sala_timetable"] = (index, now)
+    return index
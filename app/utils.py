@@ -1,12 +1,39 @@
 # app/utils.py
 from datetime import datetime, timedelta
-from itsdangerous import URLSafeTimedSerializer
+from itsdangerous import TimestampSigner, URLSafeTimedSerializer
 
 def get_qr_serializer(app):
     # Folosește SECRET_KEY deja setat în config
     secret = app.config["SECRET_KEY"]
     return URLSafeTimedSerializer(secret, salt="qr")
 
+
+class _EpochSigner(TimestampSigner):
+    """TimestampSigner cu timpul fixat la începutul epocii de rotație."""
+
+    def __init__(self, *args, epoch_ts: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.epoch_ts = epoch_ts
+
+    def get_timestamp(self) -> int:
+        return self.epoch_ts
+
+
+def qr_epoch_start(app, now_ts: float) -> int:
+    rotate = max(1, int(app.config["QR_ROTATE_S"]))
+    return int(now_ts) // rotate * rotate
+
+
+def issue_qr_token(app, session_id: int, phase: str, now_ts: float) -> str:
+    """
+    Token QR determinist: același pentru (sesiune, fază, epocă de QR_ROTATE_S),
+    deci monitorul descarcă o imagine nouă doar la rotație. Se validează ca
+    oricare token din get_qr_serializer (vârsta se numără de la începutul epocii).
+    """
+    s = URLSafeTimedSerializer(app.config["SECRET_KEY"], salt="qr", signer=_EpochSigner,
+                               signer_kwargs={"epoch_ts": qr_epoch_start(app, now_ts)})
+    return s.dumps({"session_id": session_id, "phase": phase})
+
 def parse_iso(s: str) -> datetime:
     """
     Acceptă ISO cu offset cu sau fără “:”, ex:
@@ -0,0 +1,259 @@
+/*
+ * Encoder QR minimal (mod byte, corecție M, versiunile 1–40) pentru monitor.
+ * Randează în browser linkul de check-in, ca serverul să nu mai genereze PNG-uri
+ * (QR_RENDER_MODE=client sau /monitor?qr=client).
+ *
+ *   SalaQR.encode(text, mask?) -> { size, modules: boolean[][] }
+ *   SalaQR.toSVG(text)         -> string '<svg ...>' (cu quiet zone de 4 module)
+ */
+(function (global) {
+  'use strict';
+
+  // Corecție M, per versiune: [ec/bloc, blocuri g1, date g1, (blocuri g2, date g2)]
+  const RS_M = [[10,1,16],[16,1,28],[26,1,44],[18,2,32],[24,2,43],[16,4,27],[18,4,31],[22,2,38,2,39],[22,3,36,2,37],[26,4,43,1,44],[30,1,50,4,51],[22,6,36,2,37],[22,8,37,1,38],[24,4,40,5,41],[24,5,41,5,42],[28,7,45,3,46],[28,10,46,1,47],[26,9,43,4,44],[26,3,44,11,45],[26,3,41,13,42],[26,17,42],[28,17,46],[28,4,47,14,48],[28,6,45,14,46],[28,8,47,13,48],[28,19,46,4,47],[28,22,45,3,46],[28,3,45,23,46],[28,21,45,7,46],[28,19,47,10,48],[28,2,46,29,47],[28,10,46,23,47],[28,14,46,21,47],[28,14,46,23,47],[28,12,47,26,48],[28,6,47,34,48],[28,29,46,14,47],[28,13,46,32,47],[28,40,47,7,48],[28,18,47,31,48]];
+  const ALIGN = [[],[6,18],[6,22],[6,26],[6,30],[6,34],[6,22,38],[6,24,42],[6,26,46],[6,28,50],[6,30,54],[6,32,58],[6,34,62],[6,26,46,66],[6,26,48,70],[6,26,50,74],[6,30,54,78],[6,30,56,82],[6,30,58,86],[6,34,62,90],[6,28,50,72,94],[6,26,50,74,98],[6,30,54,78,102],[6,28,54,80,106],[6,32,58,84,110],[6,30,58,86,114],[6,34,62,90,118],[6,26,50,74,98,122],[6,30,54,78,102,126],[6,26,52,78,104,130],[6,30,56,82,108,134],[6,34,60,86,112,138],[6,30,58,86,114,142],[6,34,62,90,118,146],[6,30,54,78,102,126,150],[6,24,50,76,102,128,154],[6,28,54,80,106,132,158],[6,32,58,84,110,136,162],[6,26,54,82,110,138,166],[6,30,58,86,114,142,170]];
+  const EC_BITS_M = 0;
+
+  const MASKS = [
+    (i, j) => (i + j) % 2 === 0,
+    (i, j) => i % 2 === 0,
+    (i, j) => j % 3 === 0,
+    (i, j) => (i + j) % 3 === 0,
+    (i, j) => (Math.floor(i / 2) + Math.floor(j / 3)) % 2 === 0,
+    (i, j) => (i * j) % 2 + (i * j) % 3 === 0,
+    (i, j) => ((i * j) % 2 + (i * j) % 3) % 2 === 0,
+    (i, j) => ((i * j) % 3 + (i + j) % 2) % 2 === 0,
+  ];
+
+  // —— GF(256), polinom 0x11d ——
+  const EXP = new Array(512), LOG = new Array(256);
+  (function () {
+    let x = 1;
+    for (let i = 0; i < 255; i++) {
+      EXP[i] = x; LOG[x] = i;
+      x <<= 1; if (x & 0x100) x ^= 0x11d;
+    }
+    for (let i = 255; i < 512; i++) EXP[i] = EXP[i - 255];
+  })();
+  const gmul = (a, b) => (a && b) ? EXP[LOG[a] + LOG[b]] : 0;
+
+  function rsGenerator(deg) {
+    let g = [1];
+    for (let i = 0; i < deg; i++) {
+      const next = new Array(g.length + 1).fill(0);
+      for (let j = 0; j < g.length; j++) {
+        next[j] ^= g[j];
+        next[j + 1] ^= gmul(g[j], EXP[i]);
+      }
+      g = next;
+    }
+    return g;
+  }
+
+  function rsEncode(data, ecLen) {
+    const gen = rsGenerator(ecLen);
+    const res = data.concat(new Array(ecLen).fill(0));
+    for (let i = 0; i < data.length; i++) {
+      const coef = res[i];
+      if (coef) for (let j = 0; j < gen.length; j++) res[i + j] ^= gmul(gen[j], coef);
+    }
+    return res.slice(data.length);
+  }
+
+  function bchDigit(d) { let n = 0; while (d) { n++; d >>>= 1; } return n; }
+  function bch(data, gen, shift) {
+    let d = data << shift;
+    while (bchDigit(d) - bchDigit(gen) >= 0) d ^= gen << (bchDigit(d) - bchDigit(gen));
+    return (data << shift) | d;
+  }
+
+  function utf8(text) {
+    return Array.from(new TextEncoder().encode(text));
+  }
+
+  function blocksFor(version) {
+    const r = RS_M[version - 1], out = [];
+    for (let k = 1; k < r.length; k += 2) for (let n = 0; n < r[k]; n++) out.push(r[k + 1]);
+    return { ec: r[0], data: out };
+  }
+
+  function codewords(bytes, version) {
+    const { ec, data } = blocksFor(version);
+    const capacity = data.reduce((a, b) => a + b, 0);
+    const bits = [];
+    const put = (num, len) => { for (let i = len - 1; i >= 0; i--) bits.push((num >>> i) & 1); };
+    put(0b0100, 4);
+    put(bytes.length, version < 10 ? 8 : 16);
+    bytes.forEach(b => put(b, 8));
+    if (bits.length > capacity * 8) return null;
+    for (let i = 0; i < 4 && bits.length < capacity * 8; i++) bits.push(0);
+    while (bits.length % 8) bits.push(0);
+    for (let i = 0; bits.length < capacity * 8; i++) put(i % 2 ? 0x11 : 0xEC, 8);
+
+    const all = [];
+    for (let i = 0; i < bits.length; i += 8) all.push(parseInt(bits.slice(i, i + 8).join(''), 2));
+
+    const dataBlocks = [], ecBlocks = [];
+    let off = 0;
+    for (const n of data) {
+      const blk = all.slice(off, off + n); off += n;
+      dataBlocks.push(blk);
+      ecBlocks.push(rsEncode(blk, ec));
+    }
+    const out = [];
+    const maxData = Math.max(...data);
+    for (let i = 0; i < maxData; i++) dataBlocks.forEach(b => { if (i < b.length) out.push(b[i]); });
+    for (let i = 0; i < ec; i++) ecBlocks.forEach(b => out.push(b[i]));
+    return out;
+  }
+
+  function baseMatrix(version) {
+    const n = version * 4 + 17;
+    const m = Array.from({ length: n }, () => new Array(n).fill(null));
+
+    const probe = (row, col) => {
+      for (let r = -1; r <= 7; r++) {
+        if (row + r < 0 || row + r >= n) continue;
+        for (let c = -1; c <= 7; c++) {
+          if (col + c < 0 || col + c >= n) continue;
+          m[row + r][col + c] = (r >= 0 && r <= 6 && (c === 0 || c === 6)) ||
+                                (c >= 0 && c <= 6 && (r === 0 || r === 6)) ||
+                                (r >= 2 && r <= 4 && c >= 2 && c <= 4);
+        }
+      }
+    };
+    probe(0, 0); probe(n - 7, 0); probe(0, n - 7);
+
+    const pos = ALIGN[version - 1];
+    for (const row of pos) for (const col of pos) {
+      if (m[row][col] !== null) continue;
+      for (let r = -2; r <= 2; r++) for (let c = -2; c <= 2; c++) {
+        m[row + r][col + c] = r === -2 || r === 2 || c === -2 || c === 2 || (r === 0 && c === 0);
+      }
+    }
+
+    for (let i = 8; i < n - 8; i++) {
+      if (m[i][6] === null) m[i][6] = i % 2 === 0;
+      if (m[6][i] === null) m[6][i] = i % 2 === 0;
+    }
+    return m;
+  }
+
+  function placeFormat(m, mask) {
+    const n = m.length;
+    const bits = bch((EC_BITS_M << 3) | mask, 0x537, 10) ^ 0x5412;
+    for (let i = 0; i < 15; i++) {
+      const on = ((bits >> i) & 1) === 1;
+      if (i < 6) m[i][8] = on;
+      else if (i < 8) m[i + 1][8] = on;
+      else m[n - 15 + i][8] = on;
+
+      if (i < 8) m[8][n - i - 1] = on;
+      else if (i < 9) m[8][15 - i] = on;
+      else m[8][14 - i] = on;
+    }
+    m[n - 8][8] = true;
+  }
+
+  function placeVersion(m, version) {
+    if (version < 7) return;
+    const n = m.length;
+    const bits = bch(version, 0x1F25, 12);
+    for (let i = 0; i < 18; i++) {
+      const on = ((bits >> i) & 1) === 1;
+      m[Math.floor(i / 3)][i % 3 + n - 11] = on;
+      m[i % 3 + n - 11][Math.floor(i / 3)] = on;
+    }
+  }
+
+  function placeData(m, data, mask) {
+    const n = m.length, fn = MASKS[mask];
+    let inc = -1, row = n - 1, bitIndex = 7, byteIndex = 0;
+    for (let right = n - 1; right > 0; right -= 2) {
+      const col = right <= 6 ? right - 1 : right;   // sărim peste coloana de timing
+      for (;;) {
+        for (const c of [col, col - 1]) {
+          if (m[row][c] !== null) continue;
+          let dark = byteIndex < data.length && ((data[byteIndex] >> bitIndex) & 1) === 1;
+          if (fn(row, c)) dark = !dark;
+          m[row][c] = dark;
+          if (--bitIndex === -1) { byteIndex++; bitIndex = 7; }
+        }
+        row += inc;
+        if (row < 0 || row >= n) { row -= inc; inc = -inc; break; }
+      }
+    }
+  }
+
+  // Penalizările N1–N4 din standard: alegem masca cu scorul minim
+  function penalty(m) {
+    const n = m.length;
+    let score = 0, dark = 0;
+    for (let i = 0; i < n; i++) {
+      for (const line of [r => m[i][r], r => m[r][i]]) {
+        let run = 1;
+        for (let j = 1; j < n; j++) {
+          if (line(j) === line(j - 1)) run++;
+          else { if (run >= 5) score += run - 2; run = 1; }
+        }
+        if (run >= 5) score += run - 2;
+        for (let j = 0; j + 10 < n; j++) {
+          let a = true, b = true;
+          const p = [1,0,1,1,1,0,1,0,0,0,0];
+          for (let k = 0; k < 11; k++) {
+            if (line(j + k) !== !!p[k]) a = false;
+            if (line(j + k) !== !!p[10 - k]) b = false;
+          }
+          if (a) score += 40;
+          if (b) score += 40;
+        }
+      }
+    }
+    for (let i = 0; i < n - 1; i++) for (let j = 0; j < n - 1; j++) {
+      const v = m[i][j];
+      if (v === m[i + 1][j] && v === m[i][j + 1] && v === m[i + 1][j + 1]) score += 3;
+    }
+    for (let i = 0; i < n; i++) for (let j = 0; j < n; j++) if (m[i][j]) dark++;
+    score += Math.floor(Math.abs(dark * 20 - n * n * 10) / (n * n)) * 10;
+    return score;
+  }
+
+  function encode(text, forceMask) {
+    const bytes = utf8(text);
+    let version = 1, data = null;
+    for (; version <= 40; version++) {
+      data = codewords(bytes, version);
+      if (data) break;
+    }
+    if (!data) throw new Error('QR: text prea lung');
+
+    const build = (mask) => {
+      const m = baseMatrix(version);
+      placeFormat(m, mask);
+      placeVersion(m, version);
+      placeData(m, data, mask);
+      return m;
+    };
+    let best = null, bestScore = Infinity;
+    const masks = forceMask === undefined ? [0,1,2,3,4,5,6,7] : [forceMask];
+    for (const mask of masks) {
+      const m = build(mask);
+      const s = masks.length > 1 ? penalty(m) : 0;
+      if (s < bestScore) { best = m; bestScore = s; }
+    }
+    return { size: best.length, modules: best };
+  }
+
+  function toSVG(text) {
+    const { size, modules } = encode(text);
+    const q = 4, dim = size + 2 * q;
+    let d = '';
+    for (let r = 0; r < size; r++) for (let c = 0; c < size; c++) {
+      if (modules[r][c]) d += `M${c + q} ${r + q}h1v1h-1z`;
+    }
+    return `<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 ${dim} ${dim}" shape-rendering="crispEdges">` +
+           `<rect width="${dim}" height="${dim}" fill="#fff"/><path d="${d}" fill="#000"/></svg>`;
+  }
+
+  global.SalaQR = { encode, toSVG };
+})(typeof window !== 'undefined' ? window : globalThis);